@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Response decoding benchmark
+
+Compare decoding large responses with `json.loads` followed by `_byteify`
+(the default of `ServerProxy`) against the single pass decoding enabled by
+`ServerProxy(single_pass_decode=True)`, in time per response and in peak
+memory growth of a forked child decoding the response once. Both decoders
+are checked to return the same result before timing.
+
+Usage::
+
+    python benchmarks/bench_decode.py [REPEAT]
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import os
+import resource
+import sys
+import time
+
+from qt4x.codec import JSON_CODEC
+from qt4x.jsonrpc import _byteify
+
+def make_response( result ):
+    return json.dumps({"jsonrpc": "2.0", "result": result, "id": "abcdefgh"})
+
+def make_tree( depth, fanout, counter=[0] ):
+    counter[0] += 1
+    node = [counter[0], "QWidget", {"name": "control_%s" % counter[0], "text": "文本 %s" % counter[0], "visible": "true"}]
+    if depth > 0:
+        node.append([ make_tree(depth - 1, fanout) for _ in range(fanout) ])
+    return node
+
+PAYLOADS = [
+    ("child list", make_response(list(range(100000)))),
+    ("long text values", make_response([ "text value %s " % i * 20 for i in range(5000) ])),
+    ("dumped window tree", make_response({"version": 1, "root": make_tree(4, 8)})),
+]
+
+DECODERS = [
+    ("json.loads + _byteify", lambda data: _byteify(json.loads(data), "utf8")),
+    ("single pass", lambda data: JSON_CODEC.loads(data, "utf8")),
+]
+
+def measure_time( decode, data, repeat ):
+    '''return seconds per decoding
+    '''
+    t0 = time.time()
+    for _ in range(repeat):
+        decode(data)
+    return (time.time() - t0) / repeat
+
+def measure_memory( decode, data ):
+    '''return peak memory growth in KB of a child process decoding data once
+    '''
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        decode(data)
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write_fd, str(after - before).encode("utf8"))
+        os._exit(0)
+    os.close(write_fd)
+    result = os.read(read_fd, 64)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return int(result)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for payload_name, data in PAYLOADS:
+        expected = DECODERS[0][1](data)
+        print("%s (%d bytes):" % (payload_name, len(data)))
+        for name, decode in DECODERS:
+            if decode(data) != expected:
+                raise RuntimeError("%s decodes a different result" % name)
+            print("  %-24s %8.2f ms %8d KB" % (name, measure_time(decode, data, repeat) * 1000, measure_memory(decode, data)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Microbenchmark suite
+
+Groups of benchmarks:
+
+* transport: round trip latency and throughput of a trivial call over
+  HTTP, framed TCP (per codec) and UDP, sequential and from several threads
+* stub: `find_controls_by_name`, `find_controls` and `get_control` of the
+  test stub called in process, on trees of growing size
+* resolve: `Window` and `Control` resolution against the demo app
+
+Results are printed as a table, and written as JSON with `--json` so that
+runs can be compared with `--compare`::
+
+    python benchmarks/bench_suite.py --json base.json
+    python benchmarks/bench_suite.py --compare base.json
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from qt4x.codec import JSON_CODEC, MARSHAL_CODEC
+from qt4x.jsonrpc import (ServerProxy, HTTPTransport, TCPTransport, SimpleJSONRPCServer,
+                          TCPJsonRPCServer, UDPJsonRPCServer, FRAME_HEADER, _build_request)
+from qt4x.qpath import QPath
+from qt4x_sut.app import WindowManager
+from qt4x_sut.layoutgen import generate_layout
+from qt4x_sut.stub import StubService
+
+def measure( func, repeat ):
+    '''call func repeatedly, return latency statistics
+    '''
+    func()
+    samples = []
+    t_start = time.time()
+    for _ in range(repeat):
+        t0 = time.time()
+        func()
+        samples.append(time.time() - t0)
+    elapsed = time.time() - t_start
+    samples.sort()
+    return {"mean_us": elapsed / repeat * 1e6,
+            "p50_us": samples[len(samples) // 2] * 1e6,
+            "p99_us": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1e6,
+            "ops_per_sec": repeat / elapsed}
+
+def measure_threads( make_func, threads, repeat ):
+    '''call functions made by make_func from several threads, return total throughput
+    '''
+    funcs = [ make_func() for _ in range(threads) ]
+    for func in funcs:
+        func()
+    def _run( func ):
+        for _ in range(repeat):
+            func()
+    workers = [ threading.Thread(target=_run, args=(func,)) for func in funcs ]
+    t0 = time.time()
+    for it in workers:
+        it.start()
+    for it in workers:
+        it.join()
+    return {"ops_per_sec": threads * repeat / (time.time() - t0)}
+
+class UDPClient(object):
+    '''minimal client of UDPJsonRPCServer, sending JSON codec frames
+    '''
+    def __init__(self, addr ):
+        self._addr = addr
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.settimeout(5)
+
+    def call(self, methodname, *params ):
+        data = JSON_CODEC.codec_id + JSON_CODEC.dumps(_build_request(methodname, list(params)))
+        self._sock.sendto(FRAME_HEADER.pack(len(data) + FRAME_HEADER.size) + data, self._addr)
+        frame = self._sock.recv(65536)
+        return JSON_CODEC.loads(frame[FRAME_HEADER.size + 1:])["result"]
+
+def start_server( server ):
+    server.register_function(lambda: "hello", "hello")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(1)
+    thread.start()
+    return server
+
+def bench_transport( args, record ):
+    http_server = start_server(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False))
+    tcp_server = start_server(TCPJsonRPCServer(("127.0.0.1", 0), allow_marshal=True))
+    udp_server = start_server(UDPJsonRPCServer(("127.0.0.1", 0)))
+    http_uri = "http://127.0.0.1:%s" % http_server.server_address[1]
+    tcp_uri = "tcp://127.0.0.1:%s" % tcp_server.server_address[1]
+    clients = [("http", lambda: ServerProxy(http_uri, HTTPTransport()).hello),
+               ("tcp-json", lambda: ServerProxy(tcp_uri, TCPTransport(codecs=("json",))).hello),
+               ("tcp-marshal", lambda: ServerProxy(tcp_uri, TCPTransport(codecs=(MARSHAL_CODEC,))).hello),
+               ("udp", lambda: (lambda client: lambda: client.call("hello"))(UDPClient(udp_server.server_address)))]
+    for name, make_func in clients:
+        record("transport", name, {"threads": 1}, measure(make_func(), args.repeat))
+        record("transport", name, {"threads": args.threads}, measure_threads(make_func, args.threads, args.repeat // args.threads))
+
+def bench_stub( args, record ):
+    for size in args.sizes:
+        wndmgr = WindowManager()
+        wndmgr.register_window("Main", generate_layout(depth=size, fanout=10, max_elements=size))
+        stub = StubService(None, wndmgr)
+        root_id = stub.get_window_by_name("Main")
+        last_name = "c%s" % (size - 1)
+        qpath = QPath("/name='%s' && maxdepth=100" % last_name).selectors
+        class_qpath = QPath("/class='Button' && maxdepth=100").selectors
+        control_id = stub.find_controls_by_name(root_id, last_name)[0]
+        repeat = max(args.repeat * 100 // size, 10)
+        params = {"size": size}
+        record("stub", "find_controls_by_name", params, measure(lambda: stub.find_controls_by_name(root_id, last_name), repeat))
+        record("stub", "find_controls name=", params, measure(lambda: stub.find_controls(root_id, qpath), repeat))
+        record("stub", "find_controls class=", params, measure(lambda: stub.find_controls(root_id, class_qpath), repeat))
+        record("stub", "get_control", params, measure(lambda: wndmgr.get_control(control_id), args.repeat))
+
+def bench_resolve( args, record ):
+    from qt4x.app import App
+    from qt4x.controls import Window, Control
+
+    class DemoApp(App):
+        ENTRY = "qt4x_sut.demo"
+
+    locators = {
+        "About Button": "about_btn",
+        "Menu Bar": {"type": Control, "locator": QPath("/class='MenuBar'")},
+        "About Button in Menu": {"type": Control, "root": "@Menu Bar", "locator": "about_btn"},
+    }
+
+    class MainWindow(Window):
+        NAME = "Main"
+
+    app = DemoApp()
+    try:
+        window = MainWindow(app)
+        repeat = args.repeat // 4
+        record("resolve", "Window.id", {}, measure(lambda: MainWindow(app).id, repeat))
+        window.update_locator(locators)
+        for key in sorted(locators):
+            def _resolve():
+                window.update_locator({}) #drop cached controls
+                return window.controls[key].id
+            record("resolve", "controls[%s].id" % key, {}, measure(_resolve, repeat))
+            record("resolve", "controls[%s].id cached" % key, {}, measure(lambda: window.controls[key].id, repeat))
+    finally:
+        app.kill()
+
+GROUPS = [("transport", bench_transport), ("stub", bench_stub), ("resolve", bench_resolve)]
+
+def get_meta():
+    meta = {"python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    try:
+        meta["commit"] = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                                 stderr=subprocess.STDOUT).strip().decode("utf8")
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return meta
+
+def result_key( result ):
+    return "%s/%s%s" % (result["group"], result["name"],
+                        "".join("[%s=%s]" % it for it in sorted(result["params"].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="qt4x microbenchmarks")
+    parser.add_argument("--repeat", type=int, default=2000, help="calls per benchmark")
+    parser.add_argument("--threads", type=int, default=4, help="client threads of throughput benchmarks")
+    parser.add_argument("--sizes", default="100,1000,10000", help="tree sizes of stub benchmarks")
+    parser.add_argument("--only", action="append", choices=[ it[0] for it in GROUPS ], help="groups to run")
+    parser.add_argument("--json", help="write results to file")
+    parser.add_argument("--compare", help="compare with results written by a previous run")
+    args = parser.parse_args()
+    args.sizes = [ int(it) for it in args.sizes.split(",") ]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "rb") as fd:
+            baseline = dict((result_key(it), it) for it in json.load(fd)["results"])
+
+    results = []
+    def record( group, name, params, stats ):
+        result = {"group": group, "name": name, "params": params}
+        result.update(stats)
+        results.append(result)
+        key = result_key(result)
+        line = "%-60s" % key
+        if "mean_us" in stats:
+            line += " %10.1f us %10.1f us p99" % (stats["mean_us"], stats["p99_us"])
+        else:
+            line += " %27s" % ""
+        line += " %12.1f ops/s" % stats["ops_per_sec"]
+        if key in baseline:
+            line += "  x%.2f" % (stats["ops_per_sec"] / baseline[key]["ops_per_sec"])
+        print(line)
+        sys.stdout.flush()
+
+    for name, func in GROUPS:
+        if not args.only or name in args.only:
+            func(args, record)
+
+    if args.json:
+        with open(args.json, "wb") as fd:
+            json.dump({"meta": get_meta(), "results": results}, fd, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
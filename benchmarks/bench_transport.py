@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Transport benchmark
+
+Compare calls per second of the keep-alive `HTTPTransport` and the framed
+`TCPTransport`, over loopback TCP and unix domain sockets, against one HTTP
+connection per call (the behavior of the former urllib2 based transport), then
+compare the codecs of the framed transport with a tree sized result.
+
+Usage::
+
+    python benchmarks/bench_transport.py [CALLS]
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib2
+
+from qt4x.codec import MARSHAL_CODEC
+from qt4x.jsonrpc import ServerProxy, HTTPTransport, TCPTransport, SimpleJSONRPCServer, TCPJsonRPCServer
+
+class OneShotHTTPTransport(object):
+    '''open a new connection for every request
+    '''
+    def __init__(self):
+        self._timeout = None
+        self._opener = urllib2.build_opener(urllib2.ProxyHandler({}))
+
+    def close(self):
+        self._opener.close()
+
+    def settimeout(self, timeout ):
+        self._timeout = timeout
+
+    def request(self, uri, request ):
+        req = urllib2.Request(uri, request, {"Content-Type": "application/json-rpc"})
+        return self._opener.open(req, timeout=self._timeout).read()
+
+#result like a dumped control tree
+LARGE_RESULT = [ [i, "QWidget", {"name": "control_%s" % i, "text": "text %s" % i, "visible": "true"}] for i in range(1000) ]
+
+def start_server( server_class, scheme, socket_path=None, **kwargs ):
+    '''start a JSON-RPC server in background thread, return its URI
+    '''
+    server = server_class(socket_path or ("127.0.0.1", 0), logRequests=False, **kwargs)
+    server.register_function(lambda: "hello", "hello")
+    server.register_function(lambda: LARGE_RESULT, "dump")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(1)
+    thread.start()
+    if socket_path:
+        return server, "unix://%s" % socket_path
+    return server, "%s://127.0.0.1:%s" % (scheme, server.server_address[1])
+
+def measure(uri, transport, calls, method="hello" ):
+    '''return calls per second
+    '''
+    proxy = ServerProxy(uri, transport)
+    func = getattr(proxy, method)
+    func()
+    t0 = time.time()
+    for _ in range(calls):
+        func()
+    elapsed = time.time() - t0
+    proxy("close")()
+    return calls / elapsed
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    socket_dir = tempfile.mkdtemp(prefix="qt4x_bench_")
+    servers = []
+    try:
+        http_server, http_uri = start_server(SimpleJSONRPCServer, "http")
+        tcp_server, tcp_uri = start_server(TCPJsonRPCServer, "tcp", allow_marshal=True)
+        http_unix_server, http_unix_uri = start_server(SimpleJSONRPCServer, "http", os.path.join(socket_dir, "http.sock"))
+        tcp_unix_server, tcp_unix_uri = start_server(TCPJsonRPCServer, "tcp", os.path.join(socket_dir, "tcp.sock"))
+        servers = [http_server, tcp_server, http_unix_server, tcp_unix_server]
+        for name, uri, transport in [("one connection per call", http_uri, OneShotHTTPTransport()),
+                                     ("HTTP keep-alive", http_uri, HTTPTransport()),
+                                     ("TCP framed", tcp_uri, TCPTransport()),
+                                     ("HTTP unix socket", http_unix_uri, HTTPTransport()),
+                                     ("TCP framed unix socket", tcp_unix_uri, TCPTransport())]:
+            print("%-24s %10.1f calls/s" % (name, measure(uri, transport, calls)))
+        print("\nresult of %s nodes:" % len(LARGE_RESULT))
+        for name, transport in [("TCP framed legacy", TCPTransport(codecs=())),
+                                ("TCP framed json", TCPTransport(codecs=("json",))),
+                                ("TCP framed marshal", TCPTransport(codecs=(MARSHAL_CODEC,)))]:
+            print("%-24s %10.1f calls/s" % (name, measure(tcp_uri, transport, calls // 20, "dump")))
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -15,24 +15,139 @@
 '''Application
 '''
 
+import atexit
+import errno
+import fcntl
+import httplib
+import os
+import select
+import shutil
+import socket
 import subprocess
+import tempfile
+import threading
+import time
 from testbase.retry import Retry
-from qt4x.jsonrpc import ServerProxy
+from qt4x.jsonrpc import ServerProxy, ProtocolError
+from qt4x.controls import get_attr_cache, long_poll
+from qt4x.mirror import UIMirror
+from qt4x.rpcstats import STATS_ENV
+from qt4x.rpctrace import TRACE_ENV
+
+#environment variable passing the fd of the readiness pipe to app process, same as qt4x_sut.app
+READY_FD_ENV = "QT4X_READY_FD"
+
+#environment variable passing launcher pid to app process, app exits when launcher exits
+LAUNCHER_PID_ENV = "QT4X_LAUNCHER_PID"
+
+def _set_cloexec( fd, cloexec=True ):
+    '''set or clear close-on-exec flag of fd
+    '''
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    if cloexec:
+        flags |= fcntl.FD_CLOEXEC
+    else:
+        flags &= ~fcntl.FD_CLOEXEC
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags)
 
 class App(object):
     '''Application
     '''
     
     ENTRY = None
+    
+    #extra command line arguments of app process, after the listening address
+    ARGS = ()
+    
+    #test stub listening port, app binds an ephemeral port if not set
     PORT = None
     
+    #listen on a unix domain socket instead of PORT, the socket path is unique for each instance
+    UNIX_SOCKET = False
+    
+    #max seconds to wait for app process reporting its test stub is ready
+    READY_TIMEOUT = 5
+    
+    #max seconds to wait for app creating its initial windows after test stub is ready,
+    #windows of large layouts take a while to generate and register
+    CREATE_TIMEOUT = 120
+    
+    #max seconds to wait for app finishing reset, the reset is a single call so it must
+    #be below the timeout of driver calls
+    RESET_TIMEOUT = 5
+    
     _instances = []
     
+    #held while a readiness pipe is inheritable, so apps launched concurrently do not inherit it
+    _launch_lock = threading.Lock()
+    
     def __init__(self):
         self._driver = None
-        self._p = subprocess.Popen(["python", "-m", self.ENTRY, str(self.PORT)])
+        self._mirror = None
+        self._socket_dir = None
+        if self.UNIX_SOCKET:
+            self._socket_dir = tempfile.mkdtemp(prefix="qt4x_")
+            self._address = os.path.join(self._socket_dir, "sut.sock")
+        elif self.PORT is None:
+            self._address = "0"
+        else:
+            self._address = str(self.PORT)
+        with self._launch_lock:
+            read_fd, write_fd = os.pipe()
+            _set_cloexec(read_fd)
+            _set_cloexec(write_fd)
+            env = dict(os.environ)
+            env[READY_FD_ENV] = str(write_fd)
+            env[LAUNCHER_PID_ENV] = str(os.getpid())
+            for name in (STATS_ENV, TRACE_ENV):
+                #app process would write the same file, unless the path is made unique by {pid}
+                if name in env and "{pid}" not in env[name]:
+                    del env[name]
+            try:
+                #close_fds would also close the write end, which is the only fd the app process inherits
+                self._p = subprocess.Popen(["python", "-m", self.ENTRY, self._address] + list(self.ARGS), env=env,
+                                           preexec_fn=lambda: _set_cloexec(write_fd, False))
+            except:
+                os.close(read_fd)
+                raise
+            finally:
+                os.close(write_fd)
         self._instances.append(self)
-        self._wait_driver_ready()
+        try:
+            address = self._wait_ready_signal(read_fd)
+        finally:
+            os.close(read_fd)
+        if address:
+            self._address = address
+        elif self._address == "0" or not self.alive:
+            raise RuntimeError("app %s exited or is not ready in %s seconds" % (self.ENTRY, self.READY_TIMEOUT))
+        else: #app does not support readiness signal
+            self._wait_driver_ready()
+        self._wait_created()
+
+    def _wait_ready_signal(self, read_fd ):
+        '''wait for app process writing its listening address to the readiness pipe
+        
+        :returns: listening address, or None if pipe is closed or timed out
+        '''
+        deadline = time.time() + self.READY_TIMEOUT
+        data = b""
+        while b"\n" not in data:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                readable, _, _ = select.select([read_fd], [], [], remaining)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if readable:
+                chunk = os.read(read_fd, 4096)
+                if not chunk: #app exited or closed pipe without reporting
+                    return None
+                data += chunk
+        return data.split(b"\n", 1)[0].strip().decode("utf8")
 
     def _wait_driver_ready(self):
         for _ in Retry(timeout=5):
@@ -40,29 +155,188 @@ class App(object):
                 driver = self.get_driver()
                 driver.hello()
                 break
-            except:
+            except (socket.error, httplib.HTTPException, ProtocolError): #test stub is not listening yet
                 pass
         
+    def _wait_created(self):
+        '''wait for app returning from `on_created`, apps without the test stub method are created when ready
+        '''
+        if not long_poll(self.get_driver(), "wait_created", self.CREATE_TIMEOUT):
+            raise RuntimeError("app %s is not created in %s seconds" % (self.ENTRY, self.CREATE_TIMEOUT))
+        
     @property
     def pid(self):
         return self._p.pid
     
+    @property
+    def address(self):
+        '''test stub listening port, or unix domain socket path
+        '''
+        return self._address
+    
+    @property
+    def alive(self):
+        '''whether app process is running
+        '''
+        return self._p.poll() is None
+    
+    def reset(self):
+        '''reset app to its initial state
+        
+        :raises RuntimeError: app does not finish reset
+        '''
+        driver = self.get_driver()
+        version = driver.reset_app(self.RESET_TIMEOUT)
+        get_attr_cache(driver).invalidate() #all controls are expired
+        if self._mirror is not None:
+            get_attr_cache(self._mirror).invalidate()
+            self._mirror.invalidate()
+        if version is None:
+            raise RuntimeError("app %s failed to reset" % self.pid)
+        
+    @classmethod
+    def lease(cls):
+        '''lease an app instance from the pool of this app class, the instance
+        is returned to the pool by `kill_all` at the end of test
+        '''
+        return AppPool.get_pool(cls).acquire()
+    
     def get_driver(self):
         if self._driver is None:
-            self._driver = ServerProxy("http://127.0.0.1:%s" % self.PORT)
+            if self._socket_dir:
+                self._driver = ServerProxy("unix://%s" % self._address)
+            else:
+                self._driver = ServerProxy("http://127.0.0.1:%s" % self._address)
         return self._driver
     
+    def get_mirror(self):
+        '''get UI mirror of all windows, see `qt4x.mirror.UIMirror`
+        '''
+        if self._mirror is None:
+            self._mirror = UIMirror(self.get_driver())
+        return self._mirror
+    
+    def _remove_socket_dir(self):
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            
     def stop(self):
         self._p.terminate()
+        self._remove_socket_dir()
         
     def kill(self):
-        self._p.kill()
+        if self.alive:
+            self._p.kill()
+        self._remove_socket_dir()
     
     @classmethod
     def kill_all(cls):
+        '''kill all app instances, instances leased from pools are returned to their pools instead
+        '''
+        AppPool.release_all()
         for it in cls._instances:
             it.kill()
         
+class AppPool(object):
+    '''Pool of warm app instances of an app class
+    
+    Returned instances are kept running and reset by the test stub before
+    they are leased again, so process startup is paid once per instance
+    instead of once per test. Instances of apps listening on a fixed `PORT`
+    can not run at the same time, leave `PORT` unset or use `UNIX_SOCKET`
+    for more than one.
+    '''
+    _pools = {}
+    _pools_lock = threading.Lock()
+    
+    def __init__(self, app_cls, max_idle=1 ):
+        '''constructor
+        
+        :param app_cls: app class
+        :param max_idle: max number of idle instances kept running
+        '''
+        self._app_cls = app_cls
+        self._max_idle = max_idle
+        self._idle = []
+        self._leased = []
+        self._lock = threading.Lock()
+        
+    @classmethod
+    def get_pool(cls, app_cls ):
+        '''get the pool of app class, create one if not exist
+        '''
+        with cls._pools_lock:
+            pool = cls._pools.get(app_cls)
+            if pool is None:
+                pool = cls._pools[app_cls] = cls(app_cls)
+            return pool
+        
+    def acquire(self):
+        '''lease an app instance, reuse an idle one if any
+        '''
+        while 1:
+            with self._lock:
+                app = self._idle.pop() if self._idle else None
+            if app is None:
+                app = self._app_cls()
+                App._instances.remove(app) #not killed by kill_all
+                break
+            try:
+                if app.alive:
+                    app.reset()
+                    break
+            except Exception:
+                pass
+            app.kill()
+        with self._lock:
+            self._leased.append(app)
+        return app
+    
+    def release(self, app ):
+        '''return a leased app instance
+        '''
+        with self._lock:
+            self._leased.remove(app)
+            if app.alive and len(self._idle) < self._max_idle:
+                self._idle.append(app)
+                return
+        app.kill()
+        
+    def _release_all(self):
+        with self._lock:
+            leased = list(self._leased)
+        for app in leased:
+            self.release(app)
+            
+    def close(self):
+        '''kill all app instances of the pool
+        '''
+        with self._lock:
+            apps = self._idle + self._leased
+            self._idle, self._leased = [], []
+        for app in apps:
+            app.kill()
+            
+    @classmethod
+    def release_all(cls):
+        '''return all leased app instances to their pools
+        '''
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+        for pool in pools:
+            pool._release_all()
+            
+    @classmethod
+    def close_all(cls):
+        '''kill app instances of all pools
+        '''
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+        for pool in pools:
+            pool.close()
+            
+atexit.register(AppPool.close_all)
+        
 if __name__ == '__main__':
     app = App()
     print(app.pid)
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''基于事件循环的异步JSON-RPC 2.0客户端
+
+一个EventLoop在单个线程中驱动任意多个AsyncServerProxy，每个调用立即返回RPCFuture，
+请求通过HTTP/1.1长连接以流水线方式发送::
+
+    loop = EventLoop()
+    drivers = [ AsyncServerProxy("http://127.0.0.1:%s" % port, loop) for port in ports ]
+    futures = [ driver.hello() for driver in drivers ]
+    loop.run_until_complete(futures)
+    print([ it.result() for it in futures ])
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import asyncore
+import collections
+import errno
+import json
+import select
+import socket
+import sys
+import time
+import urlparse
+
+from qt4x.jsonrpc import ProtocolError, _Method, _build_request, _parse_response, _byteify
+
+class RPCFuture(object):
+    '''异步调用的结果
+    '''
+    def __init__(self, loop, deadline=None):
+        self._loop = loop
+        self._deadline = deadline
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    @property
+    def deadline(self):
+        '''超时的时间点，为None表示不超时
+        '''
+        return self._deadline
+
+    def done(self):
+        '''调用是否已经完成
+        '''
+        return self._done
+
+    def set_result(self, result ):
+        '''设置调用结果
+        '''
+        self._result = result
+        self._set_done()
+
+    def set_exception(self, exception ):
+        '''设置调用异常
+        '''
+        self._exception = exception
+        self._set_done()
+
+    def _set_done(self):
+        if self._done:
+            raise RuntimeError("future is already done")
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback ):
+        '''注册调用完成时的回调，回调的参数为该对象
+        '''
+        if self._done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def exception(self, timeout=None ):
+        '''等待调用完成，返回调用异常，调用成功则返回None
+
+        :param timeout: 最多等待的时间，为None表示一直等待到调用完成或者超时
+        :type timeout: float
+        :raises socket.timeout: 等待timeout后调用仍未完成
+        '''
+        if not self._done:
+            self._loop.run_until_complete([self], timeout)
+            if not self._done:
+                raise socket.timeout("call is not done in %s seconds" % timeout)
+        return self._exception
+
+    def result(self, timeout=None ):
+        '''等待调用完成，返回调用结果或抛出调用异常
+
+        :param timeout: 最多等待的时间，为None表示一直等待到调用完成或者超时
+        :type timeout: float
+        :raises socket.timeout: 等待timeout后调用仍未完成
+        '''
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+class EventLoop(object):
+    '''驱动异步连接的事件循环，不是线程安全的，只能在一个线程中使用
+    '''
+    def __init__(self, poll_interval=0.05):
+        '''构造函数
+
+        :param poll_interval: 每次等待IO事件的最长时间
+        :type poll_interval: float
+        '''
+        self._map = {}
+        self._poll_interval = poll_interval
+        if hasattr(select, "poll"):
+            self._poll = asyncore.poll2
+        else:
+            self._poll = asyncore.poll
+
+    @property
+    def socket_map(self):
+        '''asyncore的socket映射表
+        '''
+        return self._map
+
+    def run_once(self, timeout=None ):
+        '''处理一轮IO事件和超时
+
+        :param timeout: 等待IO事件的最长时间，默认为poll_interval
+        :type timeout: float
+        '''
+        if timeout is None:
+            timeout = self._poll_interval
+        if self._map:
+            self._poll(timeout, self._map)
+        else:
+            time.sleep(timeout)
+        now = time.time()
+        for conn in list(self._map.values()):
+            conn.check_timeout(now)
+
+    def run_until_complete(self, futures, timeout=None ):
+        '''运行事件循环直到全部调用完成
+
+        :param futures: 调用列表
+        :type futures: list<RPCFuture>
+        :param timeout: 最长运行时间，为None表示一直运行到全部调用完成
+        :type timeout: float
+        :returns: bool - 是否全部调用都已完成
+        '''
+        if timeout is not None:
+            deadline = time.time() + timeout
+        pending = [ it for it in futures if not it.done() ]
+        while pending:
+            wait_time = self._poll_interval
+            if timeout is not None:
+                wait_time = min(wait_time, deadline - time.time())
+                if wait_time <= 0:
+                    return False
+            self.run_once(wait_time)
+            pending = [ it for it in pending if not it.done() ]
+        return True
+
+    def close(self):
+        '''关闭全部连接
+        '''
+        for conn in list(self._map.values()):
+            conn.close()
+
+class _AsyncHTTPConnection(asyncore.dispatcher):
+    '''流水线方式发送请求的HTTP/1.1长连接
+
+    应答按照请求的顺序返回，请求超时或者连接断开时，连接上全部未完成的调用都失败
+    '''
+    def __init__(self, loop, host, port ):
+        asyncore.dispatcher.__init__(self, map=loop.socket_map)
+        self._outbuf = bytearray()
+        self._inbuf = bytearray()
+        self._pending = collections.deque()
+        self._content_length = None
+        self._status = None
+        self._will_close = False
+        self.closed = False
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connect((host, port))
+
+    @property
+    def pending_count(self):
+        '''未完成的调用数
+        '''
+        return len(self._pending)
+
+    def send_request(self, data, future ):
+        '''发送请求，应答解析后通过future返回
+
+        :param data: 完整的HTTP请求
+        :type data: string
+        :param future: 调用结果
+        :type future: RPCFuture
+        '''
+        self._outbuf += data
+        self._pending.append(future)
+
+    def writable(self):
+        return not self.connected or len(self._outbuf) > 0
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(bytes(self._outbuf[:65536]))
+        del self._outbuf[:sent]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self._inbuf += data
+            self._parse_responses()
+
+    def _parse_responses(self):
+        '''解析缓冲区中全部完整的应答
+        '''
+        while self._pending:
+            if self._content_length is None:
+                pos = self._inbuf.find(b"\r\n\r\n")
+                if pos < 0:
+                    return
+                self._parse_headers(bytes(self._inbuf[:pos]))
+                del self._inbuf[:pos + 4]
+            if len(self._inbuf) < self._content_length:
+                return
+            body = bytes(self._inbuf[:self._content_length])
+            del self._inbuf[:self._content_length]
+            status, self._status = self._status, None
+            self._content_length = None
+            future = self._pending.popleft()
+            if status != 200:
+                future.set_exception(ProtocolError("HTTP Error %s" % status))
+            else:
+                future.set_result(body)
+            if self._will_close:
+                self.handle_close()
+                return
+
+    def _parse_headers(self, data ):
+        lines = data.split(b"\r\n")
+        parts = lines[0].split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise ProtocolError("bad status line: %r" % lines[0])
+        self._status = int(parts[1])
+        self._content_length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                self._content_length = int(value.strip())
+            elif name == b"connection" and value.strip().lower() == b"close":
+                self._will_close = True
+
+    def check_timeout(self, now ):
+        '''检查队首调用是否超时，超时则关闭连接
+        '''
+        if self._pending:
+            deadline = self._pending[0].deadline
+            if deadline is not None and deadline < now:
+                self._fail_all(socket.timeout("timed out"))
+
+    def _fail_all(self, exception ):
+        '''关闭连接，全部未完成的调用都以异常结束
+        '''
+        self.close()
+        pending, self._pending = self._pending, collections.deque()
+        for future in pending:
+            future.set_exception(exception)
+
+    def handle_close(self):
+        self._fail_all(socket.error(errno.ECONNRESET, "connection closed by server"))
+
+    def handle_error(self):
+        _, exception, _ = sys.exc_info()
+        self._fail_all(exception)
+
+    def close(self):
+        self.closed = True
+        asyncore.dispatcher.close(self)
+
+class AsyncServerProxy(object):
+    '''和JSON-RPC服务器的异步逻辑连接，调用立即返回RPCFuture
+    '''
+    def __init__(self, uri, loop, encoding="utf8", timeout=10, max_connections=2):
+        '''构造函数
+
+        :param uri: RPC URL
+        :type uri: string
+        :param loop: 驱动连接的事件循环
+        :type loop: EventLoop
+        :param encoding: 编码方式，默认为unicode
+        :type encoding: string
+        :param timeout: RPC请求超时时间
+        :type timeout: int
+        :param max_connections: 到服务器的最大并发连接数
+        :type max_connections: int
+        '''
+        result = urlparse.urlsplit(uri)
+        if result.scheme != "http":
+            raise ProtocolError("unsupported scheme \"%s\"" % result.scheme)
+        self.__uri = uri
+        self.__host = result.hostname
+        self.__port = result.port or 80
+        self.__netloc = result.netloc.encode("utf8")
+        self.__path = (result.path or "/").encode("utf8")
+        self.__loop = loop
+        self.__encoding = encoding
+        self.__timeout = timeout
+        self.__max_connections = max_connections
+        self.__conns = []
+
+    def __close(self):
+        '''close connections to remote server
+        '''
+        for conn in self.__conns:
+            conn.close()
+        self.__conns = []
+
+    def __get_connection(self):
+        '''选择未完成调用最少的连接，都忙时新建连接
+        '''
+        self.__conns = [ it for it in self.__conns if not it.closed ]
+        conn = None
+        if self.__conns:
+            conn = min(self.__conns, key=lambda it: it.pending_count)
+        if conn is None or (conn.pending_count > 0 and len(self.__conns) < self.__max_connections):
+            conn = _AsyncHTTPConnection(self.__loop, self.__host, self.__port)
+            self.__conns.append(conn)
+        return conn
+
+    def __request(self, methodname, params ):
+        '''call a method on the remote server asynchronously
+        '''
+        body = json.dumps(_build_request(methodname, params))
+        data = (b"POST " + self.__path + b" HTTP/1.1\r\n" +
+                b"Host: " + self.__netloc + b"\r\n" +
+                b"Content-Type: application/json-rpc\r\n" +
+                b"Content-Length: " + str(len(body)).encode("utf8") + b"\r\n\r\n" +
+                body)
+        deadline = None
+        if self.__timeout is not None:
+            deadline = time.time() + self.__timeout
+        transport_future = RPCFuture(self.__loop, deadline)
+        future = RPCFuture(self.__loop)
+
+        def _on_response( it ):
+            exception = it.exception()
+            if exception is not None:
+                future.set_exception(exception)
+                return
+            try:
+                response = json.loads(it.result())
+                if self.__encoding:
+                    response = _byteify(response, self.__encoding)
+                if not isinstance(response, dict):
+                    raise ProtocolError('Response is not a dict.')
+                result = _parse_response(response)
+            except Exception, e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        transport_future.add_done_callback(_on_response)
+        self.__get_connection().send_request(data, transport_future)
+        return future
+
+    def __repr__(self):
+        return "<AsyncServerProxy for %s>" % self.__uri
+
+    __str__ = __repr__
+
+    def __getattr__(self, name):
+        '''magic method dispatcher
+        '''
+        return _Method(self.__request, name)
+
+    def __call__(self, attr):
+        '''A workaround to get special attributes on the AsyncServerProxy
+           without interfering with the magic __getattr__
+        '''
+        if attr == "close":
+            return self.__close
+        elif attr == "loop":
+            return self.__loop
+        raise AttributeError("Attribute %r not found" % (attr,))
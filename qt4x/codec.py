@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''JSON-RPC载荷的编解码器
+
+编解码器把请求包、应答包等结构序列化为字节串。JSON为默认编解码器，其它编解码器用于分帧的
+TCP/UDP传输，通过编解码器ID（帧数据的第一个字节）区分，由客户端和服务器协商选择。
+
+marshal不能安全地解码不可信的数据，不注册为默认的编解码器，只有服务器显式开启
+（TCPJsonRPCServer的allow_marshal参数）且客户端指定MARSHAL_CODEC时才会使用
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import marshal
+
+def _encode_list( items, encoding ):
+    '''原地把列表中的unicode字符串转成对应的编码，字典元素已经转换过，不再处理
+    '''
+    for i, item in enumerate(items):
+        if isinstance(item, unicode):
+            items[i] = item.encode(encoding)
+        elif isinstance(item, list):
+            _encode_list(item, encoding)
+    return items
+
+def _make_pairs_hook( encoding ):
+    '''返回JSON对象的构造函数，构造时把键和值中的unicode字符串转成对应的编码
+    '''
+    def _pairs_hook( pairs ):
+        obj = {}
+        for key, value in pairs:
+            if isinstance(value, unicode):
+                value = value.encode(encoding)
+            elif isinstance(value, list):
+                _encode_list(value, encoding)
+            obj[key.encode(encoding)] = value
+        return obj
+    return _pairs_hook
+
+def _encode_all( data, encoding ):
+    '''把结构中的unicode字符串都转成对应的编码，元组转成列表
+    '''
+    if isinstance(data, dict):
+        return dict((_encode_all(key, encoding), _encode_all(value, encoding)) for key, value in data.iteritems())
+    elif isinstance(data, (list, tuple)):
+        return [ _encode_all(element, encoding) for element in data ]
+    elif isinstance(data, unicode):
+        return data.encode(encoding)
+    else:
+        return data
+
+class JSONCodec(object):
+    '''标准库JSON编解码器
+    '''
+    name = "json"
+    codec_id = b"\x01"
+
+    #解码得到的字符串是否都为unicode
+    unicode_strings = True
+
+    def __init__(self):
+        self._decoders = {} #编码 -> 在解析过程中转换字符串编码的解码器
+
+    def dumps(self, obj ):
+        '''序列化
+
+        :raises TypeError: 包含不能序列化的对象
+        '''
+        return json.dumps(obj)
+
+    def loads(self, data, encoding=None ):
+        '''反序列化
+
+        :param encoding: 字符串的编码，为None时字符串为unicode；指定时在解析过程中完成转换，
+                         不需要再遍历一次结果
+        :raises ValueError: 数据格式错误
+        '''
+        if not encoding:
+            return json.loads(data)
+        decoder = self._decoders.get(encoding)
+        if decoder is None:
+            decoder = json.JSONDecoder(object_pairs_hook=_make_pairs_hook(encoding))
+            self._decoders[encoding] = decoder
+        result = decoder.decode(data)
+        #对象已经在构造时转换过，只剩顶层的字符串或列表
+        if isinstance(result, unicode):
+            return result.encode(encoding)
+        elif isinstance(result, list):
+            return _encode_list(result, encoding)
+        return result
+
+class MarshalCodec(object):
+    '''标准库marshal编解码器，比JSON更快更紧凑，只能用于两端都是Python 2的可信环境
+
+    解码得到的字符串保持编码前的类型（str或unicode），元组不会变成列表
+    '''
+    name = "marshal"
+    codec_id = b"\x02"
+    unicode_strings = False
+
+    def dumps(self, obj ):
+        '''序列化
+
+        :raises TypeError: 包含不能序列化的对象
+        '''
+        try:
+            return marshal.dumps(obj, 2)
+        except ValueError, e:
+            raise TypeError(str(e))
+
+    def loads(self, data, encoding=None ):
+        '''反序列化
+
+        :param encoding: 字符串的编码，为None时字符串保持原来的类型
+        :raises ValueError: 数据格式错误
+        '''
+        try:
+            result = marshal.loads(data)
+        except (EOFError, TypeError), e:
+            raise ValueError(str(e))
+        if encoding:
+            result = _encode_all(result, encoding)
+        return result
+
+JSON_CODEC = JSONCodec()
+MARSHAL_CODEC = MarshalCodec()
+
+_codecs = {}
+_codecs_by_id = {}
+
+def register_codec( codec ):
+    '''注册编解码器
+
+    :param codec: 编解码器，需要有name、codec_id、unicode_strings属性和dumps、loads方法，
+                  loads方法需要支持encoding参数
+    '''
+    _codecs[codec.name] = codec
+    _codecs_by_id[codec.codec_id] = codec
+
+def get_codec( name ):
+    '''根据名称获取编解码器，不存在时返回None
+    '''
+    return _codecs.get(name)
+
+def get_codec_by_id( codec_id ):
+    '''根据编解码器ID获取编解码器，不存在时返回None
+    '''
+    return _codecs_by_id.get(codec_id)
+
+def list_codecs():
+    '''返回全部已注册的编解码器名称，即服务器默认接受的编解码器
+    '''
+    return sorted(_codecs.keys())
+
+register_codec(JSON_CODEC)
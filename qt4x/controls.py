@@ -17,11 +17,13 @@
 
 import re
 import time
+import weakref
 
 from testbase.util import Timeout, LazyInit
 from tuia.exceptions import ControlNotFoundError, ControlAmbiguousError, ControlExpiredError
-from qt4x.jsonrpc import ServerError
+from qt4x.jsonrpc import Error, MethodNotFoundError, BatchCall
 from qt4x.qpath import QPath
+from qt4x.snapshot import TreeSnapshot
 
 CONTROL_EXPIRED_ERROR = 1
 
@@ -29,39 +31,206 @@ def check_expired( func ):
     def _func(*argv, **kwargs):
         try:
             return func(*argv, **kwargs)
-        except ServerError, e:
+        except Error, e:
             if e.code == CONTROL_EXPIRED_ERROR:
                 raise ControlExpiredError()
             else:
                 raise
     return _func
+
+def reresolve_expired( func ):
+    '''call ControlProxy method again after finding the control again, if the control
+    handle is expired and the proxy can be re-resolved
+    '''
+    def _func(self, *argv, **kwargs):
+        try:
+            return func(self, *argv, **kwargs)
+        except ControlExpiredError:
+            if self._resolve is None:
+                raise
+            self.refresh()
+            return func(self, *argv, **kwargs)
+    return _func
+
+#max seconds of a single long-poll request, should be less than RPC timeout
+LONG_POLL_SLICE = 5
+
+NOT_SUPPORTED = object()
+
+_unsupported_methods = weakref.WeakKeyDictionary()
+
+@check_expired
+def long_poll( driver, method, timeout, *args ):
+    '''call a test stub method which blocks until condition is satisfied or timed out,
+    timeout is passed as the last parameter and split into slices of LONG_POLL_SLICE
+    
+    :returns: result of the last call, or NOT_SUPPORTED if test stub has no such method
+    '''
+    if method in _unsupported_methods.get(driver, ()):
+        return NOT_SUPPORTED
+    deadline = time.time() + timeout
+    while 1:
+        remaining = max(deadline - time.time(), 0)
+        try:
+            result = getattr(driver, method)(*(args + (min(remaining, LONG_POLL_SLICE),)))
+        except MethodNotFoundError:
+            _unsupported_methods.setdefault(driver, set()).add(method)
+            return NOT_SUPPORTED
+        if result or remaining <= LONG_POLL_SLICE:
+            get_attr_cache(driver).invalidate() #UI may have changed while waiting
+            return result
+            
+class AttrCache(object):
+    '''control attribute values read at the latest known UI tree version
+    
+    By default every read is still one RPC round trip: the value is revalidated
+    by sending its version, and test stub only leaves the value out of the
+    response if UI is unchanged. If `max_age` is set, a value is served without
+    RPC if the latest version was confirmed within `max_age` seconds. Actions
+    of this client (`click`, `set_attr`, waits in test stub and `App.reset`)
+    force revalidation, but reads may miss UI changes made asynchronously by
+    the app, e.g. by a click handled after `click` returns, so it is off by
+    default.
+    '''
+    #seconds a confirmed UI tree version is trusted without RPC, 0 to revalidate on every read
+    max_age = 0
+    
+    def __init__(self):
+        self._values = {}
+        self._version = None
+        self._confirm_time = 0
+        
+    def get(self, control_id, name ):
+        '''get cached value
+        
+        :returns: (found, fresh, value)
+        '''
+        key = (control_id, name)
+        if key not in self._values:
+            return False, False, None
+        fresh = self.max_age > 0 and time.time() - self._confirm_time <= self.max_age
+        return True, fresh, self._values[key]
+    
+    @property
+    def version(self):
+        '''latest known UI tree version
+        '''
+        return self._version
+    
+    def confirm(self, version ):
+        '''update latest known UI tree version, values of older versions are dropped
+        '''
+        if version != self._version:
+            self._values = {}
+            self._version = version
+        self._confirm_time = time.time()
+        
+    def put(self, control_id, name, value ):
+        '''cache value read at the latest known UI tree version
+        '''
+        self._values[(control_id, name)] = value
+        
+    def invalidate(self):
+        '''force revalidation of all values, called after actions which may change UI
+        '''
+        self._confirm_time = 0
+        
+_attr_caches = weakref.WeakKeyDictionary()
+
+def get_attr_cache( driver ):
+    '''get attribute cache of driver
+    '''
+    cache = _attr_caches.get(driver)
+    if cache is None:
+        cache = _attr_caches[driver] = AttrCache()
+    return cache
             
 class ControlProxy(object):
     '''control proxy
     '''
-    def __init__(self, driver, control_id ):
+    def __init__(self, driver, control_id, resolve=None ):
+        '''constructor
+        
+        :param driver: test driver
+        :param control_id: control id
+        :param resolve: function finding control id again when the control handle is expired,
+                        calls fail with ControlExpiredError if not set
+        '''
         self._driver = driver
         self._control_id = control_id
+        self._resolve = resolve
     
     @property    
     def id(self):
         return self._control_id
     
+    def refresh(self):
+        '''find control again after its handle is expired
+        '''
+        if self._resolve is None:
+            raise ControlExpiredError()
+        self._control_id = self._resolve()
+    
+    @reresolve_expired
     @check_expired
     def get_attr(self, name ):
-        return self._driver.get_control_attr(self._control_id, name)
+        if "get_control_attr_versioned" in _unsupported_methods.get(self._driver, ()):
+            return self._driver.get_control_attr(self._control_id, name)
+        cache = get_attr_cache(self._driver)
+        found, fresh, value = cache.get(self._control_id, name)
+        if fresh:
+            return value
+        try:
+            if found:
+                result = self._driver.get_control_attr_versioned(self._control_id, name, cache.version)
+            else:
+                result = self._driver.get_control_attr_versioned(self._control_id, name)
+        except MethodNotFoundError:
+            _unsupported_methods.setdefault(self._driver, set()).add("get_control_attr_versioned")
+            return self._driver.get_control_attr(self._control_id, name)
+        cache.confirm(result[0])
+        if len(result) == 1: #not modified
+            return value
+        cache.put(self._control_id, name, result[1])
+        return result[1]
+    
+    @reresolve_expired
+    @check_expired
+    def get_attrs(self, names ):
+        '''get several attributes in one batch request
+        '''
+        with BatchCall(self._driver) as batch:
+            for name in names:
+                batch.get_control_attr(self._control_id, name)
+        return list(batch.results)
 
+    @reresolve_expired
     @check_expired
     def set_attr(self, name, value ):
-        return self._driver.set_control_attr(self._control_id, name, value)
+        try:
+            return self._driver.set_control_attr(self._control_id, name, value)
+        finally:
+            get_attr_cache(self._driver).invalidate()
         
+    @reresolve_expired
     @check_expired
     def get_children(self):
         return self._driver.get_control_children(self._control_id)
         
+    @reresolve_expired
     @check_expired
-    def click(self):
-        return self._driver.click_control(self._control_id)
+    def click(self, notify=False ):
+        '''click control
+        
+        :param notify: send as notification without waiting for result, 
+                       expired control is not reported in this mode
+        '''
+        try:
+            if notify:
+                return self._driver("notify").click_control(self._control_id)
+            return self._driver.click_control(self._control_id)
+        finally:
+            get_attr_cache(self._driver).invalidate()
         
 class Window(object):
     '''Window
@@ -71,44 +240,71 @@ class Window(object):
     
     NAME = None
     
+    #answer reads and locator queries of window and its controls from the UI mirror of app
+    USE_MIRROR = False
+    
+    #properties returning the window attribute of the same name as is, see `Control.RAW_ATTRS`
+    RAW_ATTRS = ("title",)
+    
+    #find window again by name when its handle is expired, e.g. window is registered again
+    _reresolve_expired = True
+    
     def __init__(self, app ):
         self._app = app
-        self._driver = app.get_driver()
+        if self.USE_MIRROR:
+            self._driver = app.get_mirror()
+        else:
+            self._driver = app.get_driver()
         self._locators = {}
+        self._controls = {} #key -> cached control
         self._proxy = LazyInit(self, "_proxy", self._init_proxy)
         
     def _init_proxy(self):
-        t0 = time.time()
-        while time.time() - t0 < self.timeout:
-            if self.NAME is None:
-                raise ValueError("NAME of class \"%s\" is not set" % type(self))
-            control_id = self._driver.get_window_by_name(self.NAME)
-            if control_id:
-                return ControlProxy(self._driver, control_id)
-            time.sleep(self.interval)
+        if self.NAME is None:
+            raise ValueError("NAME of class \"%s\" is not set" % type(self))
+        control_id = long_poll(self._driver, "wait_window", self.timeout, self.NAME)
+        if control_id is NOT_SUPPORTED:
+            control_id = None
+            t0 = time.time()
+            while time.time() - t0 < self.timeout:
+                control_id = self._driver.get_window_by_name(self.NAME)
+                if control_id:
+                    break
+                time.sleep(self.interval)
+        if control_id:
+            return ControlProxy(self._driver, control_id, self._find_window_id)
         raise ControlNotFoundError("window with name \"%s\" not found" % self.NAME)
         
+    def _find_window_id(self):
+        control_id = self._driver.get_window_by_name(self.NAME)
+        if not control_id:
+            raise ControlNotFoundError("window with name \"%s\" not found" % self.NAME)
+        return control_id
+        
     def __getitem__(self, key):
+        control = self._controls.get(key)
+        if control is not None:
+            return control
         if not self._locators.has_key(key):
             raise RuntimeError("child control of name \"%s\" is not defined" % key )
         params = self._locators.get(key)
-
+        
         if isinstance(params, basestring):
-            params = {
-                "root": self,
-                "type": Control,
-                "locator": params
-            }
+            ctrl_class, params = Control, {"root": self, "locator": params}
         else:
+            params = dict(params)
+            ctrl_class = params.pop("type", Control)
             params["root"] = params.get("root", self)
-            params["type"] = params.get("type", Control)
             
         root = params["root"]
         if isinstance(root, basestring) and re.match('^@', root):
             root_key = re.sub('^@', '', root)
-            params["root"] = self.controls[root_key]       
-        ctrl_class = params.pop("type")
-        return ctrl_class(**params)
+            params["root"] = self.controls[root_key]
+        control = ctrl_class(**params)
+        #cached controls are found again by locator when expired, as each access used to find a new one
+        control._reresolve_expired = True
+        self._controls[key] = control
+        return control
         
     @property
     def id(self):
@@ -138,11 +334,20 @@ class Window(object):
         '''get test driver
         '''
         return self._driver
+    
+    @check_expired
+    def snapshot(self):
+        '''take a snapshot of the window control tree for local read-only queries
+        
+        :rtype: TreeSnapshot
+        '''
+        return TreeSnapshot(self._driver.dump_window_tree(self.id))
         
     def update_locator(self, locators):
         '''update UI locator(UI map)
         '''
         self._locators.update(locators)
+        self._controls = {}
         
     def exist(self):
         '''window existence
@@ -158,19 +363,48 @@ class Window(object):
     def wait_for_exist(self, timeout, interval ):
         '''wait for control existence
         '''
+        if self.NAME is None:
+            raise ValueError("NAME of class \"%s\" is not set" % type(self))
+        result = long_poll(self._driver, "wait_window", timeout, self.NAME)
+        if result is not NOT_SUPPORTED:
+            if result:
+                return
+            timeout = 0 #check once more to raise timeout error
         Timeout(timeout, interval).retry(self.exist, (), None, lambda x:x==True)
     
     def wait_for_value(self, timeout, interval, attrname, attrval ):
         '''wait for control attribute value
         '''
-        Timeout(timeout, interval).retry(lambda: getattr(self, attrname),
-                                         (), 
-                                         None, 
-                                         lambda x:x==attrval)
+        _wait_for_value(self, timeout, interval, attrname, attrval)
+        
+def _wait_for_value( control, timeout, interval, attrname, attrval ):
+    '''wait for attribute value of window or control, waiting in test stub if the
+    property is declared in `RAW_ATTRS` of the control class, otherwise polling
+    '''
+    t0 = time.time()
+    if getattr(control, attrname) == attrval:
+        return
+    if attrname in control.RAW_ATTRS:
+        result = long_poll(control.get_driver(), "wait_condition", timeout, control.id, attrname, attrval)
+        if result is not NOT_SUPPORTED:
+            if result and getattr(control, attrname) == attrval:
+                return
+            timeout = max(timeout - (time.time() - t0), 0)
+    Timeout(timeout, interval).retry(lambda: getattr(control, attrname),
+                                     (), 
+                                     None, 
+                                     lambda x:x==attrval)
         
 class Control(object):
     '''Control
     '''
+    #properties returning the control attribute of the same name as is, `wait_for_value`
+    #of these properties waits in test stub instead of polling
+    RAW_ATTRS = ("name",)
+    
+    #whether to find control again by locator when its handle is expired, set for controls cached by window
+    _reresolve_expired = False
+    
     def __init__(self, root, locator ):
         '''constructor
         
@@ -183,17 +417,33 @@ class Control(object):
         self._proxy = LazyInit(self, "_proxy", self._init_proxy)
     
     def _init_proxy(self):
+        resolve = self._resolve if self._reresolve_expired else None
+        return ControlProxy(self._driver, self._resolve(), resolve)
+        
+    def _resolve(self):
+        '''find control id, and find root control again first if its handle is expired
+        '''
+        try:
+            return self._find_control_id()
+        except ControlExpiredError:
+            if not getattr(self._root, "_reresolve_expired", False):
+                raise
+            self._root._proxy.refresh()
+            return self._find_control_id()
+        
+    @check_expired
+    def _find_control_id(self):
         if isinstance(self._locator, basestring):
             control_ids = self._driver.find_controls_by_name(self._root.id, self._locator)
         elif isinstance(self._locator, int):
             control_ids = [self._locator]
         elif isinstance(self._locator, QPath):                
-            control_ids = self._driver.find_controls(self._root.id, self._locator.dumps()[0])
+            control_ids = self._driver.find_controls(self._root.id, self._locator.selectors)
         else:
             raise TypeError()
         if control_ids:
             if len(control_ids) == 1:
-                return ControlProxy(self._driver, control_ids[0])
+                return control_ids[0]
             else:
                 raise ControlAmbiguousError()
         else:
@@ -222,7 +472,7 @@ class Control(object):
         if isinstance(self._locator, basestring):
             control_ids = self._driver.find_controls_by_name(self._root.id, self._locator)
         elif isinstance(self._locator, QPath):
-            control_ids = self._driver.find_controls(self._root.id, self._locator.dumps())
+            control_ids = self._driver.find_controls(self._root.id, self._locator.selectors)
         else:
             raise TypeError()
         if control_ids:
@@ -233,21 +483,33 @@ class Control(object):
     def wait_for_exist(self, timeout, interval ):
         '''wait for control existence
         '''
+        t0 = time.time()
+        result = NOT_SUPPORTED
+        if isinstance(self._locator, (basestring, QPath)) and self._root.exist():
+            if isinstance(self._locator, QPath):
+                locator = self._locator.selectors
+            else:
+                locator = self._locator
+            result = long_poll(self._driver, "wait_controls", timeout, self._root.id, locator)
+        if result is not NOT_SUPPORTED:
+            if result:
+                return
+            timeout = 0 #check once more to raise timeout error
+        else:
+            timeout = max(timeout - (time.time() - t0), 0)
         Timeout(timeout, interval).retry(self.exist, (), None, lambda x:x==True)
     
     def wait_for_value(self, timeout, interval, attrname, attrval ):
         '''wait for control attribute value
         '''
-        Timeout(timeout, interval).retry(lambda: getattr(self, attrname),
-                                         (), 
-                                         None, 
-                                         lambda x:x==attrval)
+        _wait_for_value(self, timeout, interval, attrname, attrval)
         
     
 
 class StaticText(Control):
     '''Text edit control
     '''
+    RAW_ATTRS = Control.RAW_ATTRS + ("text",)
     
     @property
     def text(self):
@@ -257,6 +519,8 @@ class StaticText(Control):
 class TextEdit(Control):
     '''Text edit control
     '''
+    RAW_ATTRS = Control.RAW_ATTRS + ("text",)
+    
     @property
     def text(self):
         return self._proxy.get_attr("text")
@@ -269,6 +533,8 @@ class TextEdit(Control):
 class MenuItem(Control):
     '''menu item control
     '''
+    RAW_ATTRS = Control.RAW_ATTRS + ("value",)
+    
     @property
     def value(self):
         return self._proxy.get_attr("value")
@@ -287,8 +553,8 @@ class Menu(Control):
 class Button(Control):
     '''button control
     '''
-    def click(self):
-        self._proxy.click()
+    def click(self, notify=False ):
+        self._proxy.click(notify)
         
         
         
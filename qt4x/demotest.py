@@ -26,7 +26,6 @@ class TextEditorApp(App):
     """Text editor app
     """
     ENTRY = "qt4x_sut.demo"
-    PORT = "11200"
 
 class MainWindow(Window):
     """main window
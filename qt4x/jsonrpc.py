@@ -15,7 +15,7 @@
 '''
 轻量级的JSON-RPC 2.0客户端和服务器
 
-简单实现，目前暂不支持notify模式、batch调用
+简单实现，支持notify模式和batch调用
 '''
 
 from __future__ import print_function, unicode_literals, absolute_import
@@ -25,7 +25,10 @@ import SimpleXMLRPCServer
 import BaseHTTPServer
 import json
 import string
-import urllib2
+import httplib
+import urlparse
+import threading
+import Queue
 import urllib
 import random
 import socket
@@ -36,9 +39,18 @@ import logging
 import time
 import struct
 import sys
+import os
+import atexit
+import weakref
+
+from qt4x import rpcstats, rpctrace
+from qt4x.codec import JSON_CODEC, MARSHAL_CODEC, get_codec, list_codecs
 
 logger = logging.getLogger("JsonRPC")
 
+#TCP/UDP帧头，为网络字节序的帧长度（含帧头）
+FRAME_HEADER = struct.Struct(b"!I")
+
 IDCHARS = string.ascii_lowercase + string.digits
 
 def random_id(length=8):
@@ -48,14 +60,14 @@ def random_id(length=8):
     return return_id
 
 def _byteify(data, encoding):
-    '''JSON结构中的字符串都转成对应的编码
+    '''JSON结构中的字符串都转成对应的编码，元组转成列表，和单遍解码的结果一致
     '''
     if isinstance(data, dict):
         dic={}
         for key,value in data.iteritems():
             dic[_byteify(key, encoding)]=_byteify(value, encoding)
         return dic
-    elif isinstance(data, list):
+    elif isinstance(data, (list, tuple)):
         ls=[]
         for element in data:
             ls.append(_byteify(element, encoding))
@@ -64,7 +76,19 @@ def _byteify(data, encoding):
         return data.encode(encoding)
     else:
         return data
-    
+
+def _unicodify(data, encoding="utf8"):
+    '''结构中的字节串都转成unicode，和JSON解码的结果一致
+    '''
+    if isinstance(data, dict):
+        return dict((_unicodify(key, encoding), _unicodify(value, encoding)) for key, value in data.iteritems())
+    elif isinstance(data, (list, tuple)):
+        return [ _unicodify(element, encoding) for element in data ]
+    elif isinstance(data, bytes):
+        return data.decode(encoding)
+    else:
+        return data
+
     
 class ProtocolError(Exception):
     '''协议实现相关错误
@@ -154,21 +178,145 @@ class ServerError(Error):
     CODE_MAX = -32000
     CODE_MIN = -32099
     
+def parse_unix_uri(uri):
+    '''解析unix:///path/to/socket形式的URI，返回套接字路径
+    '''
+    if not hasattr(socket, "AF_UNIX"):
+        raise ProtocolError("unix domain socket is not supported on this platform")
+    result = urlparse.urlsplit(uri)
+    if result.scheme != "unix" or not result.path:
+        raise ProtocolError("invalid unix domain socket uri \"%s\"" % uri)
+    return urllib.unquote(result.path)
+
+#连接被对端关闭或重置的错误码
+_CONNECTION_CLOSED_ERRORS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+def _is_closed_by_peer( sock ):
+    '''空闲的连接是否已经被对端关闭，空闲时可读表示收到了连接关闭或者不属于任何请求的数据
+    '''
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
+
+class _StaleConnection(Exception):
+    '''复用的连接在服务器处理请求前已经被关闭，可以用新连接重试
+    '''
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    '''基于unix domain socket的HTTP连接
+    '''
+    def __init__(self, path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        httplib.HTTPConnection.__init__(self, b"localhost", timeout=timeout)
+        self._socket_path = path
+        
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._socket_path)
+        except:
+            sock.close()
+            raise
+        self.sock = sock
+
+class HTTPConnectionPool(object):
+    '''按主机缓存的HTTP长连接池
+    '''
+    def __init__(self, maxsize=4, idle_timeout=15):
+        '''constructor
+        
+        :param maxsize: 每个主机最多缓存的空闲连接数
+        :type maxsize: int
+        :param idle_timeout: 空闲连接的最长保留时间，超时的连接在取用时被关闭
+        :type idle_timeout: float
+        '''
+        self._maxsize = maxsize
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle_conns = {}
+        
+    def get(self, host ):
+        '''取出一个空闲连接，没有则返回None
+        
+        :param host: 主机（host:port）
+        :type host: string
+        :returns: httplib.HTTPConnection
+        '''
+        expired = []
+        conn = None
+        now = time.time()
+        with self._lock:
+            conns = self._idle_conns.get(host)
+            while conns:
+                it, last_used = conns.pop()
+                if now - last_used < self._idle_timeout and it.sock is not None \
+                        and not _is_closed_by_peer(it.sock):
+                    conn = it
+                    break
+                expired.append(it)
+            if conns:
+                #最近使用的连接在列表尾部，头部的连接更早过期
+                while conns and now - conns[0][1] >= self._idle_timeout:
+                    expired.append(conns.pop(0)[0])
+        for it in expired:
+            it.close()
+        return conn
+    
+    def put(self, host, conn ):
+        '''归还一个空闲连接，超出容量时直接关闭
+        
+        :param host: 主机（host:port）
+        :type host: string
+        :param conn: HTTP连接
+        :type conn: httplib.HTTPConnection
+        '''
+        with self._lock:
+            conns = self._idle_conns.setdefault(host, [])
+            if len(conns) < self._maxsize:
+                conns.append((conn, time.time()))
+                return
+        conn.close()
+        
+    def clear(self):
+        '''关闭全部空闲连接
+        '''
+        with self._lock:
+            idle_conns, self._idle_conns = self._idle_conns, {}
+        for conns in idle_conns.values():
+            for conn, _ in conns:
+                conn.close()
+
+def _is_closed_before_response( error ):
+    '''读取应答状态行时的错误是否表示服务器在发送任何应答数据前关闭了连接
+    '''
+    if isinstance(error, httplib.BadStatusLine):
+        #连接关闭时读到的状态行为空，不同Python版本的错误信息不同
+        return not error.line.strip("\'\"") or "closed" in error.line
+    return error.errno in _CONNECTION_CLOSED_ERRORS
+    
 class HTTPTransport(object):
     '''处理请求到HTTP服务器
+    
+    使用HTTP/1.1长连接，连接在请求之间放回连接池复用
     '''
-    def __init__(self):
+    def __init__(self, pool_maxsize=4, idle_timeout=15):
         '''constructor
+        
+        :param pool_maxsize: 每个主机最多缓存的空闲连接数
+        :type pool_maxsize: int
+        :param idle_timeout: 空闲连接的最长保留时间，应小于服务器端的空闲超时
+        :type idle_timeout: float
         '''
         self._timeout = None
-        proxy_handler = urllib2.ProxyHandler({})       
-        proxy_auth_handler = urllib2.HTTPBasicAuthHandler()     
-        self._opener = urllib2.build_opener(proxy_handler, proxy_auth_handler)
+        self._pool = HTTPConnectionPool(pool_maxsize, idle_timeout)
         
     def close(self):
         '''关闭连接
         '''
-        self._opener.close()
+        self._pool.clear()
         
     def settimeout(self, timeout ):
         '''设置请求超时时间
@@ -178,18 +326,338 @@ class HTTPTransport(object):
         '''
         self._timeout = timeout
 
+    def get_codec(self, uri ):
+        '''返回请求包和应答包的编解码器，HTTP只支持JSON
+        '''
+        return JSON_CODEC
+
     def request(self, uri, request ):
         '''发送请求
         
-        :param uri: 目标
+        :param uri: 目标，如http://127.0.0.1:12000/或unix:///tmp/sut.sock
+        :type uri: string
+        :param request: 请求包
+        :type request: string
+        :returns: string
+        '''
+        result = urlparse.urlsplit(uri)
+        if result.scheme == "http":
+            host = result.netloc
+            path = result.path or "/"
+            if result.query:
+                path += "?" + result.query
+        elif result.scheme == "unix":
+            host = uri
+            path = "/"
+        else:
+            raise ProtocolError("unsupported scheme \"%s\"" % result.scheme)
+        
+        conn = self._pool.get(host)
+        if conn is not None:
+            try:
+                return self._do_request(host, conn, path, request, True)
+            except _StaleConnection:
+                pass #用新连接重试
+        if result.scheme == "unix":
+            conn = UnixHTTPConnection(parse_unix_uri(uri), timeout=self._timeout)
+        else:
+            conn = httplib.HTTPConnection(host, timeout=self._timeout)
+        return self._do_request(host, conn, path, request)
+    
+    def _do_request(self, host, conn, path, request, reused=False ):
+        '''在指定连接上发送请求并读取应答
+        
+        :raises _StaleConnection: 复用的连接在发送请求时出错，或者在收到任何应答数据前被服务器
+                                  关闭，请求没有被处理
+        '''
+        if conn.sock is not None:
+            conn.sock.settimeout(self._timeout)
+        else:
+            conn.timeout = self._timeout
+        try:
+            try:
+                conn.request(b"POST", path.encode("utf8"), request, 
+                             {b"Content-Type": b"application/json-rpc"})
+            except socket.timeout:
+                raise
+            except (socket.error, httplib.CannotSendRequest):
+                if reused:
+                    raise _StaleConnection()
+                raise
+            try:
+                #请求和应答严格交替，可以安全地使用带缓冲的读取
+                response = conn.getresponse(buffering=True)
+            except socket.timeout:
+                raise
+            except (socket.error, httplib.BadStatusLine) as e:
+                #服务器可能已经处理了请求，只有没收到任何应答数据就被关闭时才能重试
+                if reused and _is_closed_before_response(e):
+                    raise _StaleConnection()
+                raise
+            data = response.read()
+        except:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._pool.put(host, conn)
+        if response.status not in (200, 204):
+            raise ProtocolError("HTTP Error %s: %s" % (response.status, response.reason))
+        return data
+    
+class TCPTransport(object):
+    '''处理请求到TCPJsonRPCServer
+    
+    使用一个长连接，请求之间复用，复用的连接在服务器处理请求前被关闭时重连一次。首次连接到服务器时通过
+    rpc.list_codecs协商编解码器，服务器不支持协商时使用JSON编码的请求包字符串作为帧数据
+    '''
+    def __init__(self, codecs=("json",)):
+        '''constructor
+
+        :param codecs: 按优先级排列的编解码器名称或编解码器对象（如qt4x.codec.MARSHAL_CODEC），为空时不协商
+        :type codecs: tuple
+        '''
+        self._timeout = None
+        self._sock = None
+        self._addr = None
+        self._lock = threading.Lock()
+        self._header = bytearray(FRAME_HEADER.size)
+        self._received = 0 #当前请求已经收到的应答字节数
+        self._codecs = codecs
+        self._codec = None #和当前服务器协商的编解码器，为None表示使用旧的帧格式
+        self._negotiated = {} #服务器地址 -> 协商的编解码器
+        
+    def close(self):
+        '''关闭连接
+        '''
+        with self._lock:
+            self._close()
+            
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        
+    def settimeout(self, timeout ):
+        '''设置请求超时时间
+        
+        :param timeout: 超时时间
+        :type timeout: int
+        '''
+        self._timeout = timeout
+        if self._sock is not None:
+            self._sock.settimeout(timeout)
+        
+    def _connect(self, uri ):
+        '''返回到uri的连接，以及是否为复用的连接
+        '''
+        result = urlparse.urlsplit(uri)
+        if result.scheme == "tcp":
+            addr = (result.hostname, result.port)
+        elif result.scheme == "unix":
+            addr = parse_unix_uri(uri)
+        else:
+            raise ProtocolError("unsupported scheme \"%s\"" % result.scheme)
+        if self._sock is not None and self._addr == addr:
+            if not _is_closed_by_peer(self._sock):
+                return self._sock, True
+        self._close()
+        if isinstance(addr, tuple):
+            sock = socket.create_connection(addr, self._timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            try:
+                sock.connect(addr)
+            except:
+                sock.close()
+                raise
+        if addr not in self._negotiated:
+            try:
+                self._negotiated[addr] = self._negotiate(sock)
+            except:
+                sock.close()
+                raise
+        self._sock, self._addr = sock, addr
+        self._codec = self._negotiated[addr]
+        return sock, False
+        
+    def _negotiate(self, sock ):
+        '''在新连接上协商编解码器，服务器不支持协商时返回None
+        '''
+        if not self._codecs:
+            return None
+        sock.sendall(self._build_frame(json.dumps(_build_request("rpc.list_codecs", [])), None))
+        try:
+            response = json.loads(self._recv_frame(sock))
+        except ValueError:
+            raise ProtocolError("invalid response of rpc.list_codecs")
+        if not isinstance(response, dict) or not isinstance(response.get("result"), list):
+            return None #旧版本的服务器，返回方法不存在错误
+        for it in self._codecs:
+            codec = get_codec(it) if isinstance(it, basestring) else it
+            if codec is not None and codec.name in response["result"]:
+                return codec
+        return None
+        
+    def _build_frame(self, request, codec ):
+        if codec is None:
+            data = json.dumps(request) #旧的帧格式，服务端会先做一次JSON解码
+        else:
+            data = codec.codec_id + request
+        return FRAME_HEADER.pack(len(data) + FRAME_HEADER.size) + data
+        
+    def get_codec(self, uri ):
+        '''返回和服务器协商的编解码器，必要时先建立连接
+        '''
+        with self._lock:
+            self._connect(uri)
+            return self._codec or JSON_CODEC
+        
+    def _send(self, uri, request ):
+        '''发送一帧请求，复用的连接发送失败时重连一次
+        '''
+        sock, reused = self._connect(uri)
+        frame = self._build_frame(request, self._codec)
+        try:
+            sock.sendall(frame)
+        except socket.timeout:
+            self._close()
+            raise
+        except socket.error:
+            self._close()
+            if not reused:
+                raise
+            sock, reused = self._connect(uri)
+            try:
+                sock.sendall(frame)
+            except:
+                self._close()
+                raise
+        return sock, reused
+    
+    def _recv_exactly(self, sock, buf ):
+        view = memoryview(buf)
+        pos = 0
+        while pos < len(buf):
+            size = sock.recv_into(view[pos:])
+            if size == 0:
+                raise socket.error(errno.ECONNRESET, "connection closed by server")
+            pos += size
+            self._received += size
+        
+    def _recv_frame(self, sock ):
+        self._recv_exactly(sock, self._header)
+        expect_len = FRAME_HEADER.unpack_from(self._header)[0]
+        if expect_len < FRAME_HEADER.size:
+            raise ProtocolError("invalid frame length %s" % expect_len)
+        data = bytearray(expect_len - FRAME_HEADER.size)
+        self._recv_exactly(sock, data)
+        return bytes(data)
+        
+    def _recv_response(self, sock ):
+        data = self._recv_frame(sock)
+        if self._codec is None:
+            return data
+        if data[:1] != self._codec.codec_id:
+            raise ProtocolError("unexpected codec of response %r" % data[:1])
+        return data[1:]
+        
+    def request(self, uri, request ):
+        '''发送请求
+        
+        :param uri: 目标，如tcp://127.0.0.1:12000或unix:///tmp/sut.sock
         :type uri: string
         :param request: 请求包
         :type request: string
         :returns: string
         '''
-        req = urllib2.Request(uri, request, {"Content-Type": "application/json-rpc"})
-        return self._opener.open(req, timeout=self._timeout).read()
+        with self._lock:
+            sock, reused = self._send(uri, request)
+            self._received = 0
+            try:
+                return self._recv_response(sock)
+            except socket.timeout:
+                self._close()
+                raise
+            except socket.error as e:
+                self._close()
+                #服务器可能已经处理了请求，只有复用的连接在收到任何应答数据前被关闭时才能重试
+                if not reused or self._received or e.errno not in _CONNECTION_CLOSED_ERRORS:
+                    raise
+            except:
+                self._close()
+                raise
+            sock, _ = self._send(uri, request)
+            try:
+                return self._recv_response(sock)
+            except:
+                self._close()
+                raise
+            
+    def notify(self, uri, request ):
+        '''发送通知，不等待服务器处理
+        
+        :param uri: 目标
+        :type uri: string
+        :param request: 通知请求包
+        :type request: string
+        '''
+        with self._lock:
+            self._send(uri, request)
     
+def _build_request(methodname, params):
+    '''构造请求包
+    '''
+    request = {"jsonrpc": "2.0"}
+    if len(params) > 0:
+        request["params"] = params
+    request["id"] = random_id()
+    request["method"] = methodname
+    return request
+
+def _parse_response(response):
+    '''解析应答包，返回调用结果或抛出对应的异常
+    '''
+    if 'jsonrpc' in response.keys() and float(response['jsonrpc']) > 2.0:
+        raise NotImplementedError('JSON-RPC version not yet supported.')
+    
+    if 'result' not in response.keys() and 'error' not in response.keys():
+        raise ProtocolError('Response does not have a result or error key.')
+    
+    if 'error' in response.keys() and response['error'] != None:
+        code = response['error']['code']
+        err_cls = PREDEFINE_ERRORS.get(code, None)
+        if err_cls:
+            raise err_cls(response['error']['message'], 
+                          response['error'].get('data',None),
+                          response['error'].get('stack',None))
+        if code < ServerError.CODE_MAX and code > ServerError.CODE_MIN:
+            err_cls = ServerError
+        else:
+            err_cls = Error
+        raise err_cls(response['error']['code'],
+                      response['error']['message'], 
+                      response['error'].get('data',None),
+                      response['error'].get('stack',None))
+    else:
+        return response['result']
+    
+def _trace_call(trace, side, codec, start_time, elapsed, request, response):
+    '''把序列化的请求包和应答包反序列化后记录到trace中，应答包无法解析时记录为None
+    '''
+    def _load(data):
+        if not data:
+            return None
+        try:
+            obj = codec.loads(data)
+        except Exception:
+            return None
+        return obj if codec.unicode_strings else _unicodify(obj)
+    trace.record(side, start_time, elapsed, _load(request), _load(response))
+
 class _Method(object):
     '''some magic to bind an JSON-RPC method to an RPC server.
     supports "nested" methods (e.g. examples.getStateName)
@@ -208,74 +676,174 @@ class _Method(object):
         else:
             return self.__send(self.__name, kwargs)
     
+class _MethodDispatcher(object):
+    '''dispatch attribute access to _Method bound to send
+    '''
+    def __init__(self, send):
+        self.__send = send
+    def __getattr__(self, name):
+        return _Method(self.__send, name)
+    
 class ServerProxy(object):
     '''和JSON-RPC服务器的逻辑连接
     '''
-    def __init__(self, uri, transport=None, encoding="utf8", timeout=10):
+    def __init__(self, uri, transport=None, encoding="utf8", timeout=10, single_pass_decode=False):
         '''构造函数
         
         :param uri: RPC URL
         :type uri: string
-        :param transport: 传输层
-        :type transport: HTTPTransport/LongHTTPTransport
+        :param transport: 传输层，默认根据uri的协议选择
+        :type transport: HTTPTransport/TCPTransport
         :param encoding: 编码方式，默认为unicode
         :type encoding: string
         :param timeout: RPC请求超时时间
         :type timeout: int
+        :param single_pass_decode: 是否在解析应答包的过程中完成字符串编码转换，结果不变，
+                                   大应答包的解码时间和内存占用更少
+        :type single_pass_decode: bool
         '''
         self.__uri = uri
         if transport is None:
-            transport =  HTTPTransport()
+            if uri.startswith("tcp://"):
+                transport = TCPTransport()
+            else:
+                transport = HTTPTransport()
         transport.settimeout(timeout)
         self.__transport = transport
         self.__encoding = encoding
+        self.__single_pass_decode = single_pass_decode
 
     def __close(self):
         '''close connection to remote server
         '''
         self.__transport.close()
 
+    def __get_codec(self):
+        '''获取传输层使用的编解码器，传输层不支持协商时使用JSON
+        '''
+        get_codec = getattr(self.__transport, "get_codec", None)
+        if get_codec is None:
+            return JSON_CODEC
+        return get_codec(self.__uri)
+
+    def __decode(self, codec, response):
+        '''反序列化应答包，字符串转成指定的编码
+        '''
+        if self.__single_pass_decode:
+            return codec.loads(response, self.__encoding)
+        response = codec.loads(response)
+        if self.__encoding:
+            response = _byteify(response, self.__encoding)
+        elif not codec.unicode_strings: #字符串和JSON解码的结果一致，都为unicode
+            response = _unicodify(response)
+        return response
+
+    def __send(self, methodname, codec, request, handle_response):
+        '''发送请求包并处理应答包，开启调用统计时记录统计
+        '''
+        stats = rpcstats.active
+        trace = rpctrace.active
+        if stats is None and trace is None:
+            return handle_response(codec, self.__transport.request(self.__uri, request))
+        response = None
+        succeeded = False
+        time0 = time.time()
+        try:
+            response = self.__transport.request(self.__uri, request)
+            result = handle_response(codec, response)
+            succeeded = True
+            return result
+        finally:
+            elapsed = time.time() - time0
+            if stats is not None:
+                stats.record(methodname, len(request), len(response) if response is not None else 0,
+                             elapsed, succeeded)
+            if trace is not None:
+                _trace_call(trace, "client", codec, time0, elapsed, request, response)
+
     def __request(self, methodname, params):
         '''call a method on the remote server
         '''
-        request = {"jsonrpc": "2.0"}
-        if len(params) > 0:
-            request["params"] = params
-        request["id"] = random_id()
-        request["method"] = methodname
-        response = self.__transport.request(
-            self.__uri,
-            json.dumps(request))
-        
-        response = json.loads(response)
-        if self.__encoding:
-            response = _byteify(response, self.__encoding)        
+        codec = self.__get_codec()
+        return self.__send(methodname, codec, codec.dumps(_build_request(methodname, params)),
+                           self.__handle_response)
+
+    def __handle_response(self, codec, response):
+        '''解析单个调用的应答包
+        '''
+        response = self.__decode(codec, response)
         if not isinstance(response, dict):
             raise ProtocolError('Response is not a dict.')
-        
-        if 'jsonrpc' in response.keys() and float(response['jsonrpc']) > 2.0:
-            raise NotImplementedError('JSON-RPC version not yet supported.')
-        
-        if 'result' not in response.keys() and 'error' not in response.keys():
-            raise ProtocolError('Response does not have a result or error key.')
-        
-        if 'error' in response.keys() and response['error'] != None:
-            code = response['error']['code']
-            err_cls = PREDEFINE_ERRORS.get(code, None)
-            if err_cls:
-                raise err_cls(response['error']['message'], 
-                              response['error'].get('data',None),
-                              response['error'].get('stack',None))
-            if code < ServerError.CODE_MAX and code > ServerError.CODE_MIN:
-                err_cls = ServerError
+        return _parse_response(response)
+
+    def __notify(self, methodname, params):
+        '''send a notification to the remote server, no result is returned
+        '''
+        request = {"jsonrpc": "2.0", "method": methodname}
+        if len(params) > 0:
+            request["params"] = params
+        codec = self.__get_codec()
+        data = codec.dumps(request)
+        stats = rpcstats.active
+        trace = rpctrace.active
+        response = None
+        succeeded = False
+        time0 = time.time()
+        try:
+            notify = getattr(self.__transport, "notify", None)
+            if notify is None: #传输层不支持单向发送，等待服务器的空应答
+                response = self.__transport.request(self.__uri, data)
             else:
-                err_cls = Error
-            raise err_cls(response['error']['code'],
-                          response['error']['message'], 
-                          response['error'].get('data',None),
-                          response['error'].get('stack',None))
-        else:
-            return response['result']
+                response = notify(self.__uri, data)
+            succeeded = True
+        finally:
+            elapsed = time.time() - time0
+            if stats is not None:
+                stats.record("notify(%s)" % methodname, len(data), len(response or b""), elapsed, succeeded)
+            if trace is not None:
+                _trace_call(trace, "client", codec, time0, elapsed, data, None)
+
+    def __batch_request(self, calls):
+        '''call several methods on the remote server in one request
+
+        :param calls: 调用列表，每项为(methodname, params)
+        :type calls: list
+        :returns: list - 与calls一一对应的结果，调用失败的项为对应的Error实例
+        '''
+        if not calls:
+            return []
+        requests = [ _build_request(methodname, params) for methodname, params in calls ]
+        codec = self.__get_codec()
+        #统计中按包含的方法名记录
+        methodname = "batch(%s)" % ",".join(sorted(set(it[0] for it in calls)))
+        return self.__send(methodname, codec, codec.dumps(requests),
+                           lambda codec, response: self.__handle_batch_response(codec, requests, response))
+
+    def __handle_batch_response(self, codec, requests, response):
+        '''解析batch调用的应答包
+        '''
+        response = self.__decode(codec, response)
+        if isinstance(response, dict):
+            #整个batch请求被服务器拒绝
+            _parse_response(response)
+            raise ProtocolError('Response of batch request is not a list.')
+        if not isinstance(response, list):
+            raise ProtocolError('Response is not a list.')
+        
+        responses = {}
+        for it in response:
+            if not isinstance(it, dict):
+                raise ProtocolError('Response entry is not a dict.')
+            responses[it.get("id")] = it
+        results = []
+        for request in requests:
+            if request["id"] not in responses:
+                raise ProtocolError('Response of request "%s" is missing.' % request["id"])
+            try:
+                results.append(_parse_response(responses[request["id"]]))
+            except Error, e:
+                results.append(e)
+        return results
 
     def __repr__(self):
         return "<ServerProxy for %s>" % self.__uri
@@ -295,18 +863,85 @@ class ServerProxy(object):
         '''
         if attr == "close":
             return self.__close
+        elif attr == "notify":
+            return _MethodDispatcher(self.__notify)
+        elif attr == "batch_request":
+            return self.__batch_request
         elif attr == "transport":
             return self.__transport
         raise AttributeError("Attribute %r not found" % (attr,))
 
+class BatchCallIterator(object):
+    '''batch调用结果迭代器，调用失败的项在访问时抛出对应的异常
+    '''
+    def __init__(self, results):
+        self.__results = results
+        
+    def __getitem__(self, i):
+        item = self.__results[i]
+        if isinstance(item, Error):
+            raise item
+        return item
+    
+    def __len__(self):
+        return len(self.__results)
+        
+class BatchCall(object):
+    '''把多个RPC调用合并成一个JSON-RPC batch请求发送
+
+    用法::
+
+        with BatchCall(server) as batch:
+            batch.get_control_attr(control_id, "text")
+            batch.get_control_attr(control_id, "name")
+        text, name = batch.results
+    '''
+    def __init__(self, server):
+        '''构造函数
+        
+        :param server: JSON-RPC服务器的逻辑连接
+        :type server: ServerProxy
+        '''
+        self.__server = server
+        self.__calls = []
+        self.results = None
+        
+    def __queue(self, methodname, params):
+        self.__calls.append((methodname, params))
+        
+    def __getattr__(self, name):
+        return _Method(self.__queue, name)
+    
+    def __call__(self):
+        '''发送所有排队的调用
+        
+        :returns: BatchCallIterator
+        '''
+        calls, self.__calls = self.__calls, []
+        self.results = BatchCallIterator(self.__server("batch_request")(calls))
+        return self.results
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self()
+        
 class SimpleJSONRPCDispatcher(object):
     '''简单的JSON-RPC分发器
     '''
     def __init__(self):
         '''Constructor
         '''
-        self.funcs = {}
+        self.funcs = {"rpc.list_codecs": self.list_codecs}
         self.instance = None
+        self.codecs = dict((it.codec_id, it) for it in map(get_codec, list_codecs()))
+        
+    def list_codecs(self):
+        '''返回接受的编解码器名称
+        '''
+        return sorted(it.name for it in self.codecs.values())
         
     def register_instance(self, instance, allow_dotted_names=False):
         '''注册一个对象去响应RPC请求
@@ -324,7 +959,12 @@ class SimpleJSONRPCDispatcher(object):
     def _construct_error(self, reqid, code, msg, data=None, stack=None ):
         '''返回错误给客户端
         '''
-        return json.dumps({
+        return json.dumps(self._error_response(reqid, code, msg, data, stack))
+        
+    def _error_response(self, reqid, code, msg, data=None, stack=None ):
+        '''构造错误应答包
+        '''
+        return {
             "jsonrpc": "2.0",
             "error": {
                 "code": code,
@@ -333,7 +973,7 @@ class SimpleJSONRPCDispatcher(object):
                 "stack": stack,
             },
             "id": reqid
-        })
+        }
         
     def get_handler(self, method):
         '''获取对应的方法的处理句柄
@@ -355,35 +995,100 @@ class SimpleJSONRPCDispatcher(object):
                     pass
         return func
     
-    def marshaled_dispatch(self, data ):
+    def marshaled_dispatch(self, data, codec=JSON_CODEC ):
         '''分发一个为序列化的RPC请求
+        
+        :param codec: 请求包和应答包的编解码器
+        :returns: string - 序列化的应答包，请求只包含通知时返回None
         '''
-        reqid = None
+        trace = rpctrace.active
+        if trace is None:
+            return self._marshaled_dispatch(data, codec)
+        time0 = time.time()
+        response = None
         try:
-            try:
-                req = json.loads(data)
-            except ValueError:
-                return self._construct_error(None, ParseError.PREDEFINE_CODE, "parse JSON data from request error")
+            response = self._marshaled_dispatch(data, codec)
+            return response
+        finally:
+            _trace_call(trace, "server", codec, time0, time.time() - time0, data, response)
+        
+    def _marshaled_dispatch(self, data, codec ):
+        '''分发一个为序列化的RPC请求，不记录trace
+        '''
+        try:
+            req = codec.loads(data)
+        except ValueError:
+            return codec.dumps(self._error_response(None, ParseError.PREDEFINE_CODE, "parse %s data from request error" % codec.name))
+        if not codec.unicode_strings: #参数中的字符串和JSON解码的结果保持一致
+            req = _unicodify(req)
+        
+        if isinstance(req, list):
+            if not req:
+                return codec.dumps(self._error_response(None, InvalidRequestError.PREDEFINE_CODE, "batch request should not be empty"))
+            responses = [ self._dispatch(it) for it in req ]
+            responses = [ it for it in responses if it is not None ]
+            if not responses: #全部都是通知
+                return None
+            return self._marshal_response(responses, codec)
+        response = self._dispatch(req)
+        if response is None:
+            return None
+        return self._marshal_response(response, codec)
+        
+    def _marshal_response(self, response, codec=JSON_CODEC ):
+        '''序列化一个应答包，或者batch应答的应答包列表
+        '''
+        try:
+            return codec.dumps(response)
+        except Exception:
+            #把不能序列化的应答包替换为错误
+            if isinstance(response, list):
+                return codec.dumps([ self._checked_response(it, codec) for it in response ])
+            return codec.dumps(self._checked_response(response, codec))
+        
+    def _checked_response(self, response, codec ):
+        '''检查应答包是否能序列化，不能则返回错误应答包
+        '''
+        try:
+            codec.dumps(response)
+        except Exception, e:
+            return self._error_response(response["id"], InternalError.PREDEFINE_CODE, 
+                                        str(type(e).__name__) + ': ' + str(e), 
+                                        None,
+                                        traceback.format_exc())
+        return response
     
+    def _dispatch(self, req ):
+        '''分发一个已反序列化的RPC请求，返回应答包，通知请求没有应答包，返回None
+        '''
+        response = self._dispatch_request(req)
+        if isinstance(req, dict) and "id" not in req:
+            if "error" in response:
+                logger.warning("notification \"%s\" failed: %s" % (req.get("method"), response["error"]["message"]))
+            return None
+        return response
+    
+    def _dispatch_request(self, req ):
+        '''执行一个已反序列化的RPC请求，返回应答包
+        '''
+        reqid = None
+        try:
             if not isinstance(req, dict):
-                return self._construct_error(None, InvalidRequestError.PREDEFINE_CODE, "request should be a JSON object")
+                return self._error_response(None, InvalidRequestError.PREDEFINE_CODE, "request should be a JSON object")
             
-            if "id" not in req:
-                return self._construct_error(None, InvalidRequestError.PREDEFINE_CODE, "notification is not supported")
-            
-            reqid = req["id"]
+            reqid = req.get("id")
             
             if "jsonrpc" not in req:
-                return self._construct_error(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"jsonrpc\" is missing")
+                return self._error_response(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"jsonrpc\" is missing")
             if req["jsonrpc"] != "2.0":
-                return self._construct_error(reqid, InvalidRequestError.PREDEFINE_CODE, "unsupported version \"%s\"" % req["jsonrpc"])
+                return self._error_response(reqid, InvalidRequestError.PREDEFINE_CODE, "unsupported version \"%s\"" % req["jsonrpc"])
             
             if "method" not in req:
-                return self._construct_error(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"method\" is missing")
+                return self._error_response(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"method\" is missing")
                 
             func = self.get_handler(req["method"])
             if func is None:
-                return self._construct_error(reqid, MethodNotFoundError.PREDEFINE_CODE, "supported method \"%s\"" % req["method"])
+                return self._error_response(reqid, MethodNotFoundError.PREDEFINE_CODE, "supported method \"%s\"" % req["method"])
             
             params = req.get("params", [])
             if isinstance(params, dict):
@@ -391,26 +1096,69 @@ class SimpleJSONRPCDispatcher(object):
             elif isinstance(params, list):
                 result = func(*params)
             else:
-                return self._construct_error(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"params\" should be a list or object")
+                return self._error_response(reqid, InvalidRequestError.PREDEFINE_CODE, "request field \"params\" should be a list or object")
     
-            return json.dumps({
+            return {
                 "jsonrpc": "2.0",
                 "result": result,
                 "id": reqid
-            })
+            }
+        except Error, e: #由实现方指定错误码的错误
+            return self._error_response(reqid, e.code, e.message, e.data)
         except Exception, e:
-            return self._construct_error(reqid, InternalError.PREDEFINE_CODE, 
-                                         str(type(e).__name__) + ': ' + str(e), 
-                                         None,
-                                         traceback.format_exc())
+            return self._error_response(reqid, InternalError.PREDEFINE_CODE, 
+                                        str(type(e).__name__) + ': ' + str(e), 
+                                        None,
+                                        traceback.format_exc())
             
             
             
+def _set_nodelay( sock ):
+    '''关闭TCP连接的Nagle算法，长连接上分多次发送的应答不会因等待延迟确认而停顿
+    '''
+    if sock.family in (socket.AF_INET, getattr(socket, "AF_INET6", None)):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    
+def _has_buffered_data( rfile ):
+    '''socket文件对象的读缓冲区中是否有未处理的数据，无法确定时返回True
+    '''
+    rbuf = getattr(rfile, "_rbuf", None)
+    return rbuf is None or rbuf.tell() > 0
+    
 class SimpleJSONRPCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     '''简单的JSON-RPC HTTP请求处理句柄
     '''
+    #使用HTTP/1.1长连接，所有应答都必须带Content-length
+    protocol_version = "HTTP/1.1"
+    
+    #长连接的空闲超时时间
+    timeout = 30
+    
+    #缓冲应答数据，在请求处理完后发送，应答超过缓冲区大小时分多次发送
+    wbufsize = -1
+    
     #合法的路径集
     rpc_paths = ('/', '/json', '/json/')
+    
+    #连接是否已交还给服务器等待下一个请求，见ThreadPoolMixIn
+    parked = False
+    
+    def setup(self):
+        _set_nodelay(self.request)
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        
+    def handle(self):
+        '''处理长连接上的请求，请求之间空闲时把连接交还给服务器，不占用工作线程
+        '''
+        wait_request = getattr(self.server, "wait_request", None)
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection:
+            if wait_request is not None and not _has_buffered_data(self.rfile) \
+                    and not wait_request(self.connection):
+                self.parked = True
+                return
+            self.handle_one_request()
 
     def is_rpc_path_valid(self):
         '''检查路径合法性
@@ -446,6 +1194,7 @@ class SimpleJSONRPCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             if encoding != "identity":
                 self.send_response(501, "encoding %r not supported" % encoding)
                 self.send_header("Content-length", "0")
+                self.send_header("Connection", "close")
                 self.end_headers()
                 return
 
@@ -454,8 +1203,14 @@ class SimpleJSONRPCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         except Exception:  # 内部实现有问题
             self.send_response(500)
             self.send_header("Content-length", "0")
+            self.send_header("Connection", "close")
             self.end_headers()
         else:
+            if response is None: #通知请求没有应答
+                self.send_response(204)
+                self.send_header("Content-length", "0")
+                self.end_headers()
+                return
             self.send_response(200)
             self.send_header("Content-type", "application/json-rpc")
             self.send_header("Content-length", str(len(response)))
@@ -469,6 +1224,8 @@ class SimpleJSONRPCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         response = 'No such page'
         self.send_header("Content-type", "text/plain")
         self.send_header("Content-length", str(len(response)))
+        #请求体未被读取，不能继续复用该连接
+        self.send_header("Connection", "close")
         self.end_headers()
         self.wfile.write(response)
 
@@ -478,18 +1235,281 @@ class SimpleJSONRPCRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         if self.server.logRequests:
             BaseHTTPServer.BaseHTTPRequestHandler.log_request(self, code, size)
             
-class SimpleJSONRPCServer(SocketServer.TCPServer,
+    def log_message(self, format, *args):
+        '''输出日志，unix domain socket的客户端没有地址，以服务器路径代替
+        '''
+        if isinstance(self.client_address, tuple):
+            address = self.client_address[0]
+        else:
+            address = "unix:%s" % self.server.server_address
+        sys.stderr.write("%s - - [%s] %s\n" % (address, self.log_date_time_string(), format % args))
+            
+    def log_error(self, format, *args):
+        '''记录错误，长连接空闲超时也通过这里记录
+        '''
+        if self.server.logRequests:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_error(self, format, *args)
+            
+class UnixSocketMixIn:
+    '''监听地址为字符串时，作为unix domain socket的路径
+    '''
+    def init_address_family(self, addr):
+        '''根据监听地址选择地址族，需在TCPServer.__init__之前调用
+        '''
+        if isinstance(addr, basestring):
+            if not hasattr(socket, "AF_UNIX"):
+                raise ProtocolError("unix domain socket is not supported on this platform")
+            self.address_family = socket.AF_UNIX
+            
+    def server_bind(self):
+        if self.address_family == getattr(socket, "AF_UNIX", None):
+            #删除上次运行残留的套接字文件
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                if os.path.exists(self.server_address):
+                    raise
+        SocketServer.TCPServer.server_bind(self)
+        
+    def remove_socket_file(self):
+        '''删除unix domain socket文件
+        '''
+        if self.address_family == getattr(socket, "AF_UNIX", None):
+            try:
+                os.unlink(self.server_address)
+            except OSError:
+                pass
+            
+class _ParkedConnections(object):
+    '''交还的空闲长连接，由一个线程等待连接上的下一个请求，再放回工作线程池的队列
+    '''
+    def __init__(self, server ):
+        self._server = server
+        #空闲超时时间，和处理句柄的超时时间一致，为None时不超时
+        self._idle_timeout = getattr(server.RequestHandlerClass, "timeout", None)
+        self._lock = threading.Lock()
+        self._connections = {} #连接 -> (客户端地址, 交还时间)
+        self._closed = False
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._thread = threading.Thread(target=self._poll_thread)
+        self._thread.setDaemon(1)
+        self._thread.start()
+        
+    def park(self, request, client_address ):
+        '''交还空闲的长连接
+        '''
+        with self._lock:
+            if not self._closed:
+                self._connections[request] = (client_address, time.time())
+                os.write(self._wakeup_w, b"x")
+                return
+        self._server.shutdown_request(request)
+        
+    def close(self, timeout=1 ):
+        '''关闭全部交还的连接，并等待等待线程结束
+        
+        :param timeout: 等待线程结束的最长时间（秒）
+        '''
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                os.write(self._wakeup_w, b"x")
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        
+    def _poll_thread(self):
+        try:
+            while 1:
+                with self._lock:
+                    if self._closed:
+                        break
+                    connections = dict(self._connections)
+                timeout = None
+                if self._idle_timeout is not None and connections:
+                    oldest = min(it[1] for it in connections.values())
+                    timeout = max(oldest + self._idle_timeout - time.time(), 0)
+                try:
+                    readable, _, _ = select.select([self._wakeup_r] + list(connections), [], [], timeout)
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if self._wakeup_r in readable:
+                    os.read(self._wakeup_r, 4096)
+                now = time.time()
+                for request, (client_address, park_time) in connections.items():
+                    if request in readable:
+                        with self._lock:
+                            del self._connections[request]
+                        self._server.resume_request(request, client_address)
+                    elif self._idle_timeout is not None and now - park_time >= self._idle_timeout:
+                        with self._lock:
+                            del self._connections[request]
+                        self._server.shutdown_request(request)
+        finally:
+            with self._lock:
+                self._closed = True
+                connections, self._connections = self._connections, {}
+                os.close(self._wakeup_r)
+                os.close(self._wakeup_w)
+            for request in connections:
+                self._server.shutdown_request(request)
+            
+class ThreadPoolMixIn:
+    '''用有界的工作线程池处理连接
+
+    工作线程只在处理请求时占用：长连接在请求之间空闲超过park_delay后交还给等待线程，有新的
+    请求时再放入队列由工作线程处理，空闲的长连接不占用工作线程。工作线程都忙时，连接在队列中
+    等待，队列满时直接关闭连接
+    '''
+    #工作线程数
+    max_workers = 8
+    
+    #等待处理的连接的最大数量
+    max_queue = 32
+    
+    #长连接空闲多少秒后交还给等待线程，连续的请求由同一个工作线程处理
+    park_delay = 0.05
+    
+    _requests = None
+    _parked = None
+    _workers = ()
+    
+    def start_workers(self):
+        '''启动工作线程
+        '''
+        self._requests = Queue.Queue(self.max_queue)
+        self._parked = _ParkedConnections(self)
+        self._workers = []
+        for _ in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_thread)
+            worker.setDaemon(1)
+            worker.start()
+            self._workers.append(worker)
+        _running_pools.add(self)
+            
+    def stop_workers(self):
+        '''通知工作线程在处理完当前连接后退出，关闭空闲的长连接，不阻塞
+        '''
+        requests, self._requests = self._requests, None
+        if requests is None:
+            return
+        _running_pools.discard(self)
+        self._parked.close()
+        #关闭还在排队的连接，空出位置放入退出标记，工作线程取到退出标记后放回，依次通知其它工作线程
+        while 1:
+            try:
+                item = requests.get_nowait()
+            except Queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        try:
+            requests.put_nowait(None)
+        except Queue.Full: #停止后又有连接放入队列，工作线程处理完后发现服务器已停止而退出
+            pass
+    
+    def _worker_thread(self):
+        '''工作线程
+        '''
+        requests = self._requests
+        parked = self._parked
+        while 1:
+            item = requests.get()
+            if item is None:
+                try:
+                    requests.put_nowait(None)
+                except Queue.Full:
+                    pass
+                break
+            request, client_address = item
+            handler = None
+            try:
+                handler = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            if getattr(handler, "parked", False):
+                parked.park(request, client_address)
+            else:
+                self.shutdown_request(request)
+            if self._requests is not requests: #服务器已停止
+                break
+                
+    def finish_request(self, request, client_address ):
+        '''处理连接，返回处理句柄
+        '''
+        return self.RequestHandlerClass(request, client_address, self)
+        
+    def wait_request(self, request ):
+        '''在长连接上等待下一个请求最多park_delay秒，由处理句柄在请求之间调用
+        
+        :returns: 是否有新的数据，否则处理句柄应当设置parked属性为True并返回，连接交还给等待线程
+        '''
+        try:
+            readable, _, _ = select.select([request], [], [], self.park_delay)
+        except select.error:
+            return True
+        return bool(readable)
+            
+    def process_request(self, request, client_address):
+        '''把连接放入队列，由工作线程处理
+        '''
+        if self._requests is None:
+            self.start_workers()
+        self.resume_request(request, client_address)
+        
+    def resume_request(self, request, client_address ):
+        '''把新连接或者有新请求的长连接放入队列
+        '''
+        requests = self._requests
+        if requests is None: #服务器已停止
+            self.shutdown_request(request)
+            return
+        try:
+            requests.put_nowait((request, client_address))
+        except Queue.Full:
+            logger.warning("request queue is full, connection from %r is dropped" % (client_address,))
+            self.shutdown_request(request)
+            
+#启动了工作线程的服务器，进程退出时停止，避免线程在解释器清理模块后继续运行而出错
+_running_pools = weakref.WeakSet()
+
+@atexit.register
+def _stop_running_pools():
+    servers = list(_running_pools)
+    for server in servers:
+        server.stop_workers()
+    deadline = time.time() + 1
+    for server in servers:
+        for worker in server._workers:
+            worker.join(max(deadline - time.time(), 0))
+            
+class SimpleJSONRPCServer(ThreadPoolMixIn,
+                          UnixSocketMixIn,
+                          SocketServer.TCPServer,
                           SimpleJSONRPCDispatcher):
     '''简单的JSON-RPC服务器
+    
+    连接由有界的工作线程池并发处理，避免一个客户端的长连接或慢请求阻塞其他客户端；
+    addr为字符串时监听该路径的unix domain socket
     '''
     
     def __init__(self, addr, requestHandler=SimpleJSONRPCRequestHandler,
-                 logRequests=True, bind_and_activate=True):
+                 logRequests=True, bind_and_activate=True,
+                 max_workers=8, max_queue=32):
         self.logRequests = logRequests
+        self.max_workers = max_workers
+        self.max_queue = max_queue
         SimpleJSONRPCDispatcher.__init__(self)
         self.allow_reuse_address=True
+        self.init_address_family(addr)
         SocketServer.TCPServer.__init__(self, addr, requestHandler, bind_and_activate)
         
+    def server_close(self):
+        SocketServer.TCPServer.server_close(self)
+        self.remove_socket_file()
+        self.stop_workers()
+        
 MAX_BUFSIZE=4096
 
 class rpc_method():
@@ -503,60 +1523,137 @@ class rpc_method():
     def __call__(self,*argv,**kwargs):
         return self.func(*argv,**kwargs)
 
+def _dispatch_frame(server, data ):
+    '''分发一帧请求，返回应答帧数据，没有应答时返回None
+    
+    帧数据以编解码器ID开头时，后面为该编解码器序列化的请求包，应答帧数据同样以编解码器ID开头；
+    否则为旧的帧格式，帧数据为JSON编码的请求包字符串，应答帧数据为应答包，帧数据无法解析时
+    返回解析错误
+    '''
+    codec = server.codecs.get(data[:1])
+    if codec is None:
+        try:
+            request = json.loads(data)#处理json转义
+        except ValueError:
+            request = None
+        if not isinstance(request, basestring):
+            return JSON_CODEC.dumps(server._error_response(None, ParseError.PREDEFINE_CODE, "invalid frame data"))
+        return server.marshaled_dispatch(request)
+    result = server.marshaled_dispatch(data[1:], codec)
+    if result is None:
+        return None
+    return codec.codec_id + result
+    
 class TCPJsonRPCHandler(SocketServer.StreamRequestHandler):
+    '''处理长度前缀分帧的JSON-RPC请求
+    
+    每帧由4字节网络字节序的帧长度（含帧头）和帧数据组成，帧数据的格式见_dispatch_frame，
+    一次读取可以包含多个帧
+    '''
+    #连接是否已交还给服务器等待下一个请求，见ThreadPoolMixIn
+    parked = False
+    
+    def setup(self):
+        _set_nodelay(self.request)
+        SocketServer.StreamRequestHandler.setup(self)
+        
     def handle(self):
-        recv_buf=""
+        wait_request = getattr(self.server, "wait_request", None)
+        buf = bytearray(MAX_BUFSIZE)
+        start = end = 0 #buf[start:end]为未处理的数据
         while 1:
+            if end == len(buf):
+                if start > 0: #把未处理的数据移到缓冲区头部
+                    buf[:end - start] = buf[start:end]
+                    end -= start
+                    start = 0
+                else: #单帧超过缓冲区大小
+                    buf.extend(bytearray(len(buf)))
             try:
-                r,_,x=select.select([self.request],[],[self.request],1)
-                if len(r)>0:
-                    data=self.request.recv(MAX_BUFSIZE)
-                    if data=="":
-                        self.request.close()
-                        break
-                    recv_buf+=data
-                    if recv_buf>=4:
-                        expect_len=struct.unpack("!I",recv_buf[0:4])[0]
-                        if len(recv_buf)>=expect_len:
-                            real_data=json.loads(recv_buf[4:expect_len])#处理json转义
-                            result=self.server.marshaled_dispatch(real_data)
-                            self.request.send(struct.pack("!I",len(result)+4)+result)
-                            recv_buf=recv_buf[expect_len:]
-                        if self.server.logRequests:
-                            logger.info("msg form %s:%s"  % (self.client_address,real_data))
-                            logger.info("result:%s" % result)
-                if len(x)>0:
-                    self.request.close()
-                    break
-            except Exception as e:
+                size = self.request.recv_into(memoryview(buf)[end:])
+            except socket.error as e:
                 logger.info("error:%s",str(e))
                 break
+            if size == 0:
+                break
+            end += size
+            
+            responses = []
+            while end - start >= FRAME_HEADER.size:
+                expect_len = FRAME_HEADER.unpack_from(buf, start)[0]
+                if expect_len < FRAME_HEADER.size:
+                    logger.info("error:invalid frame length %s from %s" % (expect_len, self.client_address))
+                    return
+                if end - start < expect_len:
+                    if start + expect_len > len(buf) and start > 0:
+                        buf[:end - start] = buf[start:end]
+                        end -= start
+                        start = 0
+                    while expect_len > len(buf):
+                        buf.extend(bytearray(len(buf)))
+                    break
+                real_data = bytes(buf[start + FRAME_HEADER.size:start + expect_len])
+                start += expect_len
+                result = _dispatch_frame(self.server, real_data)
+                if result is not None:
+                    responses.append(FRAME_HEADER.pack(len(result) + FRAME_HEADER.size))
+                    responses.append(result)
+                if self.server.logRequests:
+                    logger.info("msg form %s:%r"  % (self.client_address,real_data))
+                    logger.info("result:%r" % result)
+            if start == end:
+                start = end = 0
+            if responses:
+                try:
+                    self.request.sendall(b"".join(responses))
+                except socket.error as e:
+                    logger.info("error:%s",str(e))
+                    break
+            if start == end and wait_request is not None and not wait_request(self.request):
+                self.parked = True #没有未处理的数据，连接空闲时交还给服务器
+                return
     
 class UDPJsonRPCHandler(SocketServer.DatagramRequestHandler):
     def handle(self):
-        data=self.packet[4:]
-        real_data=json.loads(data)#处理json转义
-        result=self.server.marshaled_dispatch(real_data)
-        self.socket.sendto(struct.pack("!I",len(result)+4)+result,self.client_address)
+        real_data=self.packet[4:]
+        result=_dispatch_frame(self.server, real_data)
+        if result is not None:
+            self.socket.sendto(struct.pack("!I",len(result)+4)+result,self.client_address)
         if self.server.logRequests:
-            logger.info("msg form %s:%s"  % (self.client_address,real_data))
-            logger.info("result:%s" % result)
+            logger.info("msg form %s:%r"  % (self.client_address,real_data))
+            logger.info("result:%r" % result)
+            
+    def finish(self):
+        pass #response is sent in handle, DatagramRequestHandler would send an extra empty datagram
         
-class TCPJsonRPCServer(SocketServer.TCPServer,SimpleJSONRPCDispatcher):
-    '''简单的JSON-RPC服务器
+class TCPJsonRPCServer(ThreadPoolMixIn,UnixSocketMixIn,SocketServer.TCPServer,SimpleJSONRPCDispatcher):
+    '''简单的JSON-RPC服务器，addr为字符串时监听该路径的unix domain socket
+    
+    allow_marshal为True时也接受marshal编码的帧，marshal解码不可信的数据不安全，只能用于
+    监听本机地址或unix domain socket的可信环境
     '''
     
     def __init__(self, addr, requestHandler=TCPJsonRPCHandler,
-                 logRequests=False, bind_and_activate=True):
+                 logRequests=False, bind_and_activate=True,
+                 max_workers=8, max_queue=32, allow_marshal=False):
         self.logRequests = logRequests
+        self.max_workers = max_workers
+        self.max_queue = max_queue
         SimpleJSONRPCDispatcher.__init__(self)
+        if allow_marshal:
+            self.codecs[MARSHAL_CODEC.codec_id] = MARSHAL_CODEC
         for name in dir(requestHandler):
             item=getattr(requestHandler,name)
             if isinstance(item, rpc_method):
                 self.register_function(item.func)
         self.allow_reuse_address=True
+        self.init_address_family(addr)
         SocketServer.TCPServer.__init__(self, addr, requestHandler, bind_and_activate)
         
+    def server_close(self):
+        SocketServer.TCPServer.server_close(self)
+        self.remove_socket_file()
+        self.stop_workers()
         
     def stop(self):
         self.shutdown()
@@ -0,0 +1,208 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''UI mirror
+
+Client side copy of the window trees of an app, kept in sync by the
+changes reported by test stub method `get_changes`. The mirror can be used
+in place of the driver: reads and locator queries are answered locally,
+other calls are forwarded to the driver::
+
+    class MainWindow(Window):
+        NAME = "Main"
+        USE_MIRROR = True
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import threading
+import time
+
+from qt4x.controls import CONTROL_EXPIRED_ERROR
+from qt4x.jsonrpc import Error
+from qt4x.qpath import QPath
+from qt4x.snapshot import TreeSnapshot, _to_unicode
+
+class UIMirror(object):
+    '''mirror of app window trees
+
+    The mirror is synced with one `get_changes` call before a read, if a call
+    was forwarded to the driver since the last sync (it may change the UI),
+    or if the last sync is older than `max_age` seconds. Reads in between,
+    attribute reads included, are answered without RPC, so they may miss
+    changes the app makes on its own within `max_age`.
+    '''
+    max_age = 0.2
+
+    def __init__(self, driver, window_names=None, encoding="utf8" ):
+        '''constructor
+
+        :param driver: test driver
+        :param window_names: names of windows to mirror, all windows if None
+        :param encoding: encoding of byte strings in results, same as `ServerProxy`
+        '''
+        self._driver = driver
+        self._window_names = list(window_names) if window_names is not None else None
+        self._encoding = encoding
+        self._lock = threading.RLock()
+        self._version = None
+        self._windows = {} #window name -> TreeSnapshot
+        self._curr_window = None
+        self._sync_time = 0
+        self._dirty = True
+
+    @property
+    def version(self):
+        '''UI tree version of the last sync
+        '''
+        return self._version
+
+    @property
+    def current_window(self):
+        '''name of current top window
+        '''
+        self._ensure_synced()
+        return self._curr_window
+
+    def sync(self):
+        '''apply changes since the last sync
+
+        :returns: whether UI is changed
+        '''
+        with self._lock:
+            result = self._driver.get_changes(self._version, self._window_names)
+            for change in result["changes"]:
+                self._apply(change)
+            changed = result["version"] != self._version
+            self._version = result["version"]
+            self._sync_time = time.time()
+            self._dirty = False
+            return changed
+
+    def invalidate(self):
+        '''sync before next read, called after actions which may change UI and are not sent through the mirror
+        '''
+        self._dirty = True
+
+    def _apply(self, change ):
+        kind = change[0]
+        if kind == "window":
+            name = _to_unicode(change[1], self._encoding)
+            if change[2] is None:
+                self._windows.pop(name, None)
+            else:
+                self._windows[name] = TreeSnapshot({"version": None, "root": change[2]}, self._encoding)
+        elif kind == "attr":
+            snapshot = self._find_snapshot(change[1])
+            if snapshot is not None:
+                snapshot.set_attr(change[1], change[2], change[3])
+        elif kind == "render":
+            self._curr_window = _to_unicode(change[1], self._encoding)
+        elif kind == "reset":
+            self._windows = {}
+            self._curr_window = None
+
+    def _ensure_synced(self):
+        if self._dirty or time.time() - self._sync_time > self.max_age:
+            self.sync()
+
+    def _find_snapshot(self, control_id ):
+        for snapshot in self._windows.values():
+            if control_id in snapshot:
+                return snapshot
+        return None
+
+    def _get_snapshot(self, control_id ):
+        '''get snapshot of window containing control, synced
+        '''
+        self._ensure_synced()
+        snapshot = self._find_snapshot(control_id)
+        if snapshot is None:
+            raise Error(CONTROL_EXPIRED_ERROR, "control %s is expired" % control_id, None)
+        return snapshot
+
+    def _is_mirrored(self, name ):
+        return self._window_names is None or name in self._window_names
+
+    def get_window_by_name(self, name ):
+        '''get window by name
+        '''
+        if not self._is_mirrored(name):
+            return self._driver.get_window_by_name(name)
+        with self._lock:
+            self._ensure_synced()
+            snapshot = self._windows.get(_to_unicode(name, self._encoding))
+            return snapshot.root_id if snapshot is not None else None
+
+    def find_controls_by_name(self, parent_id, name ):
+        '''find controls by name
+        '''
+        with self._lock:
+            return self._get_snapshot(parent_id).find_controls_by_name(parent_id, name)
+
+    def find_controls(self, parent_id, qpath_locator ):
+        '''find controls by QPath
+        '''
+        if isinstance(qpath_locator, QPath):
+            qpath_locator = qpath_locator.selectors
+        with self._lock:
+            return self._get_snapshot(parent_id).find_controls(parent_id, qpath_locator)
+
+    def get_control_children(self, control_id ):
+        '''get control direct children
+        '''
+        with self._lock:
+            return self._get_snapshot(control_id).get_children(control_id)
+
+    def get_control_attr(self, control_id, name ):
+        '''get control attribute
+        '''
+        with self._lock:
+            return self._get_snapshot(control_id).get_attr(control_id, name)
+
+    def get_control_attr_versioned(self, control_id, name, version=None ):
+        '''get control attribute together with UI tree version, same as test stub method
+        '''
+        with self._lock:
+            value = self.get_control_attr(control_id, name)
+            if version == self._version:
+                return [self._version]
+            return [self._version, value]
+
+    def get_ui_version(self):
+        '''get UI tree version
+        '''
+        with self._lock:
+            self._ensure_synced()
+            return self._version
+
+    def __getattr__(self, name ):
+        '''forward other test stub methods to driver, mirror is synced before next read
+        '''
+        method = getattr(self._driver, name)
+        def _forward(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._dirty = True
+        return _forward
+
+    def __call__(self, attr ):
+        '''special attributes of driver, such as "notify" and "batch_request"
+        '''
+        self._dirty = True
+        return self._driver(attr)
+
+    def __repr__(self):
+        return "<UIMirror of %r>" % self._driver
@@ -16,16 +16,47 @@
 '''
 from __future__ import print_function, unicode_literals, absolute_import
 
+import collections
+import threading
+
 from tuia.qpathparser import QPathParser
 
+#process-wide cache of parsed QPath, keyed by QPath string, least recently used first
+_parsed_cache = collections.OrderedDict()
+_parsed_cache_lock = threading.Lock()
+
+#max number of QPath strings in cache, QPath strings built at run time (e.g. from
+#control names) would otherwise grow the cache for the life of the process
+PARSED_CACHE_SIZE = 1024
+
 class QPath(object):
     '''QPath
+
+    The QPath string is parsed once per process while it stays in the cache of
+    the recently used `PARSED_CACHE_SIZE` strings, QPath objects with the same
+    string share the parsed result, which must not be modified.
     '''
     def __init__(self, qpath_string ):
         self._qpath_string = qpath_string
+        self._parsed = None
         
     def dumps(self):
         '''serialize
         '''
-        return QPathParser().parse(self._qpath_string)
-        
+        if self._parsed is None:
+            with _parsed_cache_lock:
+                parsed = _parsed_cache.pop(self._qpath_string, None)
+            if parsed is None:
+                parsed = QPathParser().parse(self._qpath_string)
+            with _parsed_cache_lock:
+                _parsed_cache[self._qpath_string] = parsed
+                while len(_parsed_cache) > PARSED_CACHE_SIZE:
+                    _parsed_cache.popitem(last=False)
+            self._parsed = parsed
+        return self._parsed
+    
+    @property
+    def selectors(self):
+        '''parsed selector list, ready to be sent to test stub
+        '''
+        return self.dumps()[0]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''客户端RPC调用统计
+
+开启后ServerProxy按方法记录调用次数、失败次数、发送和接收的字节数以及耗时分布，关闭时
+每次调用只多一次属性访问::
+
+    from qt4x import rpcstats
+    rpcstats.enable()
+    ...
+    print(rpcstats.format_summary())
+
+也可以设置环境变量QT4X_RPC_STATS开启，进程退出时输出统计：值为1时输出表格到stderr，
+否则作为JSON文件路径，路径中的{pid}替换为进程ID。qt4x.app.App启动的被测应用进程只在路径
+包含{pid}时继承该环境变量
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import atexit
+import bisect
+import json
+import os
+import sys
+import threading
+
+STATS_ENV = "QT4X_RPC_STATS"
+
+#耗时分布的桶上界（毫秒），最后一个桶为超出最大上界的调用
+BUCKET_BOUNDS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+class MethodStats(object):
+    '''单个方法的调用统计
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def add(self, bytes_sent, bytes_received, elapsed, succeeded ):
+        self.calls += 1
+        if not succeeded:
+            self.errors += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.histogram[bisect.bisect_left(BUCKET_BOUNDS_MS, elapsed * 1000)] += 1
+
+    def percentile(self, percent ):
+        '''按耗时分布估计的百分位耗时（毫秒），为所在桶的上界
+        '''
+        if not self.calls:
+            return 0.0
+        rank = self.calls * percent / 100.0
+        count = 0
+        for i, it in enumerate(self.histogram):
+            count += it
+            if count >= rank:
+                break
+        if i < len(BUCKET_BOUNDS_MS):
+            return min(BUCKET_BOUNDS_MS[i], self.max_time * 1000)
+        return self.max_time * 1000
+
+    def to_dict(self):
+        return {"calls": self.calls,
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "total_ms": self.total_time * 1000,
+                "max_ms": self.max_time * 1000,
+                "p50_ms": self.percentile(50),
+                "p99_ms": self.percentile(99),
+                "histogram": self.histogram[:]}
+
+class RPCStats(object):
+    '''按方法名汇总的调用统计，线程安全
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def record(self, method, bytes_sent, bytes_received, elapsed, succeeded=True ):
+        '''记录一次调用
+
+        :param method: 方法名
+        :type method: string
+        :param bytes_sent: 请求包字节数
+        :type bytes_sent: int
+        :param bytes_received: 应答包字节数
+        :type bytes_received: int
+        :param elapsed: 耗时（秒）
+        :type elapsed: float
+        :param succeeded: 调用是否成功
+        :type succeeded: bool
+        '''
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.add(bytes_sent, bytes_received, elapsed, succeeded)
+
+    def clear(self):
+        with self._lock:
+            self._methods = {}
+
+    def snapshot(self):
+        '''获取当前统计
+
+        :returns: dict - 方法名 -> 统计项，耗时单位为毫秒
+        '''
+        with self._lock:
+            return dict((name, it.to_dict()) for name, it in self._methods.items())
+
+    def format_summary(self):
+        '''格式化为表格，按总耗时降序
+        '''
+        lines = ["%-32s %8s %6s %12s %12s %10s %8s %8s %8s %8s" % (
+                 "method", "calls", "errors", "sent", "received", "total ms", "mean ms", "p50 ms", "p99 ms", "max ms")]
+        items = sorted(self.snapshot().items(), key=lambda it: it[1]["total_ms"], reverse=True)
+        for name, it in items:
+            lines.append("%-32s %8d %6d %12d %12d %10.1f %8.2f %8.2f %8.2f %8.2f" % (
+                         name, it["calls"], it["errors"], it["bytes_sent"], it["bytes_received"],
+                         it["total_ms"], it["total_ms"] / it["calls"], it["p50_ms"], it["p99_ms"], it["max_ms"]))
+        return "\n".join(lines)
+
+#当前生效的统计，为None时不统计
+active = None
+
+_dump_target = None
+_atexit_registered = False
+
+def enable( dump_to=None ):
+    '''开启统计，已经开启时保留已有的统计
+
+    :param dump_to: 进程退出时的输出目标，"-"表示以表格输出到stderr，其它值为JSON文件路径，
+                    None表示不输出
+    :type dump_to: string
+    :returns: RPCStats
+    '''
+    global active, _dump_target, _atexit_registered
+    if active is None:
+        active = RPCStats()
+    if dump_to is not None:
+        _dump_target = dump_to
+        if not _atexit_registered:
+            atexit.register(_dump_at_exit)
+            _atexit_registered = True
+    return active
+
+def disable():
+    '''关闭统计，返回关闭前的统计
+
+    :returns: RPCStats or None
+    '''
+    global active
+    stats, active = active, None
+    return stats
+
+def get_stats():
+    '''获取当前统计，未开启时返回None
+
+    :returns: RPCStats or None
+    '''
+    return active
+
+def snapshot():
+    '''获取当前统计，未开启时返回空字典
+    '''
+    stats = active
+    return stats.snapshot() if stats is not None else {}
+
+def format_summary():
+    '''格式化当前统计
+    '''
+    stats = active
+    return stats.format_summary() if stats is not None else ""
+
+def dump( target ):
+    '''输出当前统计
+
+    :param target: "-"表示以表格输出到stderr，其它值为JSON文件路径，路径中的{pid}替换为进程ID
+    :type target: string
+    '''
+    if target == "-":
+        sys.stderr.write("RPC stats of process %s:\n%s\n" % (os.getpid(), format_summary()))
+    else:
+        with open(target.replace("{pid}", str(os.getpid())), "wb") as fd:
+            json.dump(snapshot(), fd, indent=2, sort_keys=True)
+
+def _dump_at_exit():
+    if active is not None and _dump_target is not None:
+        dump(_dump_target)
+
+def _enable_from_env():
+    target = os.environ.get(STATS_ENV)
+    if target:
+        enable("-" if target == "1" else target)
+
+_enable_from_env()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''RPC会话的录制和回放
+
+开启录制后，ServerProxy发出的和SimpleJSONRPCDispatcher处理的每个请求包及其应答包都记录到
+gzip压缩的trace文件中，每行一条JSON记录::
+
+    [开始时间（相对于录制开始的秒数）, 耗时（秒）, "client"或"server", 请求包, 应答包]
+
+第一行为文件头。应答包在通知或调用失败时为null。录制可以通过`start`开启，也可以设置环境
+变量QT4X_RPC_TRACE为trace文件路径开启，路径中的{pid}替换为进程ID。qt4x.app.App启动的被测
+应用进程只在路径包含{pid}时继承该环境变量，记录服务端的trace。
+
+回放按原速或最快速度把trace中的调用依次重新发给被测应用::
+
+    python -m qt4x.rpctrace show trace.gz
+    python -m qt4x.rpctrace replay trace.gz http://127.0.0.1:12345 --speed 0
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import argparse
+import atexit
+import collections
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+TRACE_ENV = "QT4X_RPC_TRACE"
+TRACE_VERSION = 1
+
+class TraceRecorder(object):
+    '''trace文件写入者，线程安全
+    '''
+    def __init__(self, path ):
+        '''构造函数
+
+        :param path: trace文件路径，路径中的{pid}替换为进程ID
+        :type path: string
+        '''
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._fd = gzip.open(self.path, "wb")
+        self._write({"version": TRACE_VERSION, "pid": os.getpid(), "start_time": self._start_time})
+
+    def _write(self, obj ):
+        self._fd.write(json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf8") + b"\n")
+
+    def record(self, side, start_time, elapsed, request, response ):
+        '''记录一次调用
+
+        :param side: "client"或"server"
+        :type side: string
+        :param start_time: 调用开始时间
+        :type start_time: float
+        :param elapsed: 耗时（秒）
+        :type elapsed: float
+        :param request: 反序列化的请求包
+        :param response: 反序列化的应答包，没有应答包时为None
+        '''
+        with self._lock:
+            if self._fd is None:
+                return
+            self._write([round(start_time - self._start_time, 6), round(elapsed, 6), side, request, response])
+            #被测应用进程可能被直接杀掉，每条记录都同步刷新到文件，压缩字典不受影响
+            self._fd.flush()
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._fd.close()
+                self._fd = None
+
+#当前生效的录制，为None时不录制
+active = None
+
+_lock = threading.Lock()
+_atexit_registered = False
+
+def start( path ):
+    '''开启录制，已经在录制时先结束之前的录制
+
+    :param path: trace文件路径，路径中的{pid}替换为进程ID
+    :type path: string
+    :returns: TraceRecorder
+    '''
+    global active, _atexit_registered
+    with _lock:
+        recorder, active = active, TraceRecorder(path)
+        if not _atexit_registered:
+            atexit.register(stop)
+            _atexit_registered = True
+    if recorder is not None:
+        recorder.close()
+    return active
+
+def stop():
+    '''结束录制
+
+    :returns: string - trace文件路径，没有在录制时返回None
+    '''
+    global active
+    with _lock:
+        recorder, active = active, None
+    if recorder is None:
+        return None
+    recorder.close()
+    return recorder.path
+
+def load( path ):
+    '''读取trace文件
+
+    :returns: tuple - (文件头, 按开始时间排序的记录列表)
+    '''
+    with open(path, "rb") as fd:
+        data = fd.read()
+    #录制进程被杀掉时gzip数据流没有结尾，只解压已刷新的数据
+    data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+    lines = data.decode("utf8").splitlines()
+    if not lines:
+        raise ValueError("empty trace file %s" % path)
+    header = json.loads(lines[0])
+    if header.get("version") != TRACE_VERSION:
+        raise ValueError("unsupported trace version %r" % header.get("version"))
+    records = [ json.loads(it) for it in lines[1:] if it ]
+    records.sort(key=lambda it: it[0])
+    return header, records
+
+def _iter_calls( request ):
+    '''遍历请求包中的调用，batch请求包含多个调用
+    '''
+    if isinstance(request, list):
+        return request
+    return [request]
+
+def _call_key( call ):
+    return call.get("method"), json.dumps(call.get("params"), sort_keys=True)
+
+def summarize( records ):
+    '''统计各方法的调用次数，以及重复调用次数（和同一方法上一次参数相同、结果也相同的调用）
+
+    :returns: dict - 方法名 -> {"calls": 调用次数, "repeated": 重复调用次数}
+    '''
+    summary = {}
+    last_results = {}
+    responses = {}
+    for _, _, _, request, response in records:
+        responses.clear()
+        for it in _iter_calls(response or []):
+            if isinstance(it, dict):
+                responses[it.get("id")] = it.get("result")
+        for call in _iter_calls(request):
+            item = summary.setdefault(call.get("method"), {"calls": 0, "repeated": 0})
+            item["calls"] += 1
+            if "id" not in call or call["id"] not in responses:
+                continue
+            key = _call_key(call)
+            result = responses[call["id"]]
+            if key in last_results and last_results[key] == result:
+                item["repeated"] += 1
+            last_results[key] = result
+    return summary
+
+class _HandleMap(object):
+    '''把trace中的结果值映射为回放时的结果值，用于替换之后调用参数中的控件ID等
+    '''
+    def __init__(self):
+        self._map = {}
+
+    def learn(self, recorded, replayed ):
+        if isinstance(recorded, list) and isinstance(replayed, list) and len(recorded) == len(replayed):
+            for it in zip(recorded, replayed):
+                self.learn(*it)
+        elif isinstance(recorded, (int, long)) and not isinstance(recorded, bool) \
+                and isinstance(replayed, (int, long)) and recorded != replayed:
+            self._map[recorded] = replayed
+
+    def apply(self, params ):
+        if not self._map:
+            return params
+        if isinstance(params, list):
+            return [ self.apply(it) for it in params ]
+        if isinstance(params, dict):
+            return dict((key, self.apply(value)) for key, value in params.items())
+        if isinstance(params, (int, long)) and not isinstance(params, bool):
+            return self._map.get(params, params)
+        return params
+
+ReplayResult = collections.namedtuple("ReplayResult", ["calls", "errors", "mismatches", "elapsed", "recorded_elapsed"])
+
+def replay( path, uri, speed=1.0, side=None, remap=True ):
+    '''按trace文件中的顺序重新发起调用，调用依次发出，不重现原来的并发
+
+    :param path: trace文件路径
+    :type path: string
+    :param uri: 被测应用的RPC URL
+    :type uri: string
+    :param speed: 相对原速的倍数，0表示以最快速度回放
+    :type speed: float
+    :param side: 回放"client"或"server"侧的记录，默认为"client"，trace中没有客户端记录时为"server"
+    :type side: string
+    :param remap: 是否把之后调用参数中的trace结果值（如控件ID）替换为回放时的结果值
+    :type remap: bool
+    :returns: ReplayResult
+    '''
+    from qt4x.jsonrpc import ServerProxy, Error
+
+    _, records = load(path)
+    if side is None:
+        side = "client" if any(it[2] == "client" for it in records) else "server"
+    records = [ it for it in records if it[2] == side ]
+    proxy = ServerProxy(uri, encoding=None)
+    handles = _HandleMap()
+    calls = errors = mismatches = 0
+
+    first_offset = records[0][0] if records else 0
+    time0 = time.time()
+    for offset, _, _, request, response in records:
+        if speed:
+            delay = (offset - first_offset) / speed - (time.time() - time0)
+            if delay > 0:
+                time.sleep(delay)
+        requests = _iter_calls(request)
+        if remap:
+            requests = [ dict(it, params=handles.apply(it["params"])) if "params" in it else it for it in requests ]
+        expected = {}
+        for it in _iter_calls(response or []):
+            if isinstance(it, dict):
+                expected[it.get("id")] = it
+        calls += len(requests)
+        notifications = [ it for it in requests if "id" not in it ]
+        for it in notifications:
+            getattr(proxy("notify"), it["method"])(*_positional(it), **_named(it))
+        requests = [ it for it in requests if "id" in it ]
+        if not requests:
+            continue
+        if isinstance(request, list):
+            results = proxy("batch_request")([ (it["method"], it.get("params", [])) for it in requests ])
+        else:
+            try:
+                results = [getattr(proxy, requests[0]["method"])(*_positional(requests[0]), **_named(requests[0]))]
+            except Error, e:
+                results = [e]
+        for call, result in zip(requests, results):
+            recorded = expected.get(call["id"], {})
+            if isinstance(result, Error):
+                errors += 1
+                if "error" not in recorded:
+                    mismatches += 1
+                continue
+            if remap:
+                handles.learn(recorded.get("result"), result)
+            if "result" not in recorded or handles.apply(recorded["result"]) != result:
+                mismatches += 1
+    elapsed = time.time() - time0
+    recorded_elapsed = records[-1][0] + records[-1][1] - records[0][0] if records else 0
+    return ReplayResult(calls, errors, mismatches, elapsed, recorded_elapsed)
+
+def _positional( call ):
+    params = call.get("params", [])
+    return params if isinstance(params, list) else []
+
+def _named( call ):
+    params = call.get("params", {})
+    return dict((str(key), value) for key, value in params.items()) if isinstance(params, dict) else {}
+
+def _enable_from_env():
+    path = os.environ.get(TRACE_ENV)
+    if path:
+        start(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="show or replay RPC traces")
+    subparsers = parser.add_subparsers(dest="command")
+    show_parser = subparsers.add_parser("show", help="show calls per method and repeated calls")
+    show_parser.add_argument("trace")
+    replay_parser = subparsers.add_parser("replay", help="replay calls against an app")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("uri", help="RPC URL of app, e.g. http://127.0.0.1:12345")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="speed relative to recording, 0 for max speed")
+    replay_parser.add_argument("--side", choices=["client", "server"], help="side of records to replay")
+    replay_parser.add_argument("--no-remap", action="store_true", help="do not replace recorded control IDs in params")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        header, records = load(args.trace)
+        print("trace of process %s, %d records" % (header["pid"], len(records)))
+        summary = summarize([ it for it in records if it[2] == "client" ] or records)
+        print("%-32s %8s %8s" % ("method", "calls", "repeated"))
+        for name, it in sorted(summary.items(), key=lambda it: it[1]["calls"], reverse=True):
+            print("%-32s %8d %8d" % (name, it["calls"], it["repeated"]))
+    else:
+        result = replay(args.trace, args.uri, args.speed, args.side, not args.no_remap)
+        print("%d calls, %d errors, %d results differ from trace, replayed in %.3fs (recorded %.3fs)" % result)
+
+_enable_from_env()
+
+if __name__ == '__main__':
+    main()
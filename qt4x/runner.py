@@ -0,0 +1,138 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Parallel test runner
+
+Tests are run by a pool of worker processes, each worker launches its own
+app instances (on ephemeral ports, or unix domain sockets), and results of
+all workers are logged to one report::
+
+    from testbase.report import StreamTestReport
+    from qt4x.runner import ShardedTestRunner
+    ShardedTestRunner(StreamTestReport(), process_cnt=4).run("qt4x.demotest")
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import os
+
+from testbase.runner import MultiProcessTestRunner
+
+DEFAULT_HISTORY_FILE = ".qt4x_durations.json"
+
+def load_durations( path ):
+    '''load test durations recorded by previous runs
+
+    :returns: dict - test name -> seconds
+    '''
+    try:
+        with open(path, "rb") as fd:
+            durations = json.load(fd)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(durations, dict):
+        return {}
+    return durations
+
+def save_durations( path, durations ):
+    '''save test durations, replacing the file atomically
+    '''
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fd:
+        json.dump(durations, fd, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+def sort_by_duration( tests, durations ):
+    '''sort tests in descending order of historical duration, tests never run are
+    estimated to take the average duration
+
+    Workers take tests from the head of the queue when idle, so running the
+    longest tests first balances the total duration of each worker.
+    '''
+    known = [ durations[it.test_name] for it in tests if it.test_name in durations ]
+    estimate = sum(known) / len(known) if known else 0
+    return sorted(tests, key=lambda it: durations.get(it.test_name, estimate), reverse=True)
+
+class _DurationRecordingReport(object):
+    '''report wrapper recording duration of each test result
+    '''
+    def __init__(self, report, durations ):
+        self._report = report
+        self._durations = durations
+
+    def log_test_result(self, testcase, testresult ):
+        self._report.log_test_result(testcase, testresult)
+        begin_time, end_time = testresult.begin_time, testresult.end_time
+        if begin_time is not None and end_time is not None:
+            self._durations[testcase.test_name] = end_time - begin_time
+
+    def __getattr__(self, name ):
+        return getattr(self._report, name)
+
+class ShardedTestRunner(MultiProcessTestRunner):
+    '''run tests in worker processes, balanced by historical test durations
+    '''
+    def __init__(self, report, process_cnt=0, retries=0, resmgr_backend=None,
+                 history_file=DEFAULT_HISTORY_FILE ):
+        '''constructor
+
+        :param report: test report
+        :type report: ITestReport
+        :param process_cnt: number of worker processes, defaults to CPU count
+        :type process_cnt: int
+        :param retries: max retries of failed test
+        :type retries: int
+        :param history_file: file of test durations, updated after each run
+        :type history_file: string
+        '''
+        super(ShardedTestRunner, self).__init__(report, process_cnt, retries, resmgr_backend,
+                                                execute_type="sequential")
+        self._history_file = history_file
+        self._durations = load_durations(history_file)
+        self._recording_report = _DurationRecordingReport(report, self._durations)
+
+    @property
+    def report(self):
+        '''test report, also recording test durations while running tests
+        '''
+        return self._recording_report
+
+    def run_all_tests(self, tests ):
+        '''run tests, longest first
+
+        :param tests: tests to run
+        :type tests: list
+        '''
+        try:
+            super(ShardedTestRunner, self).run_all_tests(sort_by_duration(tests, self._durations))
+        finally:
+            save_durations(self._history_file, self._durations)
+
+    @classmethod
+    def get_parser(cls):
+        '''get command line parser
+        '''
+        parser = super(ShardedTestRunner, cls).get_parser()
+        parser.add_argument("--history-file", default=DEFAULT_HISTORY_FILE,
+                            help="file of test durations used to balance workers")
+        return parser
+
+    @classmethod
+    def parse_args(cls, args_string, report, resmgr_backend, execute_type ):
+        '''construct runner from command line arguments, execute_type is ignored as
+        tests are always ordered by duration
+        '''
+        args = cls.get_parser().parse_args(args_string)
+        return cls(report, args.concurrency, args.retries, resmgr_backend, args.history_file)
@@ -0,0 +1,137 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Tree snapshot
+
+Read-only copy of a window element tree, fetched with one `dump_window_tree`
+call and queried locally.
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from xml.etree import ElementTree
+
+from qt4x import treequery
+from qt4x.qpath import QPath
+
+def _to_unicode( s, encoding ):
+    if encoding and isinstance(s, bytes):
+        return s.decode(encoding)
+    return s
+
+def _from_unicode( s, encoding ):
+    if encoding and isinstance(s, unicode):
+        return s.encode(encoding)
+    return s
+
+def _selectors_to_unicode( qpath_locator, encoding ):
+    selectors = []
+    for selector in qpath_locator:
+        processed_selector = {}
+        for k in selector:
+            op, val = selector[k]
+            processed_selector[_to_unicode(k, encoding)] = [_to_unicode(op, encoding), _to_unicode(val, encoding)]
+        selectors.append(processed_selector)
+    return selectors
+
+class TreeSnapshot(object):
+    '''snapshot of control tree
+    '''
+    def __init__(self, dump, encoding="utf8" ):
+        '''constructor
+
+        :param dump: result of test stub method `dump_window_tree`
+        :param encoding: encoding of byte strings in dump, queries and results, same as `ServerProxy`
+        '''
+        self._encoding = encoding
+        self._version = dump["version"]
+        self._elements = {} #control ID -> element
+        self._control_ids = {} #element -> control ID
+        self._root = self._load_node(dump["root"])
+
+    def _load_node(self, node ):
+        control_id, tag, attrib = node[:3]
+        elem = ElementTree.Element(_to_unicode(tag, self._encoding))
+        for k, v in attrib.items():
+            elem.set(_to_unicode(k, self._encoding), _to_unicode(v, self._encoding))
+        if len(node) > 3:
+            for it in node[3]:
+                elem.append(self._load_node(it))
+        self._elements[control_id] = elem
+        self._control_ids[elem] = control_id
+        return elem
+
+    def _get_element(self, control_id ):
+        try:
+            return self._elements[control_id]
+        except KeyError:
+            raise KeyError("control %s is not in snapshot" % control_id)
+
+    @property
+    def version(self):
+        '''UI tree version when the snapshot is taken
+        '''
+        return self._version
+
+    @property
+    def root_id(self):
+        '''control ID of snapshot root
+        '''
+        return self._control_ids[self._root]
+
+    def __contains__(self, control_id ):
+        return control_id in self._elements
+
+    def __len__(self):
+        return len(self._elements)
+
+    def get_tag(self, control_id ):
+        '''get control class
+        '''
+        return _from_unicode(self._get_element(control_id).tag, self._encoding)
+
+    def get_attr(self, control_id, name ):
+        '''get control attribute
+        '''
+        name = _to_unicode(name, self._encoding)
+        return _from_unicode(self._get_element(control_id).attrib.get(name), self._encoding)
+
+    def set_attr(self, control_id, name, value ):
+        '''update control attribute, used to keep a snapshot in sync with changes of test stub
+        '''
+        name = _to_unicode(name, self._encoding)
+        self._get_element(control_id).set(name, _to_unicode(value, self._encoding))
+
+    def get_children(self, control_id ):
+        '''get control direct children
+        '''
+        return [ self._control_ids[it] for it in self._get_element(control_id) ]
+
+    def find_controls_by_name(self, parent_id, name ):
+        '''find controls by name, same as test stub method `find_controls_by_name`
+        '''
+        root = self._get_element(parent_id)
+        name = _to_unicode(name, self._encoding)
+        return [ self._control_ids[it] for it in treequery.find_controls_by_name(root, name) ]
+
+    def find_controls(self, parent_id, qpath_locator ):
+        '''find controls by QPath, same as test stub method `find_controls`
+
+        :param qpath_locator: QPath, or its parsed selectors
+        '''
+        if isinstance(qpath_locator, QPath):
+            qpath_locator = qpath_locator.selectors
+        root = self._get_element(parent_id)
+        selectors = _selectors_to_unicode(qpath_locator, self._encoding)
+        return [ self._control_ids[it] for it in treequery.find_controls(root, selectors) ]
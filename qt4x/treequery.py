@@ -0,0 +1,103 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this 
+# file except in compliance with the License. You may obtain a copy of the License at
+# 
+# https://opensource.org/licenses/BSD-3-Clause
+# 
+# Unless required by applicable law or agreed to in writing, software distributed 
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Control lookup on `etree` element trees
+
+Shared by the test stub and client side tree snapshots, so that both
+resolve locators with the same semantics.
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import re
+
+def find_controls_by_name( root, name ):
+    '''find controls by name, root itself included
+    '''
+    controls = []
+    for it in root.iter():
+        if it.attrib.has_key("name") and it.attrib["name"] == name:
+            controls.append(it)
+    return controls
+
+def find_controls( root, qpath_locator, match=None ):
+    '''find controls by parsed QPath
+    
+    :param match: function matching one selector, defaults to `match_selector`
+    '''
+    if match is None:
+        match = match_selector
+    controls = [root]
+    for selector in qpath_locator:
+        if not controls: # not found!
+            break
+        next_controls = []
+        for it in controls:
+            next_controls += match(it, selector)
+        controls = next_controls
+    return controls
+
+def parse_selector( selector ):
+    '''split one QPath selector into attribute conditions, max depth and instance
+    
+    :returns: tuple - ({attribute: (op, value)}, maxdepth, instance)
+    '''
+    processed_selector = {}
+    for k in selector:
+        processed_selector[k.lower()] = selector[k]
+    selector = processed_selector        
+    if 'maxdepth' in selector:
+        maxdepth = selector.pop('maxdepth')[1]
+    else:
+        maxdepth = 1
+    if 'instance' in selector:
+        instance = selector.pop('instance')[1]
+    else:
+        instance = None
+    return selector, maxdepth, instance
+
+def match_element( elem, conditions ):
+    '''whether control matches all attribute conditions of a selector, "class" is the tag
+    '''
+    attr_dict = elem.attrib.copy()
+    attr_dict['class'] = elem.tag
+    for attr in conditions:
+        op, val = conditions[attr]
+        if not attr_dict.has_key(attr):
+            return False
+        if op == "=" and val != attr_dict[attr]:
+            return False
+        if op == "~=" and not re.match(val, attr_dict[attr]):
+            return False
+    return True
+
+def match_selector( root, selector ):
+    '''find controls under root matching one QPath selector
+    '''
+    conditions, maxdepth, instance = parse_selector(selector)
+    matched_controls = [ it for it in children_iter(root, maxdepth) if match_element(it, conditions) ]
+    if instance != None:
+        matched_controls = [matched_controls[instance]]
+    return matched_controls
+
+def children_iter( root, maxdepth ):
+    '''return child control iterator by max depth
+    '''
+    i = iter(root)
+    while 1:
+        elem = i.next()
+        yield elem
+        if maxdepth-1 > 0:
+            for it in children_iter(elem, maxdepth-1):
+                yield it
@@ -20,99 +20,608 @@ Fake UI framework, using `etree` as UI element tree.
 from __future__ import print_function, unicode_literals, absolute_import
 
 import collections
+import os
 import threading
+import time
 import StringIO
 from xml.etree import ElementTree
 
-from qt4x.jsonrpc import SimpleJSONRPCServer
+from qt4x import treequery
+from qt4x.jsonrpc import SimpleJSONRPCServer, Error
 from qt4x_sut.stub import StubService
 from qt4x_sut.event import EnumEvent
 
+#environment variable passing the fd of the readiness pipe from launcher, same as qt4x.app
+READY_FD_ENV = "QT4X_READY_FD"
+
+#environment variable passing launcher pid, app exits when launcher exits
+LAUNCHER_PID_ENV = "QT4X_LAUNCHER_PID"
+
 class MsgQueue(object):
     '''Message queue
+
+    Messages are (event, params) tuples. A message equal to a pending one is
+    dropped, and a message of a coalescing event replaces the pending message
+    of the same event, as only the last one matters. Both are found by key in
+    constant time, replaced messages are skipped when taken out of the queue.
+
+    A dropped duplicate leaves the pending message at its position, while a
+    replacing message is queued at the tail like any new message, so it is
+    still handled after every message put before it.
     '''
-    def __init__(self):
-        self._queue = collections.deque()
+    def __init__(self, coalesce_events=(EnumEvent.RenderWindow,) ):
+        '''constructor
+
+        :param coalesce_events: events of which only the last pending message is kept
+        '''
+        self._queue = collections.deque() #[msg, key, put time, alive]
+        self._pending = {} #key -> entry of pending message
+        self._depth = 0 #number of pending messages
+        self._coalesce_events = frozenset(coalesce_events)
         self._not_empty_cond = threading.Condition()
-        
+        self._stats = {"put": 0, "deduplicated": 0, "coalesced": 0, "got": 0,
+                       "max_depth": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def __len__(self):
+        return self._depth
+
     @property
     def empty(self):
         '''is queue empty
         '''
-        return not self._queue
-    
+        return not self._depth
+
+    def _get_key(self, msg ):
+        '''key identifying equal or superseded pending messages, None if message is not hashable
+        '''
+        event, params = msg
+        if event in self._coalesce_events:
+            return (event,)
+        try:
+            key = (event, tuple(sorted(params.items())) if isinstance(params, dict) else params)
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _take(self, max_count ):
+        '''take at most max_count pending messages, holding lock
+        '''
+        msgs = []
+        now = time.time()
+        stats = self._stats
+        while self._queue and len(msgs) < max_count:
+            msg, key, put_time, alive = self._queue.popleft()
+            if not alive:
+                continue
+            if key is not None:
+                del self._pending[key]
+            self._depth -= 1
+            wait = now - put_time
+            stats["total_wait"] += wait
+            if wait > stats["max_wait"]:
+                stats["max_wait"] = wait
+            msgs.append(msg)
+        stats["got"] += len(msgs)
+        return msgs
+
     def get(self):
         '''get message
         '''
+        return self.get_many(1)[0]
+
+    def get_many(self, max_count=None ):
+        '''wait for messages, then get all pending messages, or at most max_count of them
+        '''
         with self._not_empty_cond:
-            if self.empty:
+            while self.empty:
                 self._not_empty_cond.wait()
-            msg = self._queue.popleft()
-            return msg
-        
+            return self._take(max_count or self._depth)
+
     def put(self, msg):
         '''put message
         '''
         with self._not_empty_cond:
-            if msg not in self._queue:
-                self._queue.append(msg)
-                self._not_empty_cond.notify()
+            stats = self._stats
+            stats["put"] += 1
+            key = self._get_key(msg)
+            entry = self._pending.get(key) if key is not None else None
+            if entry is not None:
+                if msg[0] not in self._coalesce_events:
+                    stats["deduplicated"] += 1
+                    return
+                entry[3] = False
+                self._depth -= 1
+                stats["coalesced"] += 1
+            entry = [msg, key, time.time(), True]
+            self._queue.append(entry)
+            if key is not None:
+                self._pending[key] = entry
+            self._depth += 1
+            if self._depth > stats["max_depth"]:
+                stats["max_depth"] = self._depth
+            self._not_empty_cond.notify()
+
+    def pop_all(self):
+        '''remove and return all pending messages without waiting
+        '''
+        with self._not_empty_cond:
+            return self._take(self._depth)
+
+    def get_stats(self):
+        '''get queue statistics, times are in seconds
+
+        :returns: dict - current and max depth, number of messages put, deduplicated,
+                  coalesced and got, and total, mean and max wait time of got messages
+        '''
+        with self._not_empty_cond:
+            stats = dict(self._stats)
+            stats["depth"] = self._depth
+        stats["mean_wait"] = stats["total_wait"] / stats["got"] if stats["got"] else 0.0
+        return stats
+
+CONTROL_EXPIRED_ERROR = 1
+
+class ControlExpiredError(Error):
+    '''control handle is expired
+    '''
+    def __init__(self, control_id ):
+        super(ControlExpiredError, self).__init__(CONTROL_EXPIRED_ERROR,
+                                                  "control %s is expired" % control_id,
+                                                  None)
+        
+class HandleTable(object):
+    '''Generational handle table
+
+    A handle packs a slot index and the generation of that slot. Freeing a
+    slot bumps its generation, so a stale handle never resolves to the
+    element that reuses the slot.
+    '''
+    GENERATION_BITS = 32
+    GENERATION_MASK = (1 << GENERATION_BITS) - 1
+    
+    def __init__(self):
+        self._slots = [[None, 0]] #[element, generation], slot 0 is reserved so that handles are never 0
+        self._free_slots = []
+        self._handles = {} #element -> handle
+        
+    def __len__(self):
+        return len(self._handles)
+        
+    def get_handle(self, element ):
+        '''get handle of element, allocate one if not exist
+        '''
+        handle = self._handles.get(element)
+        if handle is None:
+            if self._free_slots:
+                index = self._free_slots.pop()
+                slot = self._slots[index]
+                slot[0] = element
+            else:
+                index = len(self._slots)
+                slot = [element, 0]
+                self._slots.append(slot)
+            handle = (index << self.GENERATION_BITS) | slot[1]
+            self._handles[element] = handle
+        return handle
+    
+    def get_element(self, handle ):
+        '''get element by handle
+        
+        :raises ControlExpiredError: handle is freed or invalid
+        '''
+        if isinstance(handle, (int, long)) and handle >= 0:
+            index = handle >> self.GENERATION_BITS
+            if index < len(self._slots):
+                element, generation = self._slots[index]
+                if element is not None and generation == handle & self.GENERATION_MASK:
+                    return element
+        raise ControlExpiredError(handle)
+    
+    def free(self, element ):
+        '''free handle of element if allocated
+        '''
+        handle = self._handles.pop(element, None)
+        if handle is not None:
+            index = handle >> self.GENERATION_BITS
+            slot = self._slots[index]
+            slot[0] = None
+            slot[1] = (slot[1] + 1) & self.GENERATION_MASK
+            self._free_slots.append(index)
+            
+    def clear(self):
+        '''free all handles
+        '''
+        for element in list(self._handles):
+            self.free(element)
+        
+class ElementIndex(object):
+    '''Inverted indexes of element trees
+
+    Maps (attribute, value) and tag to elements. Elements are numbered in
+    document order across all trees, the subtree of an element occupies
+    the numbers from its own up to its end, so whether an element is under
+    another is checked in constant time. Only string attribute values are
+    indexed, as values parsed from layouts always are.
+    '''
+    def __init__(self):
+        self._attrs = collections.defaultdict(set) #(name, value) -> elements
+        self._tags = collections.defaultdict(set) #tag -> elements
+        self._positions = {} #element -> (order, end, depth)
+        self._next_order = 0
+
+    def __contains__(self, element ):
+        return element in self._positions
+
+    def add_tree(self, root ):
+        '''index all elements of tree
+        '''
+        attrs, tags, positions = self._attrs, self._tags, self._positions
+        stack = [(root, 0, None)] #(element, depth, order if subtree is done)
+        while stack:
+            element, depth, order = stack.pop()
+            if order is not None:
+                positions[element] = (order, self._next_order, depth)
+                continue
+            stack.append((element, depth, self._next_order))
+            self._next_order += 1
+            tags[element.tag].add(element)
+            for item in element.attrib.iteritems():
+                if isinstance(item[1], basestring):
+                    attrs[item].add(element)
+            for child in reversed(element):
+                stack.append((child, depth + 1, None))
+
+    def remove_tree(self, root ):
+        '''remove all elements of tree from index
+        '''
+        for element in root.iter():
+            self._positions.pop(element, None)
+            self._discard(self._tags, element.tag, element)
+            for item in element.attrib.iteritems():
+                if isinstance(item[1], basestring):
+                    self._discard(self._attrs, item, element)
+
+    def clear(self):
+        self._attrs.clear()
+        self._tags.clear()
+        self._positions.clear()
+
+    def _discard(self, index, key, element ):
+        elements = index.get(key)
+        if elements is not None:
+            elements.discard(element)
+            if not elements:
+                del index[key]
+
+    def set_attr(self, element, name, value ):
+        '''set attribute of an indexed element
+        '''
+        old_value = element.attrib.get(name)
+        if isinstance(old_value, basestring):
+            self._discard(self._attrs, (name, old_value), element)
+        element.attrib[name] = value
+        if isinstance(value, basestring):
+            self._attrs[(name, value)].add(element)
+
+    def get_by_attr(self, name, value ):
+        '''elements of attribute value, value must be a string
+        '''
+        return self._attrs.get((name, value), ())
+
+    def get_by_tag(self, tag ):
+        return self._tags.get(tag, ())
+
+    def select(self, root, elements, include_root=False, maxdepth=None ):
+        '''select elements under root in document order
+
+        :param include_root: whether root itself can be selected
+        :param maxdepth: max depth below root, unlimited if None
+        '''
+        order, end, depth = self._positions[root]
+        if not include_root:
+            order += 1
+        max_depth = depth + maxdepth if maxdepth is not None else None
+        selected = []
+        for element in elements:
+            position = self._positions[element]
+            if order <= position[0] < end and (max_depth is None or position[2] <= max_depth):
+                selected.append((position[0], element))
+        selected.sort(key=lambda it: it[0])
+        return [ it[1] for it in selected ]
 
 class WindowManager(object):
     '''Window manager
+
+    Shared by the app event loop and the RPC worker threads, compound
+    operations on the element trees should be done holding `lock`.
+
+    Changes of windows and control attributes are logged with the UI tree
+    version they produce, so that clients can follow them by deltas, see
+    `get_changes`.
     '''
+    #max number of changes kept in change log
+    CHANGE_LOG_SIZE = 4096
+    
     def __init__(self):
         self._windows = {}
         self._curr_window = None
+        self._handles = HandleTable()
+        self._index = ElementIndex()
+        self._lock = threading.RLock()
+        self._changed_cond = threading.Condition(self._lock)
+        self._version = 0
+        self._changes = collections.deque(maxlen=self.CHANGE_LOG_SIZE) #(version, change)
+        self._changes_base = 0 #changes after this version are all in log
+        
+    @property
+    def lock(self):
+        '''lock protecting windows and their element trees
+        '''
+        return self._lock
         
     def register_window(self, name, layout):
-        '''register a window
+        '''register a window, handles of the replaced window are expired
         '''
-        self._windows[name] = ElementTree.parse(StringIO.StringIO(layout)) 
+        tree = ElementTree.parse(StringIO.StringIO(layout))
+        with self._lock:
+            old_tree = self._windows.get(name)
+            if old_tree is not None:
+                for it in old_tree.iter():
+                    self._handles.free(it)
+                self._index.remove_tree(old_tree.getroot())
+            self._windows[name] = tree
+            self._index.add_tree(tree.getroot())
+            self.notify_changed(("window", name))
         
     def render_window(self, name ):
         '''render a window
         '''
-        self._curr_window = name
+        with self._lock:
+            self._curr_window = name
+            self.notify_changed(("render", name))
+            
+    def reset(self):
+        '''unregister all windows, all handles are expired
+        '''
+        with self._lock:
+            self._handles.clear()
+            self._index.clear()
+            self._windows = {}
+            self._curr_window = None
+            self.notify_changed(("reset",))
+            
+    @property
+    def version(self):
+        '''UI tree version, increased on every UI change
+        '''
+        return self._version
+        
+    def notify_changed(self, change=None ):
+        '''increase UI tree version and wake up threads waiting for UI changes
+        
+        :param change: change to log, one of ("window", name) for a registered window,
+                       ("render", name), ("reset",) and ("attr", element, name, value)
+        '''
+        with self._changed_cond:
+            self._version += 1
+            if change is not None:
+                if len(self._changes) == self._changes.maxlen:
+                    self._changes_base = self._changes[0][0]
+                self._changes.append((self._version, change))
+            self._changed_cond.notify_all()
+            
+    def get_changes(self, version ):
+        '''get logged changes after a UI tree version, in order
+        
+        :returns: list of changes, or None if changes since `version` are no longer all in log
+        '''
+        with self._lock:
+            if version < self._changes_base or version > self._version:
+                return None
+            changes = []
+            for change_version, change in reversed(self._changes):
+                if change_version <= version:
+                    break
+                changes.append(change)
+            changes.reverse()
+            return changes
+            
+    def get_window_names(self):
+        '''get names of registered windows
+        '''
+        with self._lock:
+            return list(self._windows)
+        
+    @property
+    def current_window_name(self):
+        '''name of current top window
+        '''
+        return self._curr_window
+        
+    def is_alive(self, control ):
+        '''whether control is in a registered window
+        '''
+        with self._lock:
+            return control in self._index
+            
+    def wait_for(self, predicate, timeout ):
+        '''wait until predicate returns a true value or timed out
+        
+        predicate is evaluated holding `lock` once at first and then after every UI change
+        
+        :returns: the last value returned by predicate
+        '''
+        deadline = time.time() + timeout
+        with self._changed_cond:
+            while 1:
+                result = predicate()
+                remaining = deadline - time.time()
+                if result or remaining <= 0:
+                    return result
+                self._changed_cond.wait(remaining)
         
     def get_current_window(self):
         '''get current top window
         '''
-        return self._windows[self._curr_window]
+        with self._lock:
+            return self._windows[self._curr_window]
     
     def get_window_by_name(self, name ):
         '''get window by name
         '''
-        return self._windows.get(name)
+        with self._lock:
+            return self._windows.get(name)
+        
+    def get_control_id(self, control ):
+        '''get ID of control
+        '''
+        with self._lock:
+            return self._handles.get_handle(control)
         
     def get_control(self, control_id ):
         '''get control by ID
+        
+        :raises ControlExpiredError: control is removed or its window is re-registered
+        '''
+        with self._lock:
+            return self._handles.get_element(control_id)
+        
+    def set_control_attr(self, control_id, name, val ):
+        '''set control attribute by handle, see `set_attr`
+        '''
+        with self._lock:
+            self.set_attr(self.get_control(control_id), name, val)
+            
+    def set_attr(self, control, name, val ):
+        '''set attribute of control element, attributes should only be changed by this
+        method, an attribute written to the element directly is not indexed, so lookups
+        by its new value miss the control, and the change is not logged for `get_changes`
         '''
-        for wnd in self._windows.values():
-            for it in wnd.iter():
-                if id(it) == control_id:
-                    return it
+        with self._lock:
+            self._index.set_attr(control, name, val)
+            self.notify_changed(("attr", control, name, val))
+            
+    def find_controls_by_name(self, root, name ):
+        '''find controls by name, root itself included, same as `treequery.find_controls_by_name`
+        '''
+        with self._lock:
+            return [ it for it in self._index.select(root, self._index.get_by_attr("name", name), include_root=True)
+                     if it.attrib.get("name") == name ]
+        
+    def find_controls(self, root, qpath_locator ):
+        '''find controls by parsed QPath, same as `treequery.find_controls`
+        '''
+        with self._lock:
+            return treequery.find_controls(root, qpath_locator, self.match_selector)
+        
+    def match_selector(self, root, selector ):
+        '''find controls under root matching one QPath selector, same as `treequery.match_selector`
+        
+        Controls are looked up in index by the condition of exact value matching fewest
+        controls, and the tree is only walked if there is no such condition.
+        '''
+        conditions, maxdepth, instance = treequery.parse_selector(selector)
+        candidates = None
+        for attr, (op, val) in conditions.items():
+            if op != "=" or not isinstance(val, basestring):
+                continue
+            if attr == "class":
+                elements = self._index.get_by_tag(val)
+            else:
+                elements = self._index.get_by_attr(attr, val)
+            if candidates is None or len(elements) < len(candidates):
+                candidates = elements
+        if candidates is None:
+            return treequery.match_selector(root, selector)
+        matched_controls = [ it for it in self._index.select(root, candidates, maxdepth=max(maxdepth, 1))
+                             if treequery.match_element(it, conditions) ]
+        if instance != None:
+            matched_controls = [matched_controls[instance]]
+        return matched_controls
         
 class App(object):
     '''Application
+    
+    Control attributes are indexed for locator queries, so callbacks such as
+    `on_click` should change them by `set_control_attr` rather than writing
+    to the element attributes directly.
     '''
-    def __init__(self, port ):
+    #max number of events handled per acquisition of window manager lock
+    EVENT_BATCH_SIZE = 64
+    
+    def __init__(self, port, rpc_workers=8, rpc_queue_size=32 ):
+        '''constructor
+        
+        :param port: test stub listening port, or unix domain socket path
+        :param rpc_workers: number of threads serving test stub requests concurrently
+        :param rpc_queue_size: max number of connections with pending requests waiting for a free worker
+        '''
         self._port = port
+        self._rpc_workers = rpc_workers
+        self._rpc_queue_size = rpc_queue_size
         self._wndmgr = WindowManager()
         self._msgqueue = MsgQueue()
+        self._created = threading.Event()
         
         #test stub thread
         self._rpc_server = threading.Thread(target=self._rpc_server_thread)
         self._rpc_server.setDaemon(1)
         self._rpc_server.start()
         
+        launcher_pid = os.environ.pop(LAUNCHER_PID_ENV, None)
+        if launcher_pid is not None:
+            watchdog = threading.Thread(target=self._watch_launcher, args=(int(launcher_pid),))
+            watchdog.setDaemon(1)
+            watchdog.start()
+            
+    def _watch_launcher(self, launcher_pid ):
+        '''exit when launcher exits without stopping app, e.g. a test worker process holding a pool of apps
+        '''
+        while os.getppid() == launcher_pid:
+            time.sleep(1)
+        os._exit(1)
+        
     def _rpc_server_thread(self):
         '''test stub service thread
         '''
-        rpc_server = SimpleJSONRPCServer(("", self._port), logRequests=False)
+        if isinstance(self._port, basestring):
+            addr = self._port
+        else:
+            addr = ("", self._port)
+        rpc_server = SimpleJSONRPCServer(addr, logRequests=False,
+                                         max_workers=self._rpc_workers,
+                                         max_queue=self._rpc_queue_size)
         rpc_server.register_instance(StubService(self, self._wndmgr))
+        self._notify_ready(rpc_server)
         rpc_server.serve_forever()
         
+    def _notify_ready(self, rpc_server ):
+        '''report listening address to launcher through the readiness pipe if any,
+        the address is a line of the real port (the configured port may be 0) or socket path
+        '''
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd is None:
+            return
+        if isinstance(self._port, basestring):
+            address = self._port
+        else:
+            address = rpc_server.server_address[1]
+        ready_fd = int(ready_fd)
+        try:
+            os.write(ready_fd, ("%s\n" % address).encode("utf8"))
+        except OSError: #launcher is not waiting any more
+            pass
+        finally:
+            os.close(ready_fd)
+        
+    def wait_created(self, timeout ):
+        '''wait for `on_created` returning, test stub is ready before windows are created
+        
+        :returns: whether app is created
+        '''
+        return self._created.wait(timeout)
+        
     def register_window(self, name, layout ):
         '''register a window
         '''
@@ -122,21 +631,73 @@ class App(object):
         '''render a window
         '''
         self._msgqueue.put((EnumEvent.RenderWindow, {"name":name}))
+        
+    def set_control_attr(self, control, name, value ):
+        '''set attribute of control element, keeping it indexed and reported to clients
+        '''
+        self._wndmgr.set_attr(control, name, value)
                 
     def run_loop(self):
         '''app event loop
         '''
         self.on_created()
-        while 1:
-            event, params = self._msgqueue.get()
+        self._created.set()
+        stopped = False
+        while not stopped:
+            msgs = self._msgqueue.get_many(self.EVENT_BATCH_SIZE)
+            #events are handled atomically with respect to test stub requests
+            with self._wndmgr.lock:
+                for event, params in msgs:
+                    if event == EnumEvent.Stop:
+                        stopped = True
+                        break
+                    self._handle_event(event, params)
+        self.on_destroyed()
+        
+    def _handle_event(self, event, params ):
+        '''handle an event other than Stop, holding window manager lock
+        '''
+        if event == EnumEvent.RenderWindow:
+            self._wndmgr.render_window(params["name"])
+        elif event == EnumEvent.Click:
+            try:
+                control = self._wndmgr.get_control(params["control_id"])
+            except ControlExpiredError:
+                return
+            self.on_click(control)
+            self._wndmgr.notify_changed()
+        elif event == EnumEvent.Reset:
+            self._reset()
+            params["done"].set()
+            
+    def reset(self, timeout=5 ):
+        '''reset app to the state right after `on_created`
+        
+        Pending messages are dropped, then the event loop unregisters all
+        windows, calls `on_created` again and handles the messages it posts
+        (e.g. rendering the initial window) before the reset is done, so the
+        app is ready for a new test.
+        
+        :returns: whether reset is done in timeout
+        '''
+        done = threading.Event()
+        stop_msgs = [ it for it in self._msgqueue.pop_all() if it[0] == EnumEvent.Stop ]
+        self._msgqueue.put((EnumEvent.Reset, {"done": done}))
+        for msg in stop_msgs[:1]: #keep pending stop request
+            self._msgqueue.put(msg)
+        return done.wait(timeout)
+    
+    def _reset(self):
+        '''handle reset event in event loop
+        '''
+        self._wndmgr.reset()
+        self.on_created()
+        msgs = self._msgqueue.pop_all()
+        for event, params in msgs:
             if event == EnumEvent.Stop:
+                self._msgqueue.put((event, params))
                 break
-            elif event == EnumEvent.RenderWindow:
-                self._wndmgr.render_window(params["name"])
-            elif event == EnumEvent.Click:
-                control = self._wndmgr.get_control(params["control_id"])
-                self.on_click(control)
-        self.on_destroyed()
+            self._handle_event(event, params)
         
     def on_created(self):
         '''create callback
@@ -157,5 +718,10 @@ class App(object):
         '''post message to app
         '''
         self._msgqueue.put(msg)
+        
+    def get_msgqueue_stats(self):
+        '''get message queue statistics, see `MsgQueue.get_stats`
+        '''
+        return self._msgqueue.get_stats()
 
 
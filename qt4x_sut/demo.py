@@ -62,9 +62,12 @@ class TextEditorApp(App):
         
 def app_main():
     if len(sys.argv) <= 1:
-        sys.stderr.write("Usage:\n\t%s LISTEN_PORT" % os.path.basename(sys.argv[0]))
+        sys.stderr.write("Usage:\n\t%s LISTEN_PORT|SOCKET_PATH" % os.path.basename(sys.argv[0]))
         sys.exit(1)
-    port = int(sys.argv[1])
+    try:
+        port = int(sys.argv[1])
+    except ValueError:
+        port = sys.argv[1]
     app = TextEditorApp(port)
     app.run_loop()
     
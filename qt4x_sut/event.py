@@ -23,3 +23,4 @@ class EnumEvent:
     Stop = 0
     Click = 1
     RenderWindow = 2
+    Reset = 3
@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Synthetic layout generator
+
+Generate large window layouts with controlled shape for scaling tests.
+Layouts are reproducible: the same parameters always give the same layout.
+
+Controls are created level by level, the n-th control (root is 0) is named
+"c<n>" unless its name is taken from the duplicate name pool ("dup<k>"),
+and has a "kind" attribute of `attr_cardinality` distinct values.
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import collections
+import random
+from xml.etree import ElementTree
+
+TAGS = ["Panel", "Button", "StaticText", "TextEdit", "Menu", "MenuItem"]
+
+def count_elements( depth, fanout ):
+    '''number of controls of a full tree
+    '''
+    return sum(fanout ** it for it in range(depth + 1))
+
+def generate_tree( depth=3, fanout=10, attr_cardinality=10, extra_attrs=2,
+                   duplicate_ratio=0.0, duplicate_names=10, max_elements=None, seed=0 ):
+    '''generate a window element tree
+
+    :param depth: levels below root window
+    :param fanout: children of each control above the last level
+    :param attr_cardinality: distinct values of attribute "kind"
+    :param extra_attrs: number of extra attributes "attr<i>" with unique values
+    :param duplicate_ratio: ratio of controls named from the duplicate name pool
+    :param duplicate_names: size of the duplicate name pool
+    :param max_elements: stop adding controls when the tree has this many controls
+    :param seed: random seed
+    :returns: root element
+    '''
+    rng = random.Random(seed)
+    index = [0]
+    def _new_element( tag ):
+        n = index[0]
+        index[0] += 1
+        if n > 0 and rng.random() < duplicate_ratio:
+            name = "dup%s" % rng.randrange(duplicate_names)
+        else:
+            name = "c%s" % n
+        attrib = {"name": name, "kind": "k%s" % rng.randrange(attr_cardinality)}
+        for i in range(extra_attrs):
+            attrib["attr%s" % i] = "v%s_%s" % (i, n)
+        return ElementTree.Element(tag, attrib)
+
+    if max_elements is None:
+        max_elements = count_elements(depth, fanout)
+    root = _new_element("Window")
+    pending = collections.deque([(root, 0)])
+    while pending and index[0] < max_elements:
+        parent, level = pending.popleft()
+        if level >= depth:
+            continue
+        for _ in range(fanout):
+            if index[0] >= max_elements:
+                break
+            elem = _new_element(rng.choice(TAGS))
+            parent.append(elem)
+            pending.append((elem, level + 1))
+    return root
+
+def generate_layout( **kwargs ):
+    '''generate a window layout string, accepts the same parameters as `generate_tree`
+    '''
+    return ElementTree.tostring(generate_tree(**kwargs), encoding="utf-8")
@@ -17,8 +17,6 @@
 
 from __future__ import print_function, unicode_literals, absolute_import
 
-import re
-
 from qt4x_sut.event import EnumEvent
 
 class StubService(object):
@@ -31,102 +29,173 @@ class StubService(object):
     def hello(self):
         return "hello"
         
+    def wait_created(self, timeout ):
+        '''wait for app creating its initial windows, which may take a while for large layouts
+        
+        :returns: whether app is created
+        '''
+        return self._app.wait_created(timeout)
+        
+    def reset_app(self, timeout=5 ):
+        '''reset app to its initial state, so that the app process can be reused by another test
+        
+        :param timeout: max seconds to wait, keep it below the timeout of the calling client
+        :returns: UI tree version after reset, or None if the app event loop does not finish it in timeout
+        '''
+        if self._app.reset(timeout):
+            return self._wndmgr.version
+        
     def get_window_by_name(self, name ):
         '''get window by name
         '''
         wnd = self._wndmgr.get_window_by_name(name)
         if wnd:
-            return id(wnd.getroot())
+            return self._wndmgr.get_control_id(wnd.getroot())
     
     def find_controls_by_name(self, parent_id, name ):
         '''find controls by name
         '''        
-        control_ids = []
-        root = self._wndmgr.get_control(parent_id)
-        for it in root.iter():
-            if it.attrib.has_key("name") and it.attrib["name"] == name:
-                control_ids.append(id(it))
-        return control_ids
+        with self._wndmgr.lock:
+            root = self._wndmgr.get_control(parent_id)
+            return [ self._wndmgr.get_control_id(it) for it in self._wndmgr.find_controls_by_name(root, name) ]
     
     def find_controls(self, parent_id, qpath_locator ):
         '''find controls by QPath
         '''
-        root = self._wndmgr.get_control(parent_id)
-        controls = [root]
-        for selector in qpath_locator:
-            if not controls: # not found!
-                break
-            next_controls = []
-            for it in controls:
-                next_controls += self._find_controls(it, selector)
-            controls = next_controls
-        return [ id(it) for it in controls]
-        
-    def _find_controls(self, root, selector ):
-        processed_selector = {}
-        for k in selector:
-            processed_selector[k.lower()] = selector[k]
-        selector = processed_selector        
-        if 'maxdepth' in selector:
-            maxdepth = selector.pop('maxdepth')[1]
-        else:
-            maxdepth = 1
-        if 'instance' in selector:
-            instance = selector.pop('instance')[1]
-        else:
-            instance = None
-                    
-        matched_controls = []
-        for it in self._children_iter(root, maxdepth):            
-            for attr in selector:
-                op, val = selector[attr]
-                
-                attr_dict = it.attrib.copy()
-                attr_dict['class'] = it.tag
-                if not attr_dict.has_key(attr):
-                    break
-                if op == "=" and val != attr_dict[attr]:
-                    break
-                if op == "~=" and not re.match(val, attr_dict[attr]):
-                    break
-            else:
-                matched_controls.append(it)
-                
-        if instance != None:
-            matched_controls = [matched_controls[instance]]
-        return matched_controls
-    
-    def _children_iter(self, root, maxdepth):
-        '''return child control iterator by max depth
-        '''
-        i = iter(root)
-        while 1:
-            elem = i.next()
-            yield elem
-            if maxdepth-1 > 0:
-                for it in self._children_iter(elem, maxdepth-1):
-                    yield it
+        with self._wndmgr.lock:
+            root = self._wndmgr.get_control(parent_id)
+            return [ self._wndmgr.get_control_id(it) for it in self._wndmgr.find_controls(root, qpath_locator) ]
+        
+    def dump_window_tree(self, window_id ):
+        '''dump element tree of window, or subtree of any control
+        
+        :returns: {"version": UI tree version, "root": node}, node is [id, tag, attributes]
+                  followed by list of child nodes if it has any
+        '''
+        with self._wndmgr.lock:
+            root = self._wndmgr.get_control(window_id)
+            return {"version": self._wndmgr.version,
+                    "root": self._dump_node(root)}
+            
+    def _dump_node(self, elem ):
+        node = [self._wndmgr.get_control_id(elem), elem.tag, elem.attrib]
+        if len(elem):
+            node.append([ self._dump_node(it) for it in elem ])
+        return node
     
+    def get_changes(self, version=None, names=None ):
+        '''get UI changes since a UI tree version, to keep a client side mirror in sync
+        
+        Changes are ["window", name, window tree dump or None if the window is
+        unregistered], ["attr", control ID, name, value], ["render", name] and
+        ["reset"]. A window is dumped at its last registration only, with its
+        current tree, so applying the changes in order gives the current state.
+        
+        :param version: UI tree version of mirror, None for all windows
+        :param names: names of windows to dump, others are reported without dump, None for all windows
+        :returns: {"version": UI tree version, "full": whether changes are a full state starting with
+                  ["reset"] as `version` is too old, "changes": list of changes}
+        '''
+        with self._wndmgr.lock:
+            curr_version = self._wndmgr.version
+            changes = None
+            if version is not None:
+                changes = self._wndmgr.get_changes(version)
+            full = changes is None
+            if full:
+                changes = [("reset",)]
+                changes += [ ("window", it) for it in self._wndmgr.get_window_names() ]
+                if self._wndmgr.current_window_name is not None:
+                    changes.append(("render", self._wndmgr.current_window_name))
+            last_registered = dict((it[1], i) for i, it in enumerate(changes) if it[0] == "window")
+            result = []
+            for i, change in enumerate(changes):
+                if change[0] == "window":
+                    if last_registered[change[1]] == i:
+                        result.append(["window", change[1], self._dump_window(change[1], names)])
+                elif change[0] == "attr":
+                    if self._wndmgr.is_alive(change[1]): #otherwise its window is dumped again or removed
+                        result.append(["attr", self._wndmgr.get_control_id(change[1]), change[2], change[3]])
+                else:
+                    result.append(list(change))
+            return {"version": curr_version, "full": full, "changes": result}
+        
+    def _dump_window(self, name, names ):
+        wnd = self._wndmgr.get_window_by_name(name)
+        if wnd is None or (names is not None and name not in names):
+            return None
+        return self._dump_node(wnd.getroot())
+        
     def get_control_children(self, control_id ):
         '''get control direct children
         '''
         control_ids = []
-        for it in list(self._wndmgr.get_control(control_id)):
-            control_ids.append(id(it))
+        with self._wndmgr.lock:
+            for it in list(self._wndmgr.get_control(control_id)):
+                control_ids.append(self._wndmgr.get_control_id(it))
         return control_ids
     
     def get_control_attr(self, control_id, name ):
         '''get control attribute
         '''
-        return self._wndmgr.get_control(control_id).attrib.get(name)
+        with self._wndmgr.lock:
+            return self._wndmgr.get_control(control_id).attrib.get(name)
+        
+    def get_control_attr_versioned(self, control_id, name, version=None ):
+        '''get control attribute together with UI tree version
+        
+        :param version: UI tree version of the attribute value cached by caller
+        :returns: [version] if UI tree is not changed since `version`, otherwise [version, value]
+        '''
+        with self._wndmgr.lock:
+            curr_version = self._wndmgr.version
+            if version == curr_version:
+                return [curr_version]
+            return [curr_version, self._wndmgr.get_control(control_id).attrib.get(name)]
+        
+    def get_ui_version(self):
+        '''get UI tree version
+        '''
+        return self._wndmgr.version
+        
+    def get_msgqueue_stats(self):
+        '''get app message queue depth, wait time and deduplication statistics
+        '''
+        return self._app.get_msgqueue_stats()
         
     def set_control_attr(self, control_id, name, val ):
         '''set control attribute
         '''
-        self._wndmgr.get_control(control_id).attrib[name] = val
+        self._wndmgr.set_control_attr(control_id, name, val)
     
     def click_control(self, control_id):
         '''click control
         '''
+        self._wndmgr.get_control(control_id) #raise if expired
         self._app.post_message((EnumEvent.Click, {"control_id": control_id}))
         
+        
+    def wait_window(self, name, timeout ):
+        '''wait for window existence
+        
+        :returns: window ID, or None if timed out
+        '''
+        return self._wndmgr.wait_for(lambda: self.get_window_by_name(name), timeout)
+    
+    def wait_controls(self, parent_id, locator, timeout ):
+        '''wait for controls existence
+        
+        :param locator: control name, or parsed QPath
+        :returns: control IDs, empty if timed out
+        '''
+        if isinstance(locator, basestring):
+            return self._wndmgr.wait_for(lambda: self.find_controls_by_name(parent_id, locator), timeout)
+        else:
+            return self._wndmgr.wait_for(lambda: self.find_controls(parent_id, locator), timeout)
+        
+    def wait_condition(self, control_id, name, expected, timeout ):
+        '''wait for control attribute value
+        
+        :returns: whether control attribute is expected value
+        '''
+        return self._wndmgr.wait_for(lambda: self.get_control_attr(control_id, name) == expected, timeout)
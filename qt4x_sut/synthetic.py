@@ -0,0 +1,87 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''Synthetic App
+
+App with generated large windows, see `qt4x_sut.layoutgen`::
+
+    python -m qt4x_sut.synthetic 0 --depth 4 --fanout 10 --duplicate-ratio 0.1
+
+Windows are named "Main", "Window1", "Window2" ..., each generated with a
+different seed, "Main" is rendered at start.
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import argparse
+
+from qt4x_sut.app import App
+from qt4x_sut.layoutgen import generate_layout
+
+class SyntheticApp(App):
+    '''app with generated windows
+    '''
+    def __init__(self, port, layout_params, windows=1 ):
+        '''constructor
+
+        :param port: test stub listening port, or unix domain socket path
+        :param layout_params: parameters of `generate_layout`
+        :param windows: number of windows
+        '''
+        super(SyntheticApp, self).__init__(port)
+        self._layout_params = layout_params
+        self._window_count = windows
+
+    def on_created(self):
+        seed = self._layout_params.get("seed", 0)
+        for i in range(self._window_count):
+            params = dict(self._layout_params, seed=seed + i)
+            self.register_window("Window%s" % i if i else "Main", generate_layout(**params))
+        self.render_window("Main")
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="app with generated large windows")
+    parser.add_argument("address", help="LISTEN_PORT|SOCKET_PATH")
+    parser.add_argument("--depth", type=int, default=3, help="levels below root window")
+    parser.add_argument("--fanout", type=int, default=10, help="children of each control")
+    parser.add_argument("--attr-cardinality", type=int, default=10, help="distinct values of attribute \"kind\"")
+    parser.add_argument("--extra-attrs", type=int, default=2, help="number of extra attributes")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="ratio of controls with duplicate names")
+    parser.add_argument("--duplicate-names", type=int, default=10, help="size of duplicate name pool")
+    parser.add_argument("--max-elements", type=int, default=None, help="max controls of each window")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--windows", type=int, default=1, help="number of windows")
+    return parser
+
+def app_main():
+    args = get_parser().parse_args()
+    try:
+        port = int(args.address)
+    except ValueError:
+        port = args.address
+    layout_params = {
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "attr_cardinality": args.attr_cardinality,
+        "extra_attrs": args.extra_attrs,
+        "duplicate_ratio": args.duplicate_ratio,
+        "duplicate_names": args.duplicate_names,
+        "max_elements": args.max_elements,
+        "seed": args.seed,
+    }
+    app = SyntheticApp(port, layout_params, args.windows)
+    app.run_loop()
+
+if __name__ == '__main__':
+    app_main()
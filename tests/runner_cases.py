@@ -0,0 +1,56 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''testbase test cases run by `test_runner`, each appends its name, process ID,
+start and end time to the file named by environment variable QT4X_TEST_RUNNER_LOG
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import time
+
+from testbase.testcase import TestCase
+
+LOG_ENV = "QT4X_TEST_RUNNER_LOG"
+
+class _SleepMixin(object):
+    '''not a TestCase itself, so that it is not loaded as a test
+    '''
+    owner = "foo"
+    timeout = 1
+    priority = TestCase.EnumPriority.High
+    status = TestCase.EnumStatus.Ready
+    duration = 0
+
+    def run_test(self):
+        start = time.time()
+        time.sleep(self.duration)
+        with open(os.environ[LOG_ENV], "ab") as fd:
+            fd.write(("%s %s %f %f\n" % (type(self).__name__, os.getpid(), start, time.time())).encode("utf8"))
+
+class AFastTest(_SleepMixin, TestCase):
+    '''fast test
+    '''
+    duration = 0.2
+
+class BFastTest(_SleepMixin, TestCase):
+    '''fast test
+    '''
+    duration = 0.2
+
+class ZSlowTest(_SleepMixin, TestCase):
+    '''slow test
+    '''
+    duration = 0.6
@@ -0,0 +1,136 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''app launcher tests, running demo app processes
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import socket
+import unittest
+
+from qt4x.app import App, AppPool
+from qt4x.rpcstats import STATS_ENV
+from qt4x.rpctrace import TRACE_ENV
+
+class DemoApp(App):
+    ENTRY = "qt4x_sut.demo"
+
+def get_environ( pid ):
+    with open("/proc/%s/environ" % pid, "rb") as fd:
+        items = fd.read().split(b"\0")
+    return dict(it.decode("utf8").split("=", 1) for it in items if it)
+
+class AppTest(unittest.TestCase):
+
+    def launch(self):
+        app = DemoApp()
+        self.addCleanup(app.kill)
+        App._instances.remove(app)
+        return app
+
+    def set_env(self, name, value ):
+        self.addCleanup(self.restore_env, name, os.environ.get(name))
+        os.environ[name] = value
+
+    def restore_env(self, name, value ):
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+    @unittest.skipUnless(os.path.isdir("/proc/self"), "requires procfs")
+    def test_shared_output_path_not_inherited(self):
+        for name in [STATS_ENV, TRACE_ENV]:
+            self.set_env(name, "/tmp/qt4x_test_output")
+            self.assertNotIn(name, get_environ(self.launch().pid))
+            self.set_env(name, "/tmp/qt4x_test_output_{pid}")
+            self.assertEqual(get_environ(self.launch().pid)[name], "/tmp/qt4x_test_output_{pid}")
+
+class UnixSocketDemoApp(App):
+    ENTRY = "qt4x_sut.demo"
+    UNIX_SOCKET = True
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires unix domain socket")
+class UnixSocketAppTest(unittest.TestCase):
+
+    def launch(self):
+        app = UnixSocketDemoApp()
+        self.addCleanup(app.kill)
+        App._instances.remove(app)
+        return app
+
+    def test_unique_socket_removed_on_kill(self):
+        apps = [self.launch(), self.launch()]
+        self.assertNotEqual(apps[0].address, apps[1].address)
+        for app in apps:
+            self.assertTrue(os.path.exists(app.address))
+            self.assertEqual(app.get_driver().hello(), "hello")
+            self.assertTrue(app.get_driver().get_window_by_name("Main"))
+        socket_dir = os.path.dirname(apps[0].address)
+        apps[0].kill()
+        self.assertFalse(os.path.exists(socket_dir))
+        self.assertEqual(apps[1].get_driver().hello(), "hello")
+
+class PooledDemoApp(App):
+    ENTRY = "qt4x_sut.demo"
+
+def get_editor_text( app ):
+    driver = app.get_driver()
+    editor_id = driver.find_controls_by_name(driver.get_window_by_name("Main"), "editor")[0]
+    return editor_id, driver.get_control_attr(editor_id, "text")
+
+class AppPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = AppPool(DemoApp, max_idle=1)
+        self.addCleanup(self.pool.close)
+
+    def test_reuse_after_reset(self):
+        app = self.pool.acquire()
+        editor_id, text = get_editor_text(app)
+        app.get_driver().set_control_attr(editor_id, "text", "changed")
+        self.pool.release(app)
+        self.assertIs(self.pool.acquire(), app)
+        self.assertEqual(get_editor_text(app)[1], text)
+
+    def test_max_idle(self):
+        apps = [self.pool.acquire(), self.pool.acquire()]
+        self.assertNotEqual(apps[0].pid, apps[1].pid)
+        for app in apps:
+            self.pool.release(app)
+        self.assertTrue(apps[0].alive)
+        apps[1]._p.wait() #killed as the pool is full
+
+    def test_dead_idle_app_replaced(self):
+        app = self.pool.acquire()
+        self.pool.release(app)
+        app.kill()
+        app._p.wait()
+        new_app = self.pool.acquire()
+        self.assertIsNot(new_app, app)
+        self.assertTrue(new_app.alive)
+
+    def test_kill_all_returns_leased(self):
+        pool = AppPool.get_pool(PooledDemoApp)
+        self.addCleanup(pool.close)
+        app = PooledDemoApp.lease()
+        self.assertNotIn(app, App._instances)
+        App.kill_all()
+        self.assertTrue(app.alive)
+        self.assertIs(PooledDemoApp.lease(), app)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''asynchronous JSON-RPC client tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import socket
+import threading
+import time
+import unittest
+
+from qt4x.asyncjsonrpc import EventLoop, AsyncServerProxy
+from qt4x.jsonrpc import SimpleJSONRPCServer
+
+class RPCFutureTest(unittest.TestCase):
+
+    def setUp(self):
+        server = SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False)
+        server.register_function(lambda: "hello", "hello")
+        server.register_function(lambda seconds: time.sleep(seconds) or "done", "sleep")
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(1)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.loop = EventLoop()
+        self.addCleanup(self.loop.close)
+        self.uri = "http://127.0.0.1:%s" % server.server_address[1]
+
+    def test_result(self):
+        future = AsyncServerProxy(self.uri, self.loop).hello()
+        self.assertEqual(future.result(), b"hello")
+        self.assertTrue(future.done())
+
+    def test_wait_timeout(self):
+        future = AsyncServerProxy(self.uri, self.loop).sleep(0.5)
+        self.assertRaises(socket.timeout, future.result, 0.05)
+        self.assertRaises(socket.timeout, future.exception, 0.05)
+        self.assertFalse(future.done())
+        self.assertEqual(future.result(), b"done")
+
+    def test_call_timeout(self):
+        future = AsyncServerProxy(self.uri, self.loop, timeout=0.2).sleep(1)
+        self.assertIsNotNone(future.exception())
+        self.assertTrue(future.done())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''codec registry and negotiation tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import threading
+import unittest
+
+from qt4x.codec import JSON_CODEC, MARSHAL_CODEC, get_codec, list_codecs
+from qt4x.jsonrpc import ServerProxy, TCPTransport, TCPJsonRPCServer, _byteify
+
+RESULT = {"name": "中文", "items": ["a", ["b", 1]]}
+
+class CodecTest(unittest.TestCase):
+
+    def test_default_registry(self):
+        self.assertEqual(list_codecs(), ["json"])
+        self.assertIsNone(get_codec("marshal"))
+
+    def test_loads_encoding(self):
+        for codec in [JSON_CODEC, MARSHAL_CODEC]:
+            data = codec.dumps(RESULT)
+            self.assertEqual(codec.loads(data, "utf8"), {b"name": "中文".encode("utf8"), b"items": [b"a", [b"b", 1]]})
+
+    def test_single_pass_same_as_byteify(self):
+        data = MARSHAL_CODEC.dumps({"items": ("a", ("b", 1))})
+        expected = {b"items": [b"a", [b"b", 1]]}
+        self.assertEqual(MARSHAL_CODEC.loads(data, "utf8"), expected)
+        self.assertEqual(_byteify(MARSHAL_CODEC.loads(data), "utf8"), expected)
+        self.assertIsInstance(_byteify(MARSHAL_CODEC.loads(data), "utf8")[b"items"][1], list)
+
+    def test_marshal_errors(self):
+        self.assertRaises(TypeError, MARSHAL_CODEC.dumps, object())
+        self.assertRaises(ValueError, MARSHAL_CODEC.loads, b"\x00")
+
+class NegotiationTest(unittest.TestCase):
+
+    def start_server(self, **kwargs ):
+        server = TCPJsonRPCServer(("127.0.0.1", 0), **kwargs)
+        server.register_function(lambda: RESULT, "get")
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(1)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return "tcp://127.0.0.1:%s" % server.server_address[1]
+
+    def negotiate(self, uri, transport ):
+        self.addCleanup(transport.close)
+        result = ServerProxy(uri, transport, encoding=None).get()
+        self.assertEqual(result, RESULT)
+        self.assertTrue(all(isinstance(it, unicode) for it in result))
+        return transport.get_codec(uri).name
+
+    def test_marshal_not_accepted_by_default(self):
+        uri = self.start_server()
+        self.assertEqual(self.negotiate(uri, TCPTransport(codecs=(MARSHAL_CODEC, "json"))), "json")
+        self.assertEqual(self.negotiate(uri, TCPTransport(codecs=(MARSHAL_CODEC,))), "json")
+
+    def test_marshal_opt_in(self):
+        uri = self.start_server(allow_marshal=True)
+        self.assertEqual(self.negotiate(uri, TCPTransport(codecs=(MARSHAL_CODEC, "json"))), "marshal")
+        self.assertEqual(self.negotiate(uri, TCPTransport()), "json")
+        self.assertEqual(self.negotiate(uri, TCPTransport(codecs=())), "json")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''control proxy and attribute cache tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+from testbase.util import TimeoutError
+from tuia.exceptions import ControlExpiredError
+
+from qt4x.controls import AttrCache, ControlProxy, CONTROL_EXPIRED_ERROR, get_attr_cache, _wait_for_value
+from qt4x.jsonrpc import Error
+
+class FakeDriver(object):
+    '''driver of one control with versioned attributes, counting calls
+    '''
+    def __init__(self):
+        self.version = 1
+        self.attrs = {"text": "a"}
+        self.calls = 0
+
+    def get_control_attr_versioned(self, control_id, name, version=None ):
+        self.calls += 1
+        if version == self.version:
+            return [self.version]
+        return [self.version, self.attrs[name]]
+
+    def set_attr(self, name, value ):
+        '''change made by app itself'''
+        self.attrs[name] = value
+        self.version += 1
+
+    def set_control_attr(self, control_id, name, value ):
+        self.set_attr(name, value)
+
+    def click_control(self, control_id ):
+        self.version += 1
+
+class AttrCacheTest(unittest.TestCase):
+
+    def test_revalidate_by_default(self):
+        driver = FakeDriver()
+        proxy = ControlProxy(driver, 1)
+        self.assertEqual(proxy.get_attr("text"), "a")
+        self.assertEqual(proxy.get_attr("text"), "a")
+        self.assertEqual(driver.calls, 2)
+        driver.set_attr("text", "b")
+        self.assertEqual(proxy.get_attr("text"), "b")
+
+    def test_max_age(self):
+        driver = FakeDriver()
+        get_attr_cache(driver).max_age = 60
+        proxy = ControlProxy(driver, 1)
+        self.assertEqual(proxy.get_attr("text"), "a")
+        driver.set_attr("text", "b")
+        self.assertEqual(proxy.get_attr("text"), "a") #served without RPC
+        self.assertEqual(driver.calls, 1)
+        get_attr_cache(driver).invalidate()
+        self.assertEqual(proxy.get_attr("text"), "b")
+
+    def test_no_rpc_within_max_age(self):
+        driver = FakeDriver()
+        get_attr_cache(driver).max_age = 60
+        proxy = ControlProxy(driver, 1)
+        for _ in range(30):
+            self.assertEqual(proxy.get_attr("text"), "a")
+        self.assertEqual(driver.calls, 1)
+
+    def test_own_actions_force_revalidation(self):
+        driver = FakeDriver()
+        get_attr_cache(driver).max_age = 60
+        proxy = ControlProxy(driver, 1)
+        proxy.get_attr("text")
+        proxy.set_attr("text", "b")
+        self.assertEqual(proxy.get_attr("text"), "b")
+        self.assertEqual(driver.calls, 2)
+        proxy.click()
+        self.assertEqual(proxy.get_attr("text"), "b")
+        self.assertEqual(driver.calls, 3)
+        self.assertEqual(proxy.get_attr("text"), "b")
+        self.assertEqual(driver.calls, 3)
+
+    def test_confirm_drops_old_values(self):
+        cache = AttrCache()
+        cache.confirm(1)
+        cache.put(1, "text", "a")
+        self.assertEqual(cache.get(1, "text"), (True, False, "a"))
+        cache.confirm(2)
+        self.assertEqual(cache.get(1, "text"), (False, False, None))
+
+class ExpiringDriver(object):
+    '''driver of one control whose handle changes, e.g. after its window is registered again
+    '''
+    def __init__(self):
+        self.control_id = 1
+        self.calls = []
+
+    def check(self, control_id ):
+        self.calls.append(control_id)
+        if control_id != self.control_id:
+            raise Error(CONTROL_EXPIRED_ERROR, "control %s is expired" % control_id, None)
+
+    def get_control_attr_versioned(self, control_id, name, version=None ):
+        self.check(control_id)
+        return [self.control_id, "text of %s" % control_id]
+
+    def get_control_children(self, control_id ):
+        self.check(control_id)
+        return []
+
+class ReresolveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = ExpiringDriver()
+
+    def make_proxy(self, resolve ):
+        proxy = ControlProxy(self.driver, 1, resolve)
+        self.assertEqual(proxy.get_attr("text"), "text of 1")
+        self.driver.control_id = 2
+        return proxy
+
+    def test_expired_without_resolve(self):
+        proxy = self.make_proxy(None)
+        self.assertRaises(ControlExpiredError, proxy.get_attr, "text")
+        self.assertRaises(ControlExpiredError, proxy.get_children)
+
+    def test_found_again(self):
+        resolved = []
+        def resolve():
+            resolved.append(self.driver.control_id)
+            return self.driver.control_id
+        proxy = self.make_proxy(resolve)
+        self.assertEqual(proxy.get_attr("text"), "text of 2")
+        self.assertEqual(proxy.id, 2)
+        self.assertEqual(resolved, [2])
+        self.assertEqual(self.driver.calls, [1, 1, 2])
+        self.assertEqual(proxy.get_children(), [])
+        self.assertEqual(resolved, [2]) #new handle is kept
+
+    def test_expired_again_after_resolve(self):
+        proxy = self.make_proxy(lambda: 3) #resolved to an expired handle
+        self.assertRaises(ControlExpiredError, proxy.get_attr, "text")
+
+class WaitDriver(object):
+    '''driver supporting `wait_condition`, which sets the attribute as if the app did
+    '''
+    def __init__(self, control ):
+        self.control = control
+        self.waits = []
+
+    def wait_condition(self, control_id, name, expected, timeout ):
+        self.waits.append(name)
+        setattr(self.control, name, expected)
+        return True
+
+class FakeControl(object):
+    '''control with one raw attribute property "text" and one derived property "checked"
+    '''
+    RAW_ATTRS = ("text",)
+    id = 1
+
+    def __init__(self):
+        self.text = "a"
+        self.checked = False
+        self.driver = WaitDriver(self)
+
+    def get_driver(self):
+        return self.driver
+
+class WaitForValueTest(unittest.TestCase):
+
+    def test_raw_attr_waits_in_stub(self):
+        control = FakeControl()
+        _wait_for_value(control, 1, 0.01, "text", "b")
+        self.assertEqual(control.driver.waits, ["text"])
+
+    def test_derived_property_polls(self):
+        control = FakeControl()
+        self.assertRaises(TimeoutError, _wait_for_value, control, 0.05, 0.01, "checked", True)
+        self.assertEqual(control.driver.waits, [])
+        self.assertFalse(control.checked)
+
+if __name__ == '__main__':
+    unittest.main()
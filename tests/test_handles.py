@@ -0,0 +1,78 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''generational handle table tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+from xml.etree import ElementTree
+
+from qt4x_sut.app import CONTROL_EXPIRED_ERROR, ControlExpiredError, HandleTable, WindowManager
+
+class HandleTableTest(unittest.TestCase):
+
+    def assertExpired(self, table, handle ):
+        with self.assertRaises(ControlExpiredError) as context:
+            table.get_element(handle)
+        self.assertEqual(context.exception.code, CONTROL_EXPIRED_ERROR)
+
+    def test_reuse_slot_across_generations(self):
+        table = HandleTable()
+        old = ElementTree.Element("Button")
+        old_handle = table.get_handle(old)
+        self.assertNotEqual(old_handle, 0)
+        self.assertEqual(table.get_handle(old), old_handle)
+        self.assertIs(table.get_element(old_handle), old)
+        table.free(old)
+        self.assertExpired(table, old_handle)
+        new = ElementTree.Element("Button")
+        new_handle = table.get_handle(new)
+        #same slot, next generation
+        self.assertEqual(new_handle >> HandleTable.GENERATION_BITS, old_handle >> HandleTable.GENERATION_BITS)
+        self.assertNotEqual(new_handle, old_handle)
+        self.assertIs(table.get_element(new_handle), new)
+        self.assertExpired(table, old_handle)
+        self.assertEqual(len(table), 1)
+
+    def test_invalid_handles(self):
+        table = HandleTable()
+        table.get_handle(ElementTree.Element("Button"))
+        for handle in [0, -1, 1 << 40, "1", None]:
+            self.assertExpired(table, handle)
+
+    def test_clear(self):
+        table = HandleTable()
+        elements = [ ElementTree.Element("Button") for _ in range(3) ]
+        handles = [ table.get_handle(it) for it in elements ]
+        table.clear()
+        self.assertEqual(len(table), 0)
+        for handle in handles:
+            self.assertExpired(table, handle)
+
+    def test_window_registered_again(self):
+        wndmgr = WindowManager()
+        wndmgr.register_window("Main", "<Window><Button name='ok'/></Window>")
+        root = wndmgr.get_window_by_name("Main").getroot()
+        old_id = wndmgr.get_control_id(root[0])
+        wndmgr.register_window("Main", "<Window><Button name='ok'/></Window>")
+        with self.assertRaises(ControlExpiredError):
+            wndmgr.get_control(old_id)
+        new_id = wndmgr.get_control_id(wndmgr.get_window_by_name("Main").getroot()[0])
+        self.assertNotEqual(new_id, old_id)
+        self.assertEqual(wndmgr.get_control(new_id).attrib["name"], "ok")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''element index tests, indexed lookups of window manager against tree walks
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import random
+import unittest
+
+from qt4x import treequery
+from qt4x.qpath import QPath
+from qt4x_sut.app import WindowManager
+from qt4x_sut.layoutgen import TAGS, generate_layout
+
+class ElementIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wndmgr = WindowManager()
+        self.wndmgr.register_window("Main", generate_layout(depth=3, fanout=5, duplicate_ratio=0.3, seed=1))
+        self.wndmgr.register_window("Other", generate_layout(depth=3, fanout=5, duplicate_ratio=0.3, seed=2))
+        #replaced window must be removed from index
+        self.wndmgr.register_window("Main", generate_layout(depth=3, fanout=5, duplicate_ratio=0.3, seed=3))
+        self.elements = []
+        for name in ("Main", "Other"):
+            self.elements += list(self.wndmgr.get_window_by_name(name).iter())
+        self.rng = random.Random(0)
+
+    def check_lookups(self, count ):
+        rng = self.rng
+        for _ in range(count):
+            root = rng.choice(self.elements)
+            name = "dup%d" % rng.randrange(10) if rng.random() < 0.7 else "c%d" % rng.randrange(300)
+            self.assertEqual(self.wndmgr.find_controls_by_name(root, name),
+                             treequery.find_controls_by_name(root, name))
+            selectors = []
+            for _ in range(rng.randrange(1, 3)):
+                parts = []
+                if rng.random() < 0.5:
+                    parts.append("name='%s'" % name)
+                if rng.random() < 0.5:
+                    parts.append("class='%s'" % rng.choice(TAGS))
+                if rng.random() < 0.3:
+                    parts.append("kind~='k[1-3]'")
+                if not parts:
+                    parts.append("kind='k%d'" % rng.randrange(10))
+                parts.append("maxdepth=%d" % rng.randrange(1, 5))
+                selectors.append(" && ".join(parts))
+            qpath = QPath("/" + " /".join(selectors)).selectors
+            self.assertEqual(self.wndmgr.find_controls(root, qpath),
+                             treequery.find_controls(root, qpath), selectors)
+
+    def test_same_as_tree_walk(self):
+        self.check_lookups(500)
+
+    def test_set_attr(self):
+        version = self.wndmgr.version
+        for _ in range(100):
+            element = self.rng.choice(self.elements)
+            name, value = self.rng.choice([("name", "dup1"), ("kind", "k3"), ("name", "c5"), ("new", 7), ("name", 8)])
+            self.wndmgr.set_control_attr(self.wndmgr.get_control_id(element), name, value)
+        self.assertEqual(self.wndmgr.version, version + 100)
+        self.check_lookups(500)
+
+    def test_direct_write_not_found_by_old_value(self):
+        root = self.wndmgr.get_window_by_name("Main").getroot()
+        element = self.rng.choice(list(root.iter("Button")))
+        old_name = element.attrib["name"]
+        element.attrib["name"] = "renamed"
+        self.assertNotIn(element, self.wndmgr.find_controls_by_name(root, old_name))
+        self.assertNotIn(element, self.wndmgr.find_controls(root, QPath("/name='%s' && maxdepth=10" % old_name).selectors))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,430 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''JSON-RPC transport and server tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import httplib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from qt4x.codec import JSON_CODEC
+from qt4x.jsonrpc import (ServerProxy, HTTPTransport, TCPTransport, SimpleJSONRPCServer,
+                          SimpleJSONRPCRequestHandler, TCPJsonRPCServer, FRAME_HEADER, BatchCall,
+                          Error, ParseError, InvalidRequestError, MethodNotFoundError, ProtocolError,
+                          _build_request, parse_unix_uri)
+
+class ShortIdleHandler(SimpleJSONRPCRequestHandler):
+    timeout = 0.5
+    
+class PartialResponseHandler(SimpleJSONRPCRequestHandler):
+    '''handles requests to /partial, then closes connection in the middle of response
+    '''
+    calls = 0
+    
+    def do_POST(self):
+        if self.path != "/partial":
+            return SimpleJSONRPCRequestHandler.do_POST(self)
+        self.rfile.read(int(self.headers["content-length"]))
+        PartialResponseHandler.calls += 1
+        self.wfile.write(b"HTTP/1.1 2")
+        self.close_connection = 1
+        
+def recv_frame( sock ):
+    header = b""
+    while len(header) < FRAME_HEADER.size:
+        data = sock.recv(FRAME_HEADER.size - len(header))
+        if not data:
+            return None
+        header += data
+    size = FRAME_HEADER.unpack(header)[0] - FRAME_HEADER.size
+    data = b""
+    while len(data) < size:
+        data += sock.recv(size - len(data))
+    return data
+    
+def send_frame( sock, data ):
+    sock.sendall(FRAME_HEADER.pack(len(data) + FRAME_HEADER.size) + data)
+    
+class FrameServer(object):
+    '''framed TCP server answering calls of method "hello", behaving as `actions` on each call:
+    "reply", "close" (reply then close connection) or "partial" (close in the middle of response)
+    '''
+    def __init__(self, actions ):
+        self.actions = list(actions)
+        self.calls = 0
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.uri = "tcp://127.0.0.1:%s" % self.listener.getsockname()[1]
+        thread = threading.Thread(target=self.serve)
+        thread.setDaemon(1)
+        thread.start()
+        
+    def serve(self):
+        while 1:
+            sock, _ = self.listener.accept()
+            while 1:
+                data = recv_frame(sock)
+                if data is None:
+                    break
+                if data.startswith(JSON_CODEC.codec_id):
+                    request = json.loads(data[1:])
+                else: #codecs are negotiated with legacy frames
+                    request = json.loads(json.loads(data))
+                if request["method"] == "rpc.list_codecs":
+                    send_frame(sock, json.dumps({"jsonrpc": "2.0", "result": ["json"], "id": request["id"]}))
+                    continue
+                response = JSON_CODEC.codec_id + JSON_CODEC.dumps({"jsonrpc": "2.0", "result": "hello", "id": request["id"]})
+                self.calls += 1
+                action = self.actions.pop(0)
+                if action == "partial":
+                    sock.sendall(FRAME_HEADER.pack(len(response) + FRAME_HEADER.size) + response[:3])
+                else:
+                    send_frame(sock, response)
+                if action != "reply":
+                    break
+            sock.close()
+
+def start_server( test, server ):
+    server.register_function(lambda: "hello", "hello")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(1)
+    thread.start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+def post( server, body ):
+    '''send raw HTTP POST to server, returns (status, response body)
+    '''
+    conn = httplib.HTTPConnection(*server.server_address)
+    try:
+        conn.request("POST", "/", body, {"Content-type": "application/json-rpc"})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+def fail():
+    raise ValueError("failed")
+
+class ThreadPoolTest(unittest.TestCase):
+
+    def check_idle_connections( self, server, scheme, transport_class ):
+        uri = "%s://127.0.0.1:%s" % (scheme, start_server(self, server).server_address[1])
+        proxies = [ ServerProxy(uri, transport_class()) for _ in range(server.max_workers * 3) ]
+        for it in proxies:
+            self.assertEqual(it.hello(), "hello")
+        #idle persistent connections are parked and do not hold workers
+        time0 = time.time()
+        self.assertEqual(ServerProxy(uri, transport_class()).hello(), "hello")
+        self.assertLess(time.time() - time0, 1)
+        for it in proxies: #parked connections are served again
+            self.assertEqual(it.hello(), "hello")
+            
+    def test_http_idle_connections(self):
+        self.check_idle_connections(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False, max_workers=2, max_queue=4),
+                                    "http", HTTPTransport)
+        
+    def test_tcp_idle_connections(self):
+        self.check_idle_connections(TCPJsonRPCServer(("127.0.0.1", 0), max_workers=2, max_queue=4),
+                                    "tcp", TCPTransport)
+        
+    def test_idle_timeout(self):
+        server = start_server(self, SimpleJSONRPCServer(("127.0.0.1", 0), ShortIdleHandler, logRequests=False))
+        proxy = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+        self.assertEqual(proxy.hello(), "hello")
+        time.sleep(1)
+        self.assertEqual(server._parked._connections, {})
+        self.assertEqual(proxy.hello(), "hello") #reconnected
+        
+    def test_server_close(self):
+        server = SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False)
+        server.register_function(lambda: "hello", "hello")
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(1)
+        thread.start()
+        proxy = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+        self.assertEqual(proxy.hello(), "hello")
+        time.sleep(0.2)
+        parked = server._parked
+        self.assertEqual(len(parked._connections), 1)
+        server.shutdown()
+        server.server_close()
+        time.sleep(0.2)
+        self.assertTrue(parked._closed)
+        self.assertEqual(parked._connections, {})
+        self.assertFalse(parked._thread.is_alive())
+        for worker in server._workers:
+            self.assertFalse(worker.is_alive())
+        
+    def test_stop_workers_with_full_queue(self):
+        server = SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False, max_workers=1, max_queue=1)
+        started, release = threading.Event(), threading.Event()
+        def block():
+            started.set()
+            release.wait(5)
+            return "done"
+        server.register_function(block, "block")
+        start_server(self, server)
+        proxy = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+        results = []
+        client = threading.Thread(target=lambda: results.append(proxy.block()))
+        client.setDaemon(1)
+        client.start()
+        self.assertTrue(started.wait(5)) #the only worker is busy
+        queued, peer = socket.socketpair()
+        server.resume_request(queued, ("127.0.0.1", 0))
+        self.assertTrue(server._requests.full())
+        time0 = time.time()
+        server.stop_workers()
+        self.assertLess(time.time() - time0, 2)
+        self.assertEqual(peer.recv(1), b"") #queued connection is closed
+        peer.close()
+        release.set()
+        client.join(5)
+        self.assertEqual(results, ["done"])
+        server._workers[0].join(5)
+        self.assertFalse(server._workers[0].is_alive())
+
+class LargeResponseTest(unittest.TestCase):
+
+    def check_latency( self, server, scheme, transport_class ):
+        server.register_function(lambda size: "x" * size, "data")
+        uri = "%s://127.0.0.1:%s" % (scheme, start_server(self, server).server_address[1])
+        proxy = ServerProxy(uri, transport_class())
+        self.assertEqual(len(proxy.data(20000)), 20000)
+        #responses over the 8KB write buffer are sent in several writes, which stalled
+        #for delayed ACK (about 40ms each) on reused connections without TCP_NODELAY
+        time0 = time.time()
+        for _ in range(20):
+            proxy.data(20000)
+        self.assertLess((time.time() - time0) / 20, 0.02)
+
+    def test_http_reused_connection(self):
+        self.check_latency(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False), "http", HTTPTransport)
+
+    def test_tcp_reused_connection(self):
+        self.check_latency(TCPJsonRPCServer(("127.0.0.1", 0)), "tcp", TCPTransport)
+
+class RetryTest(unittest.TestCase):
+    
+    def test_tcp_reconnect_closed_idle_connection(self):
+        server = FrameServer(["close", "reply"])
+        proxy = ServerProxy(server.uri, TCPTransport())
+        self.assertEqual(proxy.hello(), "hello")
+        time.sleep(0.1)
+        self.assertEqual(proxy.hello(), "hello")
+        self.assertEqual(server.calls, 2)
+        
+    def test_tcp_no_retry_after_partial_response(self):
+        server = FrameServer(["reply", "partial", "reply"])
+        proxy = ServerProxy(server.uri, TCPTransport())
+        self.assertEqual(proxy.hello(), "hello")
+        self.assertRaises(socket.error, proxy.hello)
+        self.assertEqual(server.calls, 2)
+        self.assertEqual(proxy.hello(), "hello") #new connection
+        
+    def test_http_no_retry_after_partial_response(self):
+        server = start_server(self, SimpleJSONRPCServer(("127.0.0.1", 0), PartialResponseHandler, logRequests=False))
+        transport = HTTPTransport()
+        uri = "http://127.0.0.1:%s" % server.server_address[1]
+        self.assertEqual(ServerProxy(uri, transport).hello(), "hello")
+        PartialResponseHandler.calls = 0
+        self.assertRaises(Exception, ServerProxy(uri + "/partial", transport).hello)
+        self.assertEqual(PartialResponseHandler.calls, 1)
+        
+class BatchTest(unittest.TestCase):
+
+    def check_mixed( self, server, scheme, transport_class ):
+        server.register_function(fail, "fail")
+        uri = "%s://127.0.0.1:%s" % (scheme, start_server(self, server).server_address[1])
+        proxy = ServerProxy(uri, transport_class())
+        results = proxy("batch_request")([("hello", []), ("missing", []), ("fail", []), ("hello", [])])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0], "hello")
+        self.assertIsInstance(results[1], MethodNotFoundError)
+        self.assertIsInstance(results[2], Error)
+        self.assertIn(b"failed", results[2].message)
+        self.assertEqual(results[3], "hello")
+        
+        with BatchCall(proxy) as batch:
+            batch.hello()
+            batch.missing()
+        self.assertEqual(len(batch.results), 2)
+        self.assertEqual(batch.results[0], "hello")
+        self.assertRaises(MethodNotFoundError, lambda: batch.results[1])
+        
+    def test_http_mixed_results(self):
+        self.check_mixed(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False), "http", HTTPTransport)
+        
+    def test_tcp_mixed_results(self):
+        self.check_mixed(TCPJsonRPCServer(("127.0.0.1", 0)), "tcp", TCPTransport)
+        
+    def test_empty_batch(self):
+        server = start_server(self, SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False))
+        proxy = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+        self.assertEqual(proxy("batch_request")([]), []) #nothing is sent
+        with BatchCall(proxy) as batch:
+            pass
+        self.assertEqual(len(batch.results), 0)
+        status, body = post(server, b"[]")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["error"]["code"], InvalidRequestError.PREDEFINE_CODE)
+        
+    def test_invalid_entries(self):
+        server = start_server(self, SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False))
+        request = _build_request("hello", [])
+        status, body = post(server, json.dumps([1, {"id": "x", "method": "hello"}, request]))
+        self.assertEqual(status, 200)
+        responses = json.loads(body)
+        self.assertEqual(len(responses), 3)
+        self.assertEqual([ it["error"]["code"] for it in responses[:2] ], [InvalidRequestError.PREDEFINE_CODE] * 2)
+        self.assertEqual(responses[1]["id"], "x")
+        self.assertEqual(responses[2], {"jsonrpc": "2.0", "result": "hello", "id": request["id"]})
+        
+class NotificationTest(unittest.TestCase):
+
+    def start_server(self, server ):
+        self.received = []
+        self.received_event = threading.Event()
+        def record( value ):
+            self.received.append(value)
+            self.received_event.set()
+        server.register_function(record, "record")
+        return start_server(self, server)
+
+    def wait_received(self, count ):
+        while len(self.received) < count:
+            self.assertTrue(self.received_event.wait(5))
+            self.received_event.clear()
+
+    def test_http_no_content(self):
+        server = self.start_server(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False))
+        notification = {"jsonrpc": "2.0", "method": "record", "params": [1]}
+        self.assertEqual(post(server, json.dumps(notification)), (204, b""))
+        self.assertEqual(post(server, json.dumps([notification, notification])), (204, b""))
+        status, body = post(server, json.dumps([notification, _build_request("hello", [])]))
+        self.assertEqual(status, 200)
+        self.assertEqual([ it["result"] for it in json.loads(body) ], ["hello"])
+        self.assertEqual(self.received, [1] * 4)
+
+    def test_http_proxy(self):
+        server = self.start_server(SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False))
+        proxy = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+        self.assertIsNone(proxy("notify").record(1))
+        self.assertEqual(proxy.hello(), "hello") #same connection after 204 response
+        self.assertEqual(self.received, [1])
+
+    def test_tcp_proxy(self):
+        server = self.start_server(TCPJsonRPCServer(("127.0.0.1", 0)))
+        proxy = ServerProxy("tcp://127.0.0.1:%s" % server.server_address[1], TCPTransport())
+        for i in range(3):
+            self.assertIsNone(proxy("notify").record(i))
+        #notifications get no response frames, so responses of later calls are not shifted
+        self.assertEqual(proxy.hello(), "hello")
+        self.wait_received(3)
+        self.assertEqual(self.received, [0, 1, 2])
+
+    def test_tcp_no_response_frame(self):
+        server = self.start_server(TCPJsonRPCServer(("127.0.0.1", 0)))
+        sock = socket.create_connection(server.server_address)
+        self.addCleanup(sock.close)
+        notification = {"jsonrpc": "2.0", "method": "record", "params": [1]}
+        send_frame(sock, json.dumps(json.dumps(notification)))
+        send_frame(sock, json.dumps(json.dumps([notification, notification])))
+        request = _build_request("hello", [])
+        send_frame(sock, json.dumps(json.dumps(request)))
+        self.assertEqual(json.loads(recv_frame(sock))["id"], request["id"])
+        self.assertEqual(self.received, [1] * 3)
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "requires unix domain socket")
+class UnixSocketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="qt4x_test_")
+        self.addCleanup(shutil.rmtree, self.socket_dir, True)
+        self.path = os.path.join(self.socket_dir, "sut.sock")
+
+    def check_transport( self, server, transport_class ):
+        start_server(self, server)
+        proxy = ServerProxy("unix://%s" % self.path, transport_class())
+        for _ in range(3): #connection is reused
+            self.assertEqual(proxy.hello(), "hello")
+        self.assertIsNone(proxy("notify").hello())
+        self.assertEqual(proxy("batch_request")([("hello", [])]), ["hello"])
+        server.shutdown()
+        server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_http(self):
+        self.check_transport(SimpleJSONRPCServer(self.path, logRequests=False), HTTPTransport)
+
+    def test_tcp(self):
+        self.check_transport(TCPJsonRPCServer(self.path), TCPTransport)
+
+    def test_stale_socket_file_replaced(self):
+        with open(self.path, "wb"):
+            pass
+        start_server(self, SimpleJSONRPCServer(self.path, logRequests=False))
+        self.assertEqual(ServerProxy("unix://%s" % self.path, HTTPTransport()).hello(), "hello")
+
+    def test_parse_uri(self):
+        self.assertEqual(parse_unix_uri("unix:///tmp/a%20b.sock"), "/tmp/a b.sock")
+        for uri in ["unix://", "http:///tmp/sut.sock"]:
+            self.assertRaises(ProtocolError, parse_unix_uri, uri)
+
+class FrameTest(unittest.TestCase):
+    
+    def test_malformed_legacy_frame(self):
+        server = start_server(self, TCPJsonRPCServer(("127.0.0.1", 0)))
+        sock = socket.create_connection(server.server_address)
+        self.addCleanup(sock.close)
+        for data in [b"not json", b"{}", json.dumps(json.dumps(_build_request("hello", [])))]:
+            send_frame(sock, data)
+            response = json.loads(recv_frame(sock))
+            if data.startswith(b"{"):
+                self.assertEqual(response["error"]["code"], ParseError.PREDEFINE_CODE)
+            elif data.startswith(b"not"):
+                self.assertEqual(response["error"]["code"], ParseError.PREDEFINE_CODE)
+            else:
+                self.assertEqual(response["result"], "hello")
+                
+    def test_malformed_negotiation_response(self):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        def serve():
+            sock, _ = listener.accept()
+            recv_frame(sock)
+            send_frame(sock, b"not json")
+            sock.close()
+        thread = threading.Thread(target=serve)
+        thread.setDaemon(1)
+        thread.start()
+        proxy = ServerProxy("tcp://127.0.0.1:%s" % listener.getsockname()[1], TCPTransport())
+        self.assertRaises(ProtocolError, proxy.hello)
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''UI mirror tests, comparing the mirror with the window manager of test stub
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import json
+import random
+import unittest
+
+from qt4x.jsonrpc import _byteify
+from qt4x.mirror import UIMirror
+from qt4x_sut.app import WindowManager
+from qt4x_sut.layoutgen import generate_layout
+from qt4x_sut.stub import StubService
+
+class FakeDriver(object):
+    '''driver calling test stub directly, with results encoded as by JSON-RPC
+    '''
+    def __init__(self, stub ):
+        self.stub = stub
+        self.calls = 0
+        
+    def __getattr__(self, name ):
+        method = getattr(self.stub, name)
+        def _call(*args):
+            self.calls += 1
+            result = method(*json.loads(json.dumps(args)))
+            return _byteify(json.loads(json.dumps(result)), "utf8")
+        return _call
+
+WINDOW_NAMES = ["W0", "W1", "W2"]
+
+class MirrorTest(unittest.TestCase):
+
+    def check_mirror(self, mirror, wndmgr, stub ):
+        mirror.sync()
+        for name in WINDOW_NAMES:
+            if not mirror._is_mirrored(name):
+                continue
+            window_id = mirror.get_window_by_name(name)
+            tree = wndmgr.get_window_by_name(name)
+            self.assertEqual(window_id, stub.get_window_by_name(name))
+            if tree is None:
+                continue
+            for elem in tree.iter():
+                control_id = wndmgr.get_control_id(elem)
+                self.assertEqual(mirror.get_control_children(control_id), stub.get_control_children(control_id))
+                for key, value in elem.attrib.items():
+                    self.assertEqual(mirror.get_control_attr(control_id, key), value.encode("utf8"))
+        self.assertEqual(mirror.current_window, wndmgr.current_window_name)
+
+    def run_changes(self, change_log_size ):
+        wndmgr = type(str("SmallLogWindowManager"), (WindowManager,), {"CHANGE_LOG_SIZE": change_log_size})()
+        stub = StubService(None, wndmgr)
+        driver = FakeDriver(stub)
+        mirrors = [UIMirror(driver), UIMirror(driver, ["W0"])]
+        rand = random.Random(change_log_size)
+        for _ in range(300):
+            op = rand.random()
+            names = wndmgr.get_window_names()
+            if op < 0.1 or not names:
+                layout = generate_layout(depth=2, fanout=3, seed=rand.randrange(100))
+                wndmgr.register_window(rand.choice(WINDOW_NAMES), layout)
+            elif op < 0.15:
+                wndmgr.reset()
+            elif op < 0.25:
+                wndmgr.render_window(rand.choice(names))
+            else:
+                elem = rand.choice(list(wndmgr.get_window_by_name(rand.choice(names)).iter()))
+                wndmgr.set_control_attr(wndmgr.get_control_id(elem), rand.choice(["name", "x"]), "v%d" % rand.randrange(5))
+            if rand.random() < 0.3:
+                for mirror in mirrors:
+                    self.check_mirror(mirror, wndmgr, stub)
+
+    def test_incremental_changes(self):
+        self.run_changes(WindowManager.CHANGE_LOG_SIZE)
+
+    def test_change_log_overflow(self):
+        self.run_changes(5)
+
+    def test_versioned_attr_within_max_age(self):
+        wndmgr = WindowManager()
+        stub = StubService(None, wndmgr)
+        wndmgr.register_window("W0", generate_layout(depth=1, fanout=2, seed=0))
+        driver = FakeDriver(stub)
+        mirror = UIMirror(driver)
+        mirror.max_age = 60
+        control_id = wndmgr.get_control_id(wndmgr.get_window_by_name("W0").getroot())
+        version = mirror.get_ui_version()
+        self.assertEqual(driver.calls, 1)
+        for _ in range(30):
+            self.assertEqual(mirror.get_control_attr_versioned(control_id, "name", version), [version])
+        self.assertEqual(driver.calls, 1) #answered without RPC
+        wndmgr.set_control_attr(control_id, "name", "changed")
+        self.assertEqual(mirror.get_control_attr_versioned(control_id, "name", version), [version])
+        mirror.invalidate() #e.g. an action is sent through the mirror
+        self.assertEqual(mirror.get_control_attr_versioned(control_id, "name", version),
+                         [wndmgr.version, b"changed"])
+        self.assertEqual(driver.calls, 2)
+
+if __name__ == '__main__':
+    unittest.main()
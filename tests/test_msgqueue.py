@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''app message queue tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import threading
+import unittest
+
+from qt4x_sut.app import MsgQueue
+from qt4x_sut.event import EnumEvent
+
+class MsgQueueTest(unittest.TestCase):
+
+    def test_deduplicate_and_coalesce(self):
+        queue = MsgQueue()
+        queue.put((EnumEvent.RenderWindow, {"name": "A"}))
+        queue.put((EnumEvent.Click, {"control_id": 1}))
+        queue.put((EnumEvent.Click, {"control_id": 1}))
+        queue.put((EnumEvent.RenderWindow, {"name": "B"}))
+        queue.put((EnumEvent.Click, {"control_id": [1]})) #not hashable, never deduplicated
+        queue.put((EnumEvent.Click, {"control_id": [1]}))
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(queue.pop_all(), [(EnumEvent.Click, {"control_id": 1}),
+                                           (EnumEvent.RenderWindow, {"name": "B"}),
+                                           (EnumEvent.Click, {"control_id": [1]}),
+                                           (EnumEvent.Click, {"control_id": [1]})])
+        self.assertTrue(queue.empty)
+        stats = queue.get_stats()
+        self.assertEqual((stats["put"], stats["deduplicated"], stats["coalesced"], stats["got"], stats["max_depth"]),
+                         (6, 1, 1, 4, 4))
+
+    def test_coalesced_message_order(self):
+        queue = MsgQueue()
+        queue.put((EnumEvent.RenderWindow, {"name": "A"}))
+        queue.put((EnumEvent.Click, {"control_id": 1}))
+        queue.put((EnumEvent.RenderWindow, {"name": "B"}))
+        queue.put((EnumEvent.Click, {"control_id": 2}))
+        queue.put((EnumEvent.Click, {"control_id": 1})) #duplicate keeps its position
+        queue.put((EnumEvent.RenderWindow, {"name": "C"}))
+        queue.put((EnumEvent.Click, {"control_id": 3}))
+        #the render replacing A and B runs after the clicks put before it, as without coalescing
+        self.assertEqual(queue.pop_all(), [(EnumEvent.Click, {"control_id": 1}),
+                                           (EnumEvent.Click, {"control_id": 2}),
+                                           (EnumEvent.RenderWindow, {"name": "C"}),
+                                           (EnumEvent.Click, {"control_id": 3})])
+
+    def test_put_again_after_taken(self):
+        queue = MsgQueue()
+        queue.put((EnumEvent.Click, {"control_id": 1}))
+        self.assertEqual(queue.get(), (EnumEvent.Click, {"control_id": 1}))
+        queue.put((EnumEvent.Click, {"control_id": 1}))
+        queue.put((EnumEvent.RenderWindow, {"name": "A"}))
+        self.assertEqual(len(queue), 2)
+
+    def test_get_many(self):
+        queue = MsgQueue()
+        for i in range(10):
+            queue.put((EnumEvent.Click, {"control_id": i}))
+        self.assertEqual([ it[1]["control_id"] for it in queue.get_many(4) ], [0, 1, 2, 3])
+        self.assertEqual(len(queue), 6)
+        self.assertEqual(len(queue.get_many()), 6)
+
+    def test_get_waits(self):
+        queue = MsgQueue()
+        timer = threading.Timer(0.05, queue.put, [(EnumEvent.Click, {"control_id": 1})])
+        timer.start()
+        self.assertEqual(queue.get(), (EnumEvent.Click, {"control_id": 1}))
+        timer.join()
+
+if __name__ == '__main__':
+    unittest.main()
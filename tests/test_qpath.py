@@ -0,0 +1,53 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''QPath parse cache tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+from qt4x import qpath
+from qt4x.qpath import QPath
+
+class ParsedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.size = qpath.PARSED_CACHE_SIZE
+        qpath.PARSED_CACHE_SIZE = 3
+
+    def tearDown(self):
+        qpath.PARSED_CACHE_SIZE = self.size
+
+    def test_shared(self):
+        self.assertIs(QPath("/name='a'").selectors, QPath("/name='a'").selectors)
+
+    def test_bounded(self):
+        first = QPath("/name='first'").selectors
+        for i in range(10):
+            QPath("/name='c%d'" % i).dumps()
+        self.assertEqual(len(qpath._parsed_cache), 3)
+        self.assertNotIn("/name='first'", qpath._parsed_cache)
+        self.assertEqual(QPath("/name='first'").selectors, first)
+
+    def test_recently_used_kept(self):
+        QPath("/name='kept'").dumps()
+        for i in range(10):
+            QPath("/name='kept'").dumps()
+            QPath("/name='c%d'" % i).dumps()
+        self.assertIn("/name='kept'", qpath._parsed_cache)
+
+if __name__ == '__main__':
+    unittest.main()
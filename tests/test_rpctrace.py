@@ -0,0 +1,113 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''RPC trace recording and replay tests
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from qt4x import rpcstats, rpctrace
+from qt4x.jsonrpc import ServerProxy, SimpleJSONRPCServer, BatchCall
+
+class Service(object):
+
+    def __init__(self):
+        self.notes = []
+        self.next_id = 100
+
+    def create(self):
+        self.next_id += 1
+        return self.next_id
+
+    def echo(self, value ):
+        return value
+
+    def note(self, value ):
+        self.notes.append(value)
+
+def start_server( test ):
+    service = Service()
+    server = SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False)
+    server.register_instance(service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(1)
+    thread.start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return service, "http://127.0.0.1:%s" % server.server_address[1]
+
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="qt4x_test_")
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.addCleanup(rpctrace.stop)
+        self.path = os.path.join(self.tmpdir, "trace.gz")
+
+    def wait_notes(self, service, count ):
+        deadline = time.time() + 2
+        while len(service.notes) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return service.notes
+
+    def test_record_and_replay(self):
+        service, uri = start_server(self)
+        proxy = ServerProxy(uri)
+        rpctrace.start(self.path)
+        handle = proxy.create()
+        proxy.echo(handle)
+        proxy.echo(handle)
+        proxy("notify").note("a")
+        with BatchCall(proxy) as batch:
+            batch.echo(handle)
+            batch.echo("b")
+        self.assertEqual(rpctrace.stop(), self.path)
+        self.assertEqual(self.wait_notes(service, 1), ["a"])
+
+        header, records = rpctrace.load(self.path)
+        self.assertEqual(header["pid"], os.getpid())
+        summary = rpctrace.summarize([ it for it in records if it[2] == "client" ])
+        self.assertEqual(summary["echo"], {"calls": 4, "repeated": 2})
+        self.assertEqual(summary["note"], {"calls": 1, "repeated": 0})
+
+        other_service, other_uri = start_server(self)
+        other_service.next_id = 200 #recorded handle is remapped
+        result = rpctrace.replay(self.path, other_uri, speed=0)
+        self.assertEqual((result.calls, result.errors, result.mismatches), (6, 0, 0))
+        self.assertEqual(self.wait_notes(other_service, 1), ["a"])
+
+    def test_failed_notification_recorded(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        proxy = ServerProxy("http://127.0.0.1:%s" % sock.getsockname()[1])
+        sock.close() #nothing listening
+        stats = rpcstats.enable()
+        self.addCleanup(rpcstats.disable)
+        rpctrace.start(self.path)
+        self.assertRaises(socket.error, proxy("notify").note, "a")
+        rpctrace.stop()
+        _, records = rpctrace.load(self.path)
+        self.assertEqual([ it[3]["method"] for it in records ], ["note"])
+        self.assertEqual(stats.snapshot()["notify(note)"]["errors"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''sharded test runner tests, running the cases of `tests.runner_cases` in worker processes
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+from testbase.report import EmptyTestReport
+
+from qt4x.runner import ShardedTestRunner, load_durations, save_durations, sort_by_duration
+from tests.runner_cases import LOG_ENV
+
+FakeTest = collections.namedtuple("FakeTest", ["test_name"])
+
+CASES = "tests.runner_cases"
+
+class DurationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="qt4x_test_")
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        self.path = os.path.join(self.tmp_dir, "durations.json")
+
+    def test_sort_by_duration(self):
+        tests = [ FakeTest(it) for it in ["a", "b", "c", "new"] ]
+        durations = {"a": 1.0, "b": 5.0, "c": 3.0, "removed": 100.0}
+        #new test is estimated at the average 3.0, stable sort keeps it after "c"
+        self.assertEqual([ it.test_name for it in sort_by_duration(tests, durations) ], ["b", "c", "new", "a"])
+        self.assertEqual(sort_by_duration(tests, {}), tests)
+
+    def test_save_and_load(self):
+        self.assertEqual(load_durations(self.path), {}) #not exist
+        save_durations(self.path, {"a": 1.5})
+        self.assertEqual(load_durations(self.path), {"a": 1.5})
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        for content in [b"not json", b"[1, 2]"]:
+            with open(self.path, "wb") as fd:
+                fd.write(content)
+            self.assertEqual(load_durations(self.path), {})
+
+class ShardedTestRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="qt4x_test_")
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        self.history_file = os.path.join(self.tmp_dir, "durations.json")
+        self.log_file = os.path.join(self.tmp_dir, "log.txt")
+        self.addCleanup(os.environ.pop, LOG_ENV, None)
+        os.environ[LOG_ENV] = self.log_file
+
+    def run_cases(self):
+        '''run cases in 2 workers
+
+        :returns: dict - test class name -> (process ID, start time, end time)
+        '''
+        ShardedTestRunner(EmptyTestReport(), process_cnt=2, history_file=self.history_file).run(str(CASES)) #testbase loads str names only
+        runs = {}
+        with open(self.log_file, "rb") as fd:
+            for line in fd.read().decode("utf8").splitlines():
+                name, pid, start, end = line.split()
+                runs[name] = (int(pid), float(start), float(end))
+        return runs
+
+    def test_durations_recorded(self):
+        runs = self.run_cases()
+        self.assertEqual(sorted(runs), ["AFastTest", "BFastTest", "ZSlowTest"])
+        durations = load_durations(self.history_file)
+        self.assertEqual(sorted(durations), [ "%s.%s" % (CASES, it) for it in sorted(runs) ])
+        self.assertGreaterEqual(durations[CASES + ".ZSlowTest"], 0.6)
+        self.assertLess(durations[CASES + ".AFastTest"], durations[CASES + ".ZSlowTest"])
+
+    def test_longest_first(self):
+        #without history tests run in loading order, the slow test would run after a fast one
+        save_durations(self.history_file, {CASES + ".AFastTest": 0.2,
+                                           CASES + ".BFastTest": 0.2,
+                                           CASES + ".ZSlowTest": 0.6})
+        runs = self.run_cases()
+        slow_pid, slow_start, _ = runs["ZSlowTest"]
+        first_fast = min(runs["AFastTest"], runs["BFastTest"], key=lambda it: it[1])
+        second_fast = max(runs["AFastTest"], runs["BFastTest"], key=lambda it: it[1])
+        #one worker runs the slow test, the other runs both fast tests meanwhile
+        self.assertEqual(first_fast[0], second_fast[0])
+        self.assertNotEqual(slow_pid, first_fast[0])
+        self.assertLess(slow_start, first_fast[2])
+        self.assertLess(second_fast[2], runs["ZSlowTest"][2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''tree snapshot tests, comparing local queries with test stub RPCs
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import random
+import threading
+import unittest
+
+from qt4x.jsonrpc import ServerProxy, HTTPTransport, SimpleJSONRPCServer
+from qt4x.qpath import QPath
+from qt4x.snapshot import TreeSnapshot
+from qt4x_sut.app import WindowManager
+from qt4x_sut.demo import MAIN_LAYOUT
+from qt4x_sut.layoutgen import TAGS, generate_layout
+from qt4x_sut.stub import StubService
+
+class TreeSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wndmgr = WindowManager()
+        self.wndmgr.register_window("Main", MAIN_LAYOUT)
+        self.wndmgr.register_window("Generated", generate_layout(depth=3, fanout=4, duplicate_ratio=0.3, seed=1))
+        server = SimpleJSONRPCServer(("127.0.0.1", 0), logRequests=False)
+        server.register_instance(StubService(None, self.wndmgr))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.setDaemon(1)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.driver = ServerProxy("http://127.0.0.1:%s" % server.server_address[1], HTTPTransport())
+
+    def check_node(self, node, elem ):
+        '''check dumped node shape: [id, tag, attributes] followed by non-empty child list if any
+        '''
+        self.assertIn(len(node), (3, 4))
+        control_id, tag, attrib = node[:3]
+        self.assertIsInstance(control_id, (int, long))
+        self.assertEqual(control_id, self.wndmgr.get_control_id(elem))
+        self.assertEqual(tag, elem.tag.encode("utf8"))
+        self.assertEqual(attrib, dict((k.encode("utf8"), v.encode("utf8")) for k, v in elem.attrib.items()))
+        if len(node) == 4:
+            self.assertEqual(len(node[3]), len(elem))
+            self.assertTrue(node[3])
+        else:
+            self.assertEqual(len(elem), 0)
+        for child_node, child in zip(node[3] if len(node) == 4 else [], elem):
+            self.check_node(child_node, child)
+
+    def test_dump_shape(self):
+        for name in ["Main", "Generated"]:
+            root = self.wndmgr.get_window_by_name(name).getroot()
+            dump = self.driver.dump_window_tree(self.driver.get_window_by_name(name))
+            self.assertEqual(dump["version"], self.wndmgr.version)
+            self.check_node(dump["root"], root)
+
+    def test_same_as_stub(self):
+        rand = random.Random(0)
+        for name in ["Main", "Generated"]:
+            window_id = self.driver.get_window_by_name(name)
+            snapshot = TreeSnapshot(self.driver.dump_window_tree(window_id))
+            self.assertEqual(snapshot.root_id, window_id)
+            elements = list(self.wndmgr.get_window_by_name(name).iter())
+            self.assertEqual(len(snapshot), len(elements))
+            names = set(it.attrib["name"] for it in elements if "name" in it.attrib)
+            for elem in elements:
+                control_id = self.wndmgr.get_control_id(elem)
+                self.assertEqual(snapshot.get_children(control_id), self.driver.get_control_children(control_id))
+                for key in elem.attrib:
+                    self.assertEqual(snapshot.get_attr(control_id, key), self.driver.get_control_attr(control_id, key))
+                for control_name in rand.sample(sorted(names), min(len(names), 3)) + ["missing"]:
+                    self.assertEqual(snapshot.find_controls_by_name(control_id, control_name),
+                                     self.driver.find_controls_by_name(control_id, control_name))
+                    qpath = QPath("/name='%s' && maxdepth=5" % control_name)
+                    self.assertEqual(snapshot.find_controls(control_id, qpath),
+                                     self.driver.find_controls(control_id, qpath.selectors))
+                qpath = QPath("/class='%s' && maxdepth=%d" % (rand.choice(TAGS + ["MenuItem", "TextEdit"]),
+                                                            rand.randrange(1, 4)))
+                self.assertEqual(snapshot.find_controls(control_id, qpath),
+                                 self.driver.find_controls(control_id, qpath.selectors))
+
+if __name__ == '__main__':
+    unittest.main()
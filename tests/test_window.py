@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+#
+# Tencent is pleased to support the open source community by making QTA available.
+# Copyright (C) 2016THL A29 Limited, a Tencent company. All rights reserved.
+# Licensed under the BSD 3-Clause License (the "License"); you may not use this
+# file except in compliance with the License. You may obtain a copy of the License at
+#
+# https://opensource.org/licenses/BSD-3-Clause
+#
+# Unless required by applicable law or agreed to in writing, software distributed
+# under the License is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, either express or implied. See the License for the specific language
+# governing permissions and limitations under the License.
+#
+'''window control map tests, running a demo app process
+'''
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+
+from tuia.exceptions import ControlExpiredError
+
+from qt4x import rpcstats
+from qt4x.app import App
+from qt4x.controls import Control, Window
+from qt4x.qpath import QPath
+
+class DemoApp(App):
+    ENTRY = "qt4x_sut.demo"
+
+class MainWindow(Window):
+    NAME = "Main"
+
+LOCATORS = {
+    "About Button": "about_btn",
+    "Menu Bar": {"type": Control, "locator": QPath("/class='MenuBar'")},
+    "About Button in Menu": {"type": Control, "root": "@Menu Bar", "locator": "about_btn"},
+}
+
+class WindowControlsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = DemoApp()
+        App._instances.remove(self.app)
+        self.addCleanup(self.app.kill)
+        self.window = MainWindow(self.app)
+        self.window.update_locator(LOCATORS)
+        self.addCleanup(rpcstats.disable)
+        self.stats = rpcstats.enable()
+        self.stats.clear()
+
+    def calls(self, method ):
+        return self.stats.snapshot().get(method, {}).get("calls", 0)
+
+    def test_controls_cached(self):
+        for _ in range(3):
+            self.assertEqual(self.window.controls["About Button in Menu"].name, "about_btn")
+            self.assertEqual(self.window.controls["About Button"].name, "about_btn")
+        self.assertIs(self.window.controls["Menu Bar"], self.window.controls["Menu Bar"])
+        self.assertEqual(self.calls("find_controls"), 1)
+        self.assertEqual(self.calls("find_controls_by_name"), 2)
+        self.assertIsInstance(LOCATORS["Menu Bar"], dict) #locator map is not modified
+        self.assertEqual(LOCATORS["Menu Bar"]["type"], Control)
+
+    def test_update_locator_drops_cache(self):
+        control = self.window.controls["About Button"]
+        self.window.update_locator({})
+        self.assertIsNot(self.window.controls["About Button"], control)
+
+    def test_cached_control_found_again_after_reset(self):
+        control = self.window.controls["About Button in Menu"]
+        old_id = control.id
+        self.app.reset()
+        self.assertEqual(control.name, "about_btn")
+        self.assertNotEqual(control.id, old_id)
+
+    def test_plain_control_expired_after_reset(self):
+        control = Control(self.window, "about_btn")
+        control.id
+        self.app.reset()
+        self.assertRaises(ControlExpiredError, lambda: control.name)
+
+if __name__ == '__main__':
+    unittest.main()